@@ -5,14 +5,15 @@
 注意：用户注册和登录现在完全由前端通过Supabase Auth处理
 """
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from fastapi.security import HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 from loguru import logger
 from datetime import datetime
 
 from middleware.supabase_auth import (
+    security,
     get_current_user,
     get_admin_user,
     get_super_admin_user,
@@ -21,9 +22,11 @@ from middleware.supabase_auth import (
 )
 from models.database_models import UserResponse
 from config.supabase_config import supabase_manager
+from api.responses import FastJSONResponse
+from middleware.claims_cache import claims_cache
+from services.audit_service import audit_logger
 
-router = APIRouter()
-security = HTTPBearer()
+router = APIRouter(default_response_class=FastJSONResponse)
 
 # 请求模型
 class UpdateProfileRequest(BaseModel):
@@ -80,6 +83,7 @@ async def get_current_user_info(current_user: Dict[str, Any] = Depends(get_curre
 @router.put("/profile", response_model=AuthResponse, summary="更新用户资料")
 async def update_profile(
     profile_data: UpdateProfileRequest,
+    request: Request,
     current_user: Dict[str, Any] = Depends(get_current_user)
 ):
     """
@@ -87,9 +91,13 @@ async def update_profile(
     """
     try:
         # 更新用户资料
-        updated_profile = await update_user_profile(
-            current_user["id"],
-            profile_data.dict(exclude_unset=True)
+        changes = profile_data.dict(exclude_unset=True)
+        updated_profile = await update_user_profile(current_user["id"], changes)
+        audit_logger.log_action(
+            "update_profile",
+            user_id=current_user["id"],
+            details={"fields": sorted(changes.keys())},
+            request=request
         )
         
         return AuthResponse(
@@ -105,6 +113,21 @@ async def update_profile(
             detail="更新用户资料失败"
         )
 
+@router.post("/logout", response_model=AuthResponse, summary="注销当前令牌")
+async def logout(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    注销当前令牌
+    
+    令牌在过期前对所有API实例失效（前端仍需调用Supabase Auth的signOut）
+    """
+    await claims_cache.revoke_token(credentials.credentials)
+    audit_logger.log_action("logout", user_id=current_user["id"], request=request)
+    return AuthResponse(success=True, message="已注销")
+
 @router.get("/status", response_model=AuthResponse, summary="检查认证状态")
 async def check_auth_status(current_user: Dict[str, Any] = Depends(get_current_user)):
     """
@@ -148,4 +171,25 @@ async def check_super_admin_status(super_admin: Dict[str, Any] = Depends(get_sup
             "user_id": super_admin["id"],
             "role": super_admin.get("role", "super_admin")
         }
-    )
\ No newline at end of file
+    )
+
+@router.post("/admin/users/{user_id}/revoke-sessions", response_model=AuthResponse, summary="吊销用户会话缓存")
+async def revoke_user_sessions(
+    user_id: str,
+    request: Request,
+    admin_user: Dict[str, Any] = Depends(get_admin_user)
+):
+    """
+    吊销用户已缓存的会话（角色或权限变更后调用）
+    
+    该用户的后续请求会重新向Supabase校验令牌
+    """
+    await claims_cache.revoke_user(user_id)
+    audit_logger.log_admin_operation(
+        "revoke_user_sessions",
+        admin_id=admin_user["id"],
+        target_type="user",
+        target_id=user_id,
+        request=request
+    )
+    return AuthResponse(success=True, message="用户会话缓存已吊销")
@@ -1,43 +1,73 @@
 # 智能分析API - 猫头鹰工厂核心分析服务
 # 提供单视频分析和完整账号分析功能
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from pydantic import BaseModel, HttpUrl
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Request
+from pydantic import BaseModel, Field, HttpUrl
+from typing import List, Literal, Optional, Dict, Any, Set
+from collections import OrderedDict
 import asyncio
 import uuid
-from datetime import datetime
+import os
+from datetime import datetime, timezone
 import json
+from loguru import logger
 
 # 导入依赖服务
-from ..middleware.supabase_auth import get_current_user
-from ..services.gpu_monitor_service import GPUMonitorService
-from ..config.supabase_config import get_supabase_client
+from middleware.supabase_auth import get_current_user
+from middleware.request_profiler import profile_span
+from services.gpu_monitor_service import GPUMonitorService
+from services.task_scheduler import task_scheduler, resolve_job_class, SchedulerDrainingError
+from services.time_estimator import time_estimator, normalize_variant, task_variant
+from services.metrics_service import metrics, observe_supabase, ANALYSIS_PROCESSING_TIME
+from services.audit_service import audit_logger
+from services.state_backend import task_store, load_task
+from services.retention_service import retention_service
+from services.prefetch_service import video_prefetcher
+from services.platform_fetcher import platform_fetcher
+from services.search_index import search_index
+from services.transcript_segments import SegmentCache, load_segments, pack_transcript
+from config.supabase_config import get_supabase_client, Tables
+from api.responses import FastJSONResponse, PreEncodedJSONResponse, encode_json
 
-router = APIRouter(prefix="/api/analysis", tags=["智能分析"])
+router = APIRouter(
+    prefix="/api/analysis",
+    tags=["智能分析"],
+    default_response_class=FastJSONResponse
+)
 
 # 数据模型定义
 class VideoAnalysisRequest(BaseModel):
     """单视频分析请求模型"""
     video_url: HttpUrl
     platform: str  # 平台类型：douyin, xiaohongshu, bilibili, tiktok
-    analysis_type: str = "standard"  # 分析类型：standard, deep, quick
+    analysis_type: Literal["standard", "deep", "quick"] = "standard"  # 分析类型
     options: Optional[Dict[str, Any]] = None
 
 class AccountAnalysisRequest(BaseModel):
     """完整账号分析请求模型"""
     account_url: HttpUrl
     platform: str
-    analysis_depth: str = "complete"  # 分析深度：complete, recent, sample
+    analysis_depth: Literal["complete", "recent", "sample"] = "complete"  # 分析深度
     video_limit: Optional[int] = None  # 视频数量限制
     options: Optional[Dict[str, Any]] = None
 
+class BulkDeleteRequest(BaseModel):
+    """批量删除任务请求模型（各条件同时满足）"""
+    status: Optional[str] = None
+    type: Optional[str] = None  # single_video, complete_account
+    user_id: Optional[str] = None
+    created_before: Optional[datetime] = None
+    limit: Optional[int] = Field(None, ge=1)
+    archive: bool = False  # 删除前是否归档到冷存储
+
 class AnalysisResponse(BaseModel):
     """分析响应模型"""
     task_id: str
     status: str  # pending, processing, completed, failed
     message: str
     estimated_time: Optional[int] = None  # 预估完成时间（秒）
+    queue_wait: Optional[int] = None  # 其中预估排队时间（秒）
+    confidence: Optional[float] = None  # 预估置信度（0~1）
 
 class AnalysisResult(BaseModel):
     """分析结果模型"""
@@ -48,9 +78,29 @@ class AnalysisResult(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime] = None
     processing_time: Optional[float] = None
+    progress: Optional[Dict[str, int]] = None  # 账号分析进度：completed/total
+
+# 任务记录统一存放在共享状态后端（services.state_backend.task_store），任意worker都可读写
+
+# 终态任务的响应编码缓存（completed/failed之后内容不再变化）
+# 缓存键带任务version，任务在任一worker上被修改后旧缓存不会再命中
+TERMINAL_STATUSES = ('completed', 'failed')
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1024'))
+_encoded_responses: "OrderedDict[tuple, bytes]" = OrderedDict()
 
-# 全局任务存储（生产环境应使用Redis或数据库）
-analysis_tasks = {}
+def _get_encoded_response(key: tuple) -> Optional[bytes]:
+    """读取缓存的响应字节串"""
+    body = _encoded_responses.get(key)
+    if body is not None:
+        _encoded_responses.move_to_end(key)
+    return body
+
+def _cache_encoded_response(key: tuple, body: bytes):
+    """缓存响应字节串（LRU淘汰）"""
+    _encoded_responses[key] = body
+    _encoded_responses.move_to_end(key)
+    while len(_encoded_responses) > RESULT_CACHE_SIZE:
+        _encoded_responses.popitem(last=False)
 
 # 平台检测器
 def detect_platform(url: str) -> str:
@@ -86,13 +136,86 @@ def detect_url_type(url: str) -> str:
     
     return 'unknown'
 
+# 服务关闭过程中拒绝新任务时建议客户端的重试间隔（秒）
+DRAINING_RETRY_AFTER = int(os.getenv('ANALYSIS_DRAINING_RETRY_AFTER', '30'))
+
+def _draining_error() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="服务正在重启，请稍后重试",
+        headers={'Retry-After': str(DRAINING_RETRY_AFTER)}
+    )
+
+def _ensure_accepting():
+    """服务关闭过程中拒绝新任务"""
+    if not task_scheduler.accepting:
+        raise _draining_error()
+
+async def _prefetch_video(task_id: str, task_data: dict) -> Optional[float]:
+    """
+    GPU阶段之前下载视频并抽取音频/关键帧，失败时直接将任务标记为失败
+
+    返回按实际视频时长修正后的预估处理耗时（时长未知时返回None）
+    """
+    await task_store.update(task_id, {'stage': 'prefetching'})
+    try:
+        artifact = await video_prefetcher.prefetch(task_data['video_url'], task_data['platform'])
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await task_store.update(task_id, {
+            'status': 'failed',
+            'error': f"视频预取失败: {e}",
+            'completed_at': datetime.utcnow()
+        })
+        raise
+    task_data['artifact'] = artifact
+    await task_store.update(task_id, {'stage': 'queued', 'artifact': artifact})
+    # 预取得到视频时长后按时长分桶重新预估，修正调度器中的预估耗时
+    if artifact.get('duration'):
+        processing_time, _ = time_estimator.estimate_processing(
+            'single_video',
+            task_data['analysis_type'],
+            platform=task_data['platform'],
+            duration=artifact['duration']
+        )
+        return processing_time
+
+async def _index_task(task: Optional[dict]):
+    """把已完成任务写入搜索索引（索引失败不影响任务结果）"""
+    if task is None:
+        return
+    try:
+        await asyncio.to_thread(search_index.add_task, task)
+    except Exception as e:
+        logger.error(f"任务 {task['task_id']} 写入搜索索引失败: {e}")
+
+def _submit_task(task_id: str, task_data: dict, estimated_time: float, gpu_ids: List[str]):
+    """按任务类型将任务提交到调度器"""
+    prepare = None
+    if task_data['type'] == 'complete_account':
+        processor = process_account_analysis
+    else:
+        processor = process_single_video_analysis
+        # 视频就绪后才进入GPU调度队列
+        if video_prefetcher.enabled:
+            prepare = lambda: _prefetch_video(task_id, task_data)
+    task_scheduler.submit(
+        task_id,
+        task_data['job_class'],
+        lambda: processor(task_id, task_data),
+        estimated_time=estimated_time,
+        gpu_ids=gpu_ids,
+        prepare=prepare
+    )
+
 @router.post("/single-video", response_model=AnalysisResponse)
 async def analyze_single_video(
     request: VideoAnalysisRequest,
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """单视频分析接口"""
+    _ensure_accepting()
     try:
         # 生成任务ID
         task_id = str(uuid.uuid4())
@@ -109,10 +232,21 @@ async def analyze_single_video(
         
         # 检查GPU资源
         gpu_service = GPUMonitorService()
-        available_gpu = await gpu_service.get_available_gpu()
-        if not available_gpu:
+        with profile_span('gpu'):
+            available_gpus = await gpu_service.get_available_gpus(min_count=1)
+        if not available_gpus:
             raise HTTPException(status_code=503, detail="GPU资源暂时不可用，请稍后重试")
         
+        # 基于历史耗时预估，并选择已分配负载最低的GPU
+        job_class = resolve_job_class('single_video', request.analysis_type)
+        estimate = time_estimator.estimate(
+            'single_video',
+            request.analysis_type,
+            job_class,
+            platform=detected_platform
+        )
+        gpu_ids = await task_scheduler.select_gpus(available_gpus, 1)
+        
         # 创建任务记录
         task_data = {
             'task_id': task_id,
@@ -124,43 +258,40 @@ async def analyze_single_video(
             'analysis_type': request.analysis_type,
             'options': request.options or {},
             'created_at': datetime.utcnow(),
-            'gpu_id': available_gpu['id']
+            'gpu_id': gpu_ids[0],
+            'job_class': job_class
         }
         
-        analysis_tasks[task_id] = task_data
-        
-        # 启动后台分析任务
-        background_tasks.add_task(
-            process_single_video_analysis,
-            task_id,
-            task_data
-        )
+        await task_store.create(task_data)
         
-        # 预估处理时间（基于分析类型）
-        time_estimates = {
-            'quick': 30,
-            'standard': 120,
-            'deep': 300
-        }
-        estimated_time = time_estimates.get(request.analysis_type, 120)
+        # 提交到调度器，按任务类别排队执行
+        _submit_task(task_id, task_data, estimate['processing_time'], gpu_ids)
         
         return AnalysisResponse(
             task_id=task_id,
             status="pending",
             message="视频分析任务已创建，正在处理中...",
-            estimated_time=estimated_time
+            estimated_time=estimate['estimated_time'],
+            queue_wait=estimate['queue_wait'],
+            confidence=estimate['confidence']
         )
         
+    except HTTPException:
+        raise
+    except SchedulerDrainingError:
+        # 通过入口检查后、提交前调度器开始关闭，已创建的任务记录不会被执行
+        await task_store.delete(task_id)
+        raise _draining_error()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建分析任务失败: {str(e)}")
 
 @router.post("/complete-account", response_model=AnalysisResponse)
 async def analyze_complete_account(
     request: AccountAnalysisRequest,
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """完整账号分析接口"""
+    _ensure_accepting()
     try:
         # 生成任务ID
         task_id = str(uuid.uuid4())
@@ -177,10 +308,22 @@ async def analyze_complete_account(
         
         # 检查GPU资源（账号分析需要更多资源）
         gpu_service = GPUMonitorService()
-        available_gpus = await gpu_service.get_available_gpus(min_count=2)
+        with profile_span('gpu'):
+            available_gpus = await gpu_service.get_available_gpus(min_count=2)
         if len(available_gpus) < 2:
             raise HTTPException(status_code=503, detail="账号分析需要更多GPU资源，请稍后重试")
         
+        # 基于历史耗时预估，长任务优先放到已分配负载较低的GPU上
+        job_class = resolve_job_class('complete_account')
+        estimate = time_estimator.estimate(
+            'complete_account',
+            request.analysis_depth,
+            job_class,
+            platform=detected_platform,
+            video_limit=request.video_limit
+        )
+        gpu_ids = await task_scheduler.select_gpus(available_gpus, 2)
+        
         # 创建任务记录
         task_data = {
             'task_id': task_id,
@@ -193,35 +336,30 @@ async def analyze_complete_account(
             'video_limit': request.video_limit,
             'options': request.options or {},
             'created_at': datetime.utcnow(),
-            'gpu_ids': [gpu['id'] for gpu in available_gpus]
+            'gpu_ids': gpu_ids,
+            'job_class': job_class
         }
         
-        analysis_tasks[task_id] = task_data
+        await task_store.create(task_data)
         
-        # 启动后台分析任务
-        background_tasks.add_task(
-            process_account_analysis,
-            task_id,
-            task_data
-        )
-        
-        # 预估处理时间（基于分析深度和视频数量）
-        base_time = {
-            'recent': 300,
-            'sample': 600,
-            'complete': 1800
-        }
-        estimated_time = base_time.get(request.analysis_depth, 600)
-        if request.video_limit:
-            estimated_time = min(estimated_time, request.video_limit * 30)
+        # 提交到调度器，账号分析与quick任务分队列执行
+        _submit_task(task_id, task_data, estimate['processing_time'], gpu_ids)
         
         return AnalysisResponse(
             task_id=task_id,
             status="pending",
             message="账号分析任务已创建，正在处理中...",
-            estimated_time=estimated_time
+            estimated_time=estimate['estimated_time'],
+            queue_wait=estimate['queue_wait'],
+            confidence=estimate['confidence']
         )
         
+    except HTTPException:
+        raise
+    except SchedulerDrainingError:
+        # 通过入口检查后、提交前调度器开始关闭，已创建的任务记录不会被执行
+        await task_store.delete(task_id)
+        raise _draining_error()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建分析任务失败: {str(e)}")
 
@@ -231,24 +369,32 @@ async def get_analysis_status(
     current_user: dict = Depends(get_current_user)
 ):
     """获取分析任务状态"""
-    if task_id not in analysis_tasks:
+    task_data = await task_store.get(task_id)
+    if task_data is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task_data = analysis_tasks[task_id]
-    
     # 验证用户权限
     if task_data['user_id'] != current_user['id'] and current_user.get('role') != 'admin':
         raise HTTPException(status_code=403, detail="无权访问此任务")
     
-    return AnalysisResult(
-        task_id=task_id,
-        status=task_data['status'],
-        result=task_data.get('result'),
-        error=task_data.get('error'),
-        created_at=task_data['created_at'],
-        completed_at=task_data.get('completed_at'),
-        processing_time=task_data.get('processing_time')
-    )
+    cache_key = ('status', task_id, task_data.get('version', 0))
+    body = _get_encoded_response(cache_key)
+    if body is not None:
+        return PreEncodedJSONResponse(body)
+    
+    body = encode_json({
+        'task_id': task_id,
+        'status': task_data['status'],
+        'result': task_data.get('result'),
+        'error': task_data.get('error'),
+        'created_at': task_data['created_at'],
+        'completed_at': task_data.get('completed_at'),
+        'processing_time': task_data.get('processing_time'),
+        'progress': task_data.get('progress')
+    })
+    if task_data['status'] in TERMINAL_STATUSES:
+        _cache_encoded_response(cache_key, body)
+    return PreEncodedJSONResponse(body)
 
 @router.get("/result/{task_id}")
 async def get_analysis_result(
@@ -256,10 +402,41 @@ async def get_analysis_result(
     current_user: dict = Depends(get_current_user)
 ):
     """获取分析结果详情"""
-    if task_id not in analysis_tasks:
+    task_data = await task_store.get(task_id)
+    if task_data is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task_data = analysis_tasks[task_id]
+    # 验证用户权限
+    if task_data['user_id'] != current_user['id'] and current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="无权访问此任务")
+    
+    if task_data['status'] != 'completed':
+        raise HTTPException(status_code=400, detail="任务尚未完成")
+    
+    # 已完成任务的结果不可变，直接复用编码后的字节串
+    cache_key = ('result', task_id, task_data.get('version', 0))
+    body = _get_encoded_response(cache_key)
+    if body is None:
+        body = encode_json(task_data.get('result', {}))
+        _cache_encoded_response(cache_key, body)
+    return PreEncodedJSONResponse(body)
+
+_segment_cache = SegmentCache(int(os.getenv('TRANSCRIPT_SEGMENT_CACHE_SIZE', '256')))
+
+@router.get("/transcript/{task_id}/segments")
+async def get_transcript_segments(
+    task_id: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """获取与时间窗口 [start, end) 重叠的转录分段（单位：秒，end为空表示到结尾）"""
+    if end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="结束时间必须大于开始时间")
+    
+    task_data = await task_store.get(task_id)
+    if task_data is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
     
     # 验证用户权限
     if task_data['user_id'] != current_user['id'] and current_user.get('role') != 'admin':
@@ -268,7 +445,96 @@ async def get_analysis_result(
     if task_data['status'] != 'completed':
         raise HTTPException(status_code=400, detail="任务尚未完成")
     
-    return task_data.get('result', {})
+    transcript = (task_data.get('result') or {}).get('transcript')
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="该任务没有转录结果")
+    
+    # 已完成任务的结果不可变，按版本缓存还原后的分段数组
+    cache_key = (task_id, task_data.get('version', 0))
+    segments = _segment_cache.get(cache_key)
+    if segments is None:
+        segments = load_segments(transcript)
+        _segment_cache.put(cache_key, segments)
+    
+    return FastJSONResponse({
+        'task_id': task_id,
+        'start': start,
+        'end': end,
+        'total_segments': len(segments),
+        'segments': segments.overlapping(start, float('inf') if end is None else end)
+    })
+
+@router.post("/resume/{task_id}", response_model=AnalysisResponse)
+async def resume_account_analysis(
+    task_id: str,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """从检查点恢复失败的账号分析任务，已完成的视频不再重复分析"""
+    task_data = await task_store.get(task_id)
+    if task_data is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    # 验证用户权限
+    if task_data['user_id'] != current_user['id'] and current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="无权访问此任务")
+    
+    if task_data['type'] != 'complete_account':
+        raise HTTPException(status_code=400, detail="仅支持恢复账号分析任务")
+    
+    if task_data['status'] != 'failed':
+        raise HTTPException(status_code=400, detail="仅失败的任务可以恢复")
+    
+    _ensure_accepting()
+    
+    # 重新分配GPU资源
+    gpu_service = GPUMonitorService()
+    with profile_span('gpu'):
+        available_gpus = await gpu_service.get_available_gpus(min_count=2)
+    if len(available_gpus) < 2:
+        raise HTTPException(status_code=503, detail="账号分析需要更多GPU资源，请稍后重试")
+    
+    # 按剩余视频比例预估耗时
+    progress = task_data.get('progress') or {}
+    total = progress.get('total') or 0
+    remaining_ratio = 1 - progress.get('completed', 0) / total if total else 1
+    estimate = time_estimator.estimate(
+        'complete_account',
+        task_data['analysis_depth'],
+        task_data['job_class'],
+        platform=task_data['platform'],
+        video_limit=task_data.get('video_limit')
+    )
+    processing_time = max(1, int(estimate['processing_time'] * remaining_ratio))
+    gpu_ids = await task_scheduler.select_gpus(available_gpus, 2)
+    
+    # 仅当任务仍为失败状态时才切换为排队，并发的重复恢复请求只有一个能成功
+    task_data = await task_store.update(task_id, {
+        'status': 'pending',
+        'error': None,
+        'completed_at': None,
+        'gpu_ids': gpu_ids,
+        'resume_count': task_data.get('resume_count', 0) + 1
+    }, expected_status='failed')
+    if task_data is None:
+        raise HTTPException(status_code=409, detail="任务已被恢复或删除")
+    
+    _submit_task(task_id, task_data, processing_time, gpu_ids)
+    audit_logger.log_action(
+        'resume_analysis_task',
+        user_id=current_user['id'],
+        details={'task_id': task_id, 'completed_videos': progress.get('completed', 0), 'total_videos': total},
+        request=request
+    )
+    
+    return AnalysisResponse(
+        task_id=task_id,
+        status="pending",
+        message=f"账号分析任务已从检查点恢复，已完成 {progress.get('completed', 0)}/{total} 个视频",
+        estimated_time=processing_time + estimate['queue_wait'],
+        queue_wait=estimate['queue_wait'],
+        confidence=estimate['confidence']
+    )
 
 @router.get("/history")
 async def get_analysis_history(
@@ -277,36 +543,144 @@ async def get_analysis_history(
     current_user: dict = Depends(get_current_user)
 ):
     """获取用户分析历史"""
-    user_tasks = [
-        task for task in analysis_tasks.values()
-        if task['user_id'] == current_user['id']
-    ]
-    
-    # 按创建时间倒序排列
-    user_tasks.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    # 分页
+    # 按用户索引分页读取（按创建时间倒序）
     start = (page - 1) * limit
-    end = start + limit
-    paginated_tasks = user_tasks[start:end]
+    paginated_tasks, total = await task_store.list_user(current_user['id'], start, limit)
     
-    return {
+    return FastJSONResponse({
         'tasks': paginated_tasks,
-        'total': len(user_tasks),
+        'total': total,
+        'page': page,
+        'limit': limit,
+        'has_more': start + limit < total
+    })
+
+def _parse_search_date(value: Optional[str]) -> Optional[datetime]:
+    """解析检索日期（ISO格式，带时区的统一换算为UTC）"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的日期: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+async def _search_tasks(
+    user_id: Optional[str],
+    q: Optional[str],
+    keyword: Optional[str],
+    topic: Optional[str],
+    platform: Optional[str],
+    date_from: Optional[str],
+    date_to: Optional[str],
+    page: int,
+    limit: int
+) -> FastJSONResponse:
+    start = (page - 1) * limit
+    results, total = await asyncio.to_thread(
+        search_index.search,
+        query=q,
+        user_id=user_id,
+        keyword=keyword,
+        topic=topic,
+        platform=platform,
+        date_from=_parse_search_date(date_from),
+        date_to=_parse_search_date(date_to),
+        offset=start,
+        limit=limit
+    )
+    return FastJSONResponse({
+        'results': results,
+        'total': total,
         'page': page,
         'limit': limit,
-        'has_more': end < len(user_tasks)
+        'has_more': start + limit < total
+    })
+
+@router.get("/search")
+async def search_analysis(
+    q: Optional[str] = None,
+    keyword: Optional[str] = None,
+    topic: Optional[str] = None,
+    platform: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    page: int = 1,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    """检索用户自己的已完成分析（有查询词时按相关度排序，否则按创建时间倒序）"""
+    return await _search_tasks(current_user['id'], q, keyword, topic, platform, date_from, date_to, page, limit)
+
+# 账号视频枚举与单视频处理
+# 配置了平台数据接口（PLATFORM_API_URLS）时经由平台请求调度器抓取，否则使用模拟数据
+ACCOUNT_DEPTH_VIDEO_COUNT = {
+    'recent': 10,
+    'sample': 20,
+    'complete': 50
+}
+ACCOUNT_PAGE_SIZE = 20
+# 单个账号任务同时处理的视频数（占用同一组GPU）
+ACCOUNT_VIDEO_CONCURRENCY = int(os.getenv('ACCOUNT_VIDEO_CONCURRENCY', '4'))
+# 检查点字段：待分析的视频列表，以及每个已完成视频一条摘要
+CHECKPOINT_VIDEOS = 'videos'
+CHECKPOINT_VIDEO_PREFIX = 'video:'
+
+async def _enumerate_account_videos(task_data: dict) -> List[Dict[str, Any]]:
+    """枚举账号下待分析的视频"""
+    video_count = ACCOUNT_DEPTH_VIDEO_COUNT.get(task_data['analysis_depth'], 20)
+    if task_data.get('video_limit'):
+        video_count = min(video_count, task_data['video_limit'])
+    
+    base = platform_fetcher.api_base(task_data['platform'])
+    if base is None:
+        return [
+            {'video_id': f"{task_data['platform']}_{index + 1}", 'title': f'视频{index + 1}'}
+            for index in range(video_count)
+        ]
+    
+    # 按游标分页枚举，每页占用一次平台请求额度
+    videos: List[Dict[str, Any]] = []
+    cursor = None
+    while len(videos) < video_count:
+        page = await platform_fetcher.get_json(task_data['platform'], f'{base}/accounts/videos', params={
+            'account_url': task_data['account_url'],
+            'cursor': cursor,
+            'count': min(ACCOUNT_PAGE_SIZE, video_count - len(videos))
+        })
+        videos.extend(page.get('videos') or [])
+        cursor = page.get('next_cursor')
+        if not cursor or not page.get('videos'):
+            break
+    return videos[:video_count]
+
+async def _analyze_account_video(task_data: dict, video_id: str) -> Dict[str, Any]:
+    """分析账号下的单个视频"""
+    base = platform_fetcher.api_base(task_data['platform'])
+    if base is not None:
+        detail = await platform_fetcher.get_json(task_data['platform'], f'{base}/videos/{video_id}')
+    else:
+        detail = {'title': f"视频{video_id.rsplit('_', 1)[-1]}", 'duration': 120, 'views': 5000}
+    await asyncio.sleep(0.2)  # 模拟处理时间
+    return {
+        'video_id': video_id,
+        'title': detail.get('title'),
+        'duration': detail.get('duration'),
+        'views': detail.get('views'),
+        'sentiment': 'positive'
     }
 
 # 后台处理函数
 async def process_single_video_analysis(task_id: str, task_data: dict):
     """处理单视频分析任务"""
+    started_at = datetime.utcnow()
     try:
         # 更新任务状态
-        analysis_tasks[task_id]['status'] = 'processing'
-        analysis_tasks[task_id]['started_at'] = datetime.utcnow()
+        await task_store.update(task_id, {'status': 'processing', 'stage': 'analyzing', 'started_at': started_at})
         
-        # 模拟分析过程（实际实现中会调用AI服务）
+        # 模拟分析过程（实际实现中会调用AI服务，输入为预取的音频与关键帧）
         await asyncio.sleep(5)  # 模拟处理时间
         
         # 模拟分析结果
@@ -317,13 +691,14 @@ async def process_single_video_analysis(task_id: str, task_data: dict):
                 'platform': task_data['platform'],
                 'url': task_data['video_url']
             },
-            'transcript': {
+            # 分段按列存储，时间窗口查询见 /transcript/{task_id}/segments
+            'transcript': pack_transcript({
                 'text': '这是视频的转录文本...',
                 'segments': [
                     {'start': 0, 'end': 10, 'text': '开头部分'},
                     {'start': 10, 'end': 20, 'text': '中间部分'}
                 ]
-            },
+            }),
             'analysis': {
                 'sentiment': 'positive',
                 'topics': ['科技', '教育'],
@@ -339,16 +714,37 @@ async def process_single_video_analysis(task_id: str, task_data: dict):
         
         # 更新任务完成状态
         completed_at = datetime.utcnow()
-        analysis_tasks[task_id].update({
+        processing_time = (completed_at - started_at).total_seconds()
+        completed_task = await task_store.update(task_id, {
             'status': 'completed',
             'result': result,
             'completed_at': completed_at,
-            'processing_time': (completed_at - analysis_tasks[task_id]['started_at']).total_seconds()
+            'processing_time': processing_time
         })
+        await _index_task(completed_task)
+        
+        # 记录实际耗时用于后续预估
+        ANALYSIS_PROCESSING_TIME.observe(
+            processing_time,
+            task_type='single_video',
+            analysis_type=normalize_variant('single_video', task_data['analysis_type'])
+        )
+        time_estimator.record(
+            'single_video',
+            task_data['analysis_type'],
+            processing_time,
+            platform=task_data['platform'],
+            # 只有提交后能预先得知时长（经过预取）的任务计入时长分桶，与预估时的查找条件一致
+            duration=(task_data.get('artifact') or {}).get('duration')
+        )
         
+    except asyncio.CancelledError:
+        # 服务关闭时被中断，保留检查点等待重新入队
+        await task_store.update(task_id, {'status': 'interrupted'})
+        raise
     except Exception as e:
         # 处理错误
-        analysis_tasks[task_id].update({
+        await task_store.update(task_id, {
             'status': 'failed',
             'error': str(e),
             'completed_at': datetime.utcnow()
@@ -356,13 +752,48 @@ async def process_single_video_analysis(task_id: str, task_data: dict):
 
 async def process_account_analysis(task_id: str, task_data: dict):
     """处理完整账号分析任务"""
+    started_at = datetime.utcnow()
     try:
         # 更新任务状态
-        analysis_tasks[task_id]['status'] = 'processing'
-        analysis_tasks[task_id]['started_at'] = datetime.utcnow()
+        task = await task_store.update(task_id, {'status': 'processing', 'started_at': started_at})
         
-        # 模拟账号分析过程
-        await asyncio.sleep(10)  # 模拟处理时间
+        # 读取检查点，已完成的视频直接跳过
+        checkpoint = await task_store.load_checkpoint(task_id)
+        videos = checkpoint.get(CHECKPOINT_VIDEOS)
+        if not videos:
+            videos = [video['video_id'] for video in await _enumerate_account_videos(task_data)]
+            await task_store.save_checkpoint(task_id, {CHECKPOINT_VIDEOS: videos})
+        completed = {
+            field[len(CHECKPOINT_VIDEO_PREFIX):]: summary
+            for field, summary in checkpoint.items()
+            if field.startswith(CHECKPOINT_VIDEO_PREFIX)
+        }
+        total = len(videos)
+        processed_this_run = 0
+        
+        # 未完成的视频并发处理，平台请求的并发与速率另由平台请求调度器跨任务统一限制
+        video_slots = asyncio.Semaphore(max(1, ACCOUNT_VIDEO_CONCURRENCY))
+        
+        async def analyze(video_id: str) -> Dict[str, Any]:
+            async with video_slots:
+                return await _analyze_account_video(task_data, video_id)
+        
+        pending = [
+            asyncio.ensure_future(analyze(video_id))
+            for video_id in videos
+            if video_id not in completed
+        ]
+        try:
+            for next_video in asyncio.as_completed(pending):
+                video = await next_video
+                completed[video['video_id']] = video
+                processed_this_run += 1
+                # 每个视频完成后只追加该视频的摘要，不重写整个检查点
+                await task_store.save_checkpoint(task_id, {CHECKPOINT_VIDEO_PREFIX + video['video_id']: video})
+                await task_store.update(task_id, {'progress': {'completed': len(completed), 'total': total}})
+        finally:
+            for future in pending:
+                future.cancel()
         
         # 模拟分析结果
         result = {
@@ -371,7 +802,7 @@ async def process_account_analysis(task_id: str, task_data: dict):
                 'platform': task_data['platform'],
                 'url': task_data['account_url'],
                 'follower_count': 10000,
-                'video_count': 50
+                'video_count': total
             },
             'content_analysis': {
                 'main_topics': ['科技', '教育', '生活'],
@@ -379,14 +810,7 @@ async def process_account_analysis(task_id: str, task_data: dict):
                 'posting_frequency': 'daily',
                 'engagement_rate': 0.085
             },
-            'video_summaries': [
-                {
-                    'title': '视频1',
-                    'duration': 120,
-                    'views': 5000,
-                    'sentiment': 'positive'
-                }
-            ],
+            'video_summaries': [completed[video_id] for video_id in videos],
             'insights': {
                 'growth_trend': 'increasing',
                 'best_performing_content': '教育类视频',
@@ -407,21 +831,274 @@ async def process_account_analysis(task_id: str, task_data: dict):
         
         # 更新任务完成状态
         completed_at = datetime.utcnow()
-        analysis_tasks[task_id].update({
+        processing_time = (completed_at - started_at).total_seconds()
+        completed_task = await task_store.update(task_id, {
             'status': 'completed',
             'result': result,
             'completed_at': completed_at,
-            'processing_time': (completed_at - analysis_tasks[task_id]['started_at']).total_seconds()
+            'processing_time': processing_time,
+            'videos_processed': processed_this_run
         })
+        # 视频摘要已写入结果，检查点不再需要
+        await task_store.clear_checkpoint(task_id)
+        await _index_task(completed_task)
         
+        # 记录实际耗时用于后续预估
+        ANALYSIS_PROCESSING_TIME.observe(
+            processing_time,
+            task_type='complete_account',
+            analysis_type=normalize_variant('complete_account', task_data['analysis_depth'])
+        )
+        time_estimator.record(
+            'complete_account',
+            task_data['analysis_depth'],
+            processing_time,
+            platform=task_data['platform'],
+            video_count=processed_this_run,
+            partial=processed_this_run < total
+        )
+        
+    except asyncio.CancelledError:
+        # 服务关闭时被中断，保留检查点等待重新入队
+        await task_store.update(task_id, {'status': 'interrupted'})
+        raise
     except Exception as e:
         # 处理错误
-        analysis_tasks[task_id].update({
+        await task_store.update(task_id, {
             'status': 'failed',
             'error': str(e),
             'completed_at': datetime.utcnow()
         })
 
+# 服务关闭时的任务移交
+def _task_to_payload(task: dict) -> dict:
+    """将任务记录转换为可持久化的JSON结构"""
+    return json.loads(encode_json(task))
+
+async def _requeue_on_drain(queued_ids: List[str], interrupted_ids: List[str]):
+    """
+    关闭时把未完成的任务（含账号分析检查点）标记为重新入队，供其他实例接管
+
+    共享状态后端（Redis）中直接把任务状态改为requeued；进程内存储的任务随进程消失，
+    写入任务表由其他实例从任务表接管
+    """
+    await _stop_requeue_watcher()
+    if task_store.shared:
+        requeued = 0
+        for task_id in queued_ids + interrupted_ids:
+            if await task_store.update(task_id, {'status': 'requeued', 'requeued_at': datetime.utcnow()}):
+                requeued += 1
+        if requeued:
+            logger.info(f"已重新入队 {requeued} 个未完成的分析任务")
+        return
+    
+    rows = []
+    for task_id in queued_ids + interrupted_ids:
+        task = await task_store.update(task_id, {'status': 'pending', 'requeued_at': datetime.utcnow()})
+        if task is None:
+            continue
+        rows.append({
+            'task_id': task_id,
+            'user_id': task['user_id'],
+            'type': task['type'],
+            'status': 'requeued',
+            'payload': _task_to_payload(task)
+        })
+    if not rows:
+        return
+    
+    try:
+        client = get_supabase_client(use_service_role=True)
+        with observe_supabase('analysis_tasks.upsert'):
+            await asyncio.to_thread(
+                lambda: client.table(Tables.ANALYSIS_TASKS).upsert(rows, on_conflict='task_id').execute()
+            )
+        logger.info(f"已重新入队 {len(rows)} 个未完成的分析任务")
+    except Exception as e:
+        logger.error(f"分析任务重新入队失败: {e}")
+
+def _resubmit_task(task_data: dict):
+    """重新提交接管的任务"""
+    processing_time, _ = time_estimator.estimate_processing(
+        task_data['type'],
+        task_variant(task_data),
+        platform=task_data['platform'],
+        video_limit=task_data.get('video_limit')
+    )
+    gpu_ids = task_data.get('gpu_ids') or [task_data['gpu_id']]
+    _submit_task(task_data['task_id'], task_data, processing_time, gpu_ids)
+
+async def _claim_from_task_store() -> int:
+    """从共享状态后端接管requeued任务（比较并更新抢占，避免多个实例重复执行）"""
+    recovered = 0
+    async for batch in task_store.scan(status='requeued'):
+        for task in batch:
+            if not task_scheduler.accepting:
+                return recovered
+            claimed = await task_store.update(task['task_id'], {'status': 'pending'}, expected_status='requeued')
+            if claimed is None:
+                continue
+            try:
+                _resubmit_task(claimed)
+            except SchedulerDrainingError:
+                # 抢占后本实例开始关闭，放回等待其他实例接管
+                await task_store.update(task['task_id'], {'status': 'requeued'}, expected_status='pending')
+                return recovered
+            recovered += 1
+    return recovered
+
+async def _claim_from_task_table() -> int:
+    """从任务表接管其他实例关闭前写入的任务"""
+    client = get_supabase_client(use_service_role=True)
+    with observe_supabase('analysis_tasks.select'):
+        response = await asyncio.to_thread(
+            lambda: client.table(Tables.ANALYSIS_TASKS).select('task_id').eq('status', 'requeued').execute()
+        )
+    recovered = 0
+    for row in response.data or []:
+        if not task_scheduler.accepting:
+            break
+        # 条件更新抢占任务，避免多个实例重复执行
+        with observe_supabase('analysis_tasks.update'):
+            claim = await asyncio.to_thread(
+                lambda task_id=row['task_id']: client.table(Tables.ANALYSIS_TASKS)
+                .update({'status': 'claimed'})
+                .eq('task_id', task_id)
+                .eq('status', 'requeued')
+                .execute()
+            )
+        if not claim.data:
+            continue
+        
+        task_data = load_task(claim.data[0]['payload'])
+        task_id = task_data['task_id']
+        task_data['status'] = 'pending'
+        # 本地存储中可能仍保留着该任务，合并检查点；否则重新创建
+        stored = await task_store.update(task_id, task_data)
+        if stored is None:
+            stored = await task_store.create(task_data)
+        try:
+            _resubmit_task(stored)
+        except SchedulerDrainingError:
+            with observe_supabase('analysis_tasks.update'):
+                await asyncio.to_thread(
+                    lambda: client.table(Tables.ANALYSIS_TASKS)
+                    .update({'status': 'requeued'})
+                    .eq('task_id', task_id)
+                    .execute()
+                )
+            break
+        recovered += 1
+    return recovered
+
+async def _recover_requeued_tasks():
+    """接管其他实例关闭前重新入队的任务"""
+    if task_store.shared:
+        recovered = await _claim_from_task_store()
+    else:
+        recovered = await _claim_from_task_table()
+    if recovered:
+        logger.info(f"已接管 {recovered} 个重新入队的分析任务")
+
+REQUEUE_POLL_INTERVAL = float(os.getenv('ANALYSIS_REQUEUE_POLL_INTERVAL', '30'))
+
+_requeue_watcher: Optional[asyncio.Task] = None
+
+async def _watch_requeued_tasks():
+    # 滚动部署时其他实例在本实例启动之后才关闭，定期检查而不只在启动时接管
+    while task_scheduler.accepting:
+        try:
+            await _recover_requeued_tasks()
+        except Exception as e:
+            logger.error(f"接管重新入队的分析任务失败: {e}")
+        await asyncio.sleep(REQUEUE_POLL_INTERVAL)
+
+async def _start_requeue_watcher():
+    global _requeue_watcher
+    if _requeue_watcher is None or _requeue_watcher.done():
+        _requeue_watcher = asyncio.create_task(_watch_requeued_tasks())
+
+async def _stop_requeue_watcher():
+    global _requeue_watcher
+    if _requeue_watcher is not None:
+        _requeue_watcher.cancel()
+        await asyncio.gather(_requeue_watcher, return_exceptions=True)
+        _requeue_watcher = None
+
+# 任务状态指标
+TASK_STATE_GAUGE = metrics.gauge('owl_analysis_tasks', '各状态分析任务数', ('type', 'status'))
+
+async def _collect_task_states():
+    counts = await task_store.count_by_state()
+    TASK_STATE_GAUGE.clear()
+    for (task_type, task_status), count in counts.items():
+        TASK_STATE_GAUGE.set(count, type=task_type, status=task_status)
+
+async def _backfill_search_index():
+    """首次启用搜索索引时补写已完成的历史任务（多worker中只有一个执行，完成后写入标记不再重复）"""
+    try:
+        await asyncio.to_thread(search_index.ensure_loaded)
+        if search_index.backfilled or not await task_store.acquire_lock('search_index_backfill', 3600):
+            return
+        indexed = 0
+        async for batch in task_store.scan(status='completed'):
+            await asyncio.to_thread(search_index.add_tasks, batch, True)
+            indexed += len(batch)
+        await asyncio.to_thread(search_index.mark_backfilled)
+        logger.info(f"搜索索引已补写 {indexed} 个历史任务")
+    except Exception as e:
+        logger.error(f"搜索索引补写历史任务失败: {e}")
+
+async def _seed_time_estimator():
+    """用状态后端中已完成任务的实际耗时重建预估统计（重启或新增worker后不必重新积累样本）"""
+    try:
+        seeded = await time_estimator.seed(task_store)
+        if seeded:
+            logger.info(f"耗时预估已载入 {seeded} 个历史任务")
+    except Exception as e:
+        logger.error(f"耗时预估载入历史任务失败: {e}")
+
+_background_tasks: Set[asyncio.Task] = set()
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _start_background_loaders():
+    # 补写索引和载入历史耗时可能较慢，放到后台执行，不阻塞调度器启动
+    _run_in_background(_backfill_search_index())
+    _run_in_background(_seed_time_estimator())
+
+def _remove_from_search_index(tasks: List[dict]):
+    return asyncio.to_thread(search_index.remove_tasks, [task['task_id'] for task in tasks])
+
+def _remove_prefetched_media(tasks: List[dict]):
+    video_ids = [task['artifact']['video_id'] for task in tasks if (task.get('artifact') or {}).get('video_id')]
+    if video_ids:
+        return asyncio.to_thread(video_prefetcher.remove_artifacts, video_ids)
+
+_hooks_registered = False
+
+def register_hooks():
+    """
+    注册分析任务的调度器钩子、指标收集器与保留策略监听器（由main.py在启动调度器前调用，重复调用无副作用）
+
+    - 关闭时把排队/中断的任务移交给其他实例，运行期间定期接管重新入队的任务
+    - 保留策略清理和批量删除的任务同步移出搜索索引并删除预取产物，启动时补写尚未索引的历史任务
+    - 启动时用已完成任务的实际耗时重建耗时预估统计
+    """
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    _hooks_registered = True
+    task_scheduler.add_drain_hook(_requeue_on_drain)
+    task_scheduler.add_startup_hook(_start_requeue_watcher)
+    task_scheduler.add_startup_hook(_start_background_loaders)
+    metrics.register_collector(_collect_task_states)
+    retention_service.add_listener(_remove_from_search_index)
+    retention_service.add_listener(_remove_prefetched_media)
+
 # 管理员接口
 @router.get("/admin/tasks")
 async def get_all_tasks(
@@ -434,39 +1111,96 @@ async def get_all_tasks(
     if current_user.get('role') != 'admin':
         raise HTTPException(status_code=403, detail="需要管理员权限")
     
-    tasks = list(analysis_tasks.values())
-    
-    # 状态过滤
-    if status:
-        tasks = [task for task in tasks if task['status'] == status]
-    
-    # 按创建时间倒序排列
-    tasks.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    # 分页
+    # 按状态索引分页读取（按创建时间倒序）
     start = (page - 1) * limit
-    end = start + limit
-    paginated_tasks = tasks[start:end]
+    paginated_tasks, total = await task_store.list_all(status, start, limit)
     
-    return {
+    return FastJSONResponse({
         'tasks': paginated_tasks,
-        'total': len(tasks),
+        'total': total,
         'page': page,
         'limit': limit,
-        'has_more': end < len(tasks)
-    }
+        'has_more': start + limit < total
+    })
+
+@router.get("/admin/search")
+async def admin_search_analysis(
+    q: Optional[str] = None,
+    keyword: Optional[str] = None,
+    topic: Optional[str] = None,
+    platform: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    user_id: Optional[str] = None,
+    page: int = 1,
+    limit: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
+    """管理员检索所有用户的已完成分析"""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return await _search_tasks(user_id, q, keyword, topic, platform, date_from, date_to, page, limit)
 
 @router.delete("/admin/tasks/{task_id}")
 async def delete_task(
     task_id: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """管理员删除分析任务"""
     if current_user.get('role') != 'admin':
         raise HTTPException(status_code=403, detail="需要管理员权限")
     
-    if task_id not in analysis_tasks:
+    task_data = await task_store.delete(task_id)
+    if task_data is None:
         raise HTTPException(status_code=404, detail="任务不存在")
+    await asyncio.to_thread(search_index.remove_tasks, [task_id])
     
-    del analysis_tasks[task_id]
+    audit_logger.log_admin_operation(
+        'delete_analysis_task',
+        admin_id=current_user['id'],
+        target_type='analysis_task',
+        target_id=task_id,
+        details={'owner_id': task_data['user_id'], 'type': task_data['type'], 'status': task_data['status']},
+        request=request
+    )
     return {'message': '任务已删除'}
+
+@router.post("/admin/tasks/bulk-delete")
+async def bulk_delete_tasks(
+    request_data: BulkDeleteRequest,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """管理员按条件批量删除已结束的分析任务"""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    
+    filters = request_data.model_dump(exclude={'limit', 'archive'}, exclude_none=True)
+    if not filters:
+        raise HTTPException(status_code=400, detail="至少需要一个过滤条件")
+    
+    created_before = request_data.created_before
+    if created_before is not None and created_before.tzinfo is not None:
+        created_before = created_before.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    try:
+        deleted = await retention_service.delete_matching(
+            status=request_data.status,
+            task_type=request_data.type,
+            user_id=request_data.user_id,
+            created_before=created_before,
+            limit=request_data.limit,
+            archive=request_data.archive
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    audit_logger.log_admin_operation(
+        'bulk_delete_analysis_tasks',
+        admin_id=current_user['id'],
+        target_type='analysis_task',
+        details={'filters': filters, 'limit': request_data.limit, 'archive': request_data.archive, 'deleted': deleted},
+        request=request
+    )
+    return {'message': f'已删除 {deleted} 个任务', 'deleted': deleted}
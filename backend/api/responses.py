@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 快速JSON响应
+优先使用orjson直接序列化datetime/UUID等类型，跳过jsonable_encoder的逐字段转换
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from middleware.request_profiler import profile_span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson为可选依赖
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """处理orjson/json无法原生序列化的类型"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (UUID, Decimal)):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+def encode_json(content: Any) -> bytes:
+    """将内容编码为JSON字节串"""
+    with profile_span("serialize"):
+        if orjson is not None:
+            return orjson.dumps(
+                content,
+                default=_default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
+        return json.dumps(
+            content,
+            default=_default,
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    快速JSON响应类
+
+    路由直接返回该响应时FastAPI不会再调用jsonable_encoder，
+    datetime等字段由orjson在C层完成转换
+    """
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+class PreEncodedJSONResponse(Response):
+    """已编码JSON响应（用于缓存的字节串）"""
+
+    media_type = "application/json"
+
+    def __init__(self, body: bytes, status_code: int = 200, headers: dict = None):
+        super().__init__(content=body, status_code=status_code, headers=headers)
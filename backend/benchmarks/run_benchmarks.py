@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 智能分析API基准测试
+在进程内运行分析API，使用本地Supabase/GPU替身，测量：
+- 任务提交吞吐
+- 状态轮询 p50/p99
+- 历史分页延迟随任务总量（1k~1M）的变化
+- 长视频转录的时间窗口查询延迟
+- 多个账号任务并发抓取同一平台时的吞吐与被限流次数
+- 每个任务的内存占用
+结果以JSON输出，可与基线结果比较以发现性能回退
+
+用法:
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --baseline bench.json --tolerance 0.2
+"""
+
+import asyncio
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import click
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.stand_ins import (
+    FakeGPUMonitorService, FakePlatformServer, FakeSupabaseServer, install_missing_modules, make_task, make_token
+)
+
+BENCH_USER_ID = "00000000-0000-0000-0000-00000000be01"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """计算分位数（最近秩法）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    # 先乘后除，避免 pct / 100 的浮点误差把整数秩进位（如 7 / 100 * 100 > 7）
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """汇总延迟样本（秒）为毫秒统计"""
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0
+    }
+
+
+async def run_concurrently(
+    total: int,
+    concurrency: int,
+    make_call: Callable[[int], Awaitable[Any]]
+) -> Dict[str, float]:
+    """以固定并发执行total次调用并统计延迟"""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await make_call(index)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f"请求失败 {response.status_code}: {response.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def build_app(supabase_url: str, anon_key: str):
+    """构建只挂载分析路由的应用，并替换GPU监控服务"""
+    os.environ["SUPABASE_URL"] = supabase_url
+    os.environ["SUPABASE_ANON_KEY"] = anon_key
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = anon_key
+
+    from fastapi import FastAPI
+    install_missing_modules()
+    from api import intelligent_analysis_api as analysis_api
+
+    analysis_api.GPUMonitorService = FakeGPUMonitorService
+    analysis_api.register_hooks()
+    app = FastAPI()
+    app.include_router(analysis_api.router)
+    return app, analysis_api
+
+
+async def populate_tasks(analysis_api, count: int, user_share: float) -> List[str]:
+    """写入count个合成任务，其中user_share比例属于基准测试用户，返回该用户的任务ID"""
+    task_store = analysis_api.task_store
+    await task_store.clear()
+    owned = []
+    stride = max(1, int(round(1 / user_share))) if user_share > 0 else count + 1
+    for index in range(count):
+        user_id = BENCH_USER_ID if index % stride == 0 else f"user-{index % 997}"
+        task = make_task(index, user_id)
+        await task_store.create(task)
+        if user_id == BENCH_USER_ID:
+            owned.append(task["task_id"])
+    return owned
+
+
+async def bench_submission(client, analysis_api, headers, total: int, concurrency: int) -> Dict[str, Any]:
+    """任务提交吞吐"""
+    from services.task_scheduler import task_scheduler
+
+    await analysis_api.task_store.clear()
+    analysis_types = ["quick", "standard", "deep"]
+
+    def submit(index: int):
+        return client.post("/api/analysis/single-video", headers=headers, json={
+            "video_url": f"https://www.douyin.com/video/{8_000_000_000 + index}",
+            "platform": "douyin",
+            "analysis_type": analysis_types[index % len(analysis_types)]
+        })
+
+    result = await run_concurrently(total, concurrency, submit)
+    # 丢弃已提交的模拟任务，恢复调度器供后续测试使用
+    await task_scheduler.drain(0)
+    await task_scheduler.start()
+    return result
+
+
+async def bench_status_poll(client, analysis_api, headers, task_count: int, polls: int, concurrency: int) -> Dict[str, Any]:
+    """状态轮询延迟"""
+    owned = await populate_tasks(analysis_api, task_count, user_share=1.0)
+    rng = random.Random(42)
+    return await run_concurrently(
+        polls,
+        concurrency,
+        lambda index: client.get(f"/api/analysis/status/{rng.choice(owned)}", headers=headers)
+    )
+
+
+async def bench_history(client, analysis_api, headers, sizes: List[int], requests_per_size: int,
+                        user_share: float) -> List[Dict[str, Any]]:
+    """历史分页延迟随任务总量的变化"""
+    results = []
+    for size in sizes:
+        owned = await populate_tasks(analysis_api, size, user_share)
+        last_page = max(1, len(owned) // 20)
+        first = await run_concurrently(
+            requests_per_size, 1,
+            lambda index: client.get("/api/analysis/history?page=1&limit=20", headers=headers)
+        )
+        deep = await run_concurrently(
+            requests_per_size, 1,
+            lambda index: client.get(f"/api/analysis/history?page={last_page}&limit=20", headers=headers)
+        )
+        results.append({
+            "total_tasks": size,
+            "user_tasks": len(owned),
+            "first_page_p50_ms": first["p50_ms"],
+            "first_page_p99_ms": first["p99_ms"],
+            "last_page_p50_ms": deep["p50_ms"],
+            "last_page_p99_ms": deep["p99_ms"]
+        })
+        click.echo(f"  history @ {size} tasks: p50 {first['p50_ms']}ms / p99 {first['p99_ms']}ms", err=True)
+    await analysis_api.task_store.clear()
+    return results
+
+
+async def bench_transcript_window(client, analysis_api, headers, segment_count: int, requests: int,
+                                  window: float) -> Dict[str, Any]:
+    """长视频转录按时间窗口读取分段的延迟"""
+    await analysis_api.task_store.clear()
+    task = make_task(0, BENCH_USER_ID)
+    segments = [
+        {"start": index * 3.0, "end": index * 3.0 + 3.5, "text": f"第{index}段转录文本"}
+        for index in range(segment_count)
+    ]
+    task["result"]["transcript"] = analysis_api.pack_transcript({"text": "", "segments": segments})
+    await analysis_api.task_store.create(task)
+    duration = segment_count * 3.0
+    rng = random.Random(42)
+
+    def fetch(index: int):
+        start = rng.uniform(0, max(0.0, duration - window))
+        return client.get(
+            f"/api/analysis/transcript/{task['task_id']}/segments?start={start}&end={start + window}",
+            headers=headers
+        )
+
+    result = await run_concurrently(requests, 1, fetch)
+    await analysis_api.task_store.clear()
+    return result
+
+
+async def bench_account_crawl(analysis_api, accounts: int, platform_rate: float) -> Dict[str, Any]:
+    """多个账号任务并发枚举并抓取视频详情（平台替身按platform_rate限流）"""
+    server = FakePlatformServer(rate=platform_rate).start()
+    fetcher = analysis_api.platform_fetcher
+    fetcher.api_urls = {"douyin": server.url("douyin")}
+    # 调度器的限速额度与平台一致时应几乎不被限流
+    fetcher.rates = {"douyin": platform_rate}
+    await analysis_api.task_store.clear()
+    try:
+        async def crawl(index: int) -> int:
+            task = {
+                "platform": "douyin",
+                "account_url": f"https://www.douyin.com/user/bench-{index}",
+                "analysis_depth": "complete"
+            }
+            videos = await analysis_api._enumerate_account_videos(task)
+            await asyncio.gather(*(
+                analysis_api._analyze_account_video(task, video["video_id"]) for video in videos
+            ))
+            return len(videos)
+
+        start = time.perf_counter()
+        fetched = sum(await asyncio.gather(*(crawl(index) for index in range(accounts))))
+        elapsed = time.perf_counter() - start
+        return {
+            "accounts": accounts,
+            "videos": fetched,
+            "crawl_rps": round(server.request_count / elapsed, 1),
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "platform_requests": server.request_count,
+            "throttled_requests": server.throttled_count
+        }
+    finally:
+        fetcher.api_urls = {}
+        fetcher.rates = {}
+        fetcher.close()
+        server.stop()
+
+
+async def bench_memory(analysis_api, task_count: int) -> Dict[str, Any]:
+    """每个已完成任务的内存占用（内存状态后端）"""
+    await analysis_api.task_store.clear()
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    await populate_tasks(analysis_api, task_count, user_share=1.0)
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await analysis_api.task_store.clear()
+    return {
+        "tasks": task_count,
+        "bytes_per_task": int((after - before) / task_count),
+        "peak_bytes": peak
+    }
+
+
+def flatten_metrics(results: Dict[str, Any]) -> Dict[str, float]:
+    """展开为 指标名 -> 数值，便于与基线比较"""
+    flat: Dict[str, float] = {}
+    for section, value in results.items():
+        if isinstance(value, dict):
+            for key, metric in value.items():
+                flat[f"{section}.{key}"] = metric
+        elif isinstance(value, list):
+            for entry in value:
+                for key, metric in entry.items():
+                    if key not in ("total_tasks", "user_tasks"):
+                        flat[f"{section}@{entry['total_tasks']}.{key}"] = metric
+    return flat
+
+
+def compare_with_baseline(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    与基线比较，返回回退项
+
+    *_rps 越大越好；*_ms / *_bytes 越小越好
+    """
+    regressions = []
+    current_flat = flatten_metrics(current["results"])
+    baseline_flat = flatten_metrics(baseline["results"])
+    for name, value in current_flat.items():
+        base = baseline_flat.get(name)
+        if not base:
+            continue
+        if name.endswith("_rps") and value < base * (1 - tolerance):
+            regressions.append(f"{name}: {base} -> {value}")
+        elif name.endswith(("_ms", "_bytes")) and value > base * (1 + tolerance):
+            regressions.append(f"{name}: {base} -> {value}")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+async def run_all(options: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+
+    server = FakeSupabaseServer(latency=options["supabase_latency"] / 1000).start()
+    try:
+        anon_key = make_token("anon", ttl=86400)
+        app, analysis_api = build_app(server.url, anon_key)
+        FakeGPUMonitorService.latency = options["gpu_latency"] / 1000
+        headers = {"Authorization": f"Bearer {make_token(BENCH_USER_ID)}"}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            results: Dict[str, Any] = {}
+            click.echo("▶ submission", err=True)
+            results["submission"] = await bench_submission(
+                client, analysis_api, headers, options["submissions"], options["concurrency"]
+            )
+            click.echo("▶ status poll", err=True)
+            results["status_poll"] = await bench_status_poll(
+                client, analysis_api, headers, options["status_tasks"], options["polls"], options["concurrency"]
+            )
+            click.echo("▶ history pagination", err=True)
+            results["history"] = await bench_history(
+                client, analysis_api, headers, options["history_sizes"],
+                options["history_requests"], options["user_share"]
+            )
+            click.echo("▶ transcript window", err=True)
+            results["transcript_window"] = await bench_transcript_window(
+                client, analysis_api, headers, options["segments"], options["window_requests"], options["window"]
+            )
+        click.echo("▶ account crawl", err=True)
+        results["account_crawl"] = await bench_account_crawl(
+            analysis_api, options["crawl_accounts"], options["platform_rate"]
+        )
+        click.echo("▶ memory", err=True)
+        results["memory"] = await bench_memory(analysis_api, options["memory_tasks"])
+
+        return {
+            "meta": {
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "supabase_requests": server.request_count,
+                "options": options
+            },
+            "results": results
+        }
+    finally:
+        server.stop()
+
+
+@click.command()
+@click.option("--submissions", default=500, show_default=True, help="提交任务数")
+@click.option("--concurrency", default=50, show_default=True, help="并发请求数")
+@click.option("--status-tasks", default=10_000, show_default=True, help="状态轮询时的任务总数")
+@click.option("--polls", default=2_000, show_default=True, help="状态轮询次数")
+@click.option("--history-sizes", default="1000,10000,100000,1000000", show_default=True, help="历史分页测试的任务总量")
+@click.option("--history-requests", default=50, show_default=True, help="每个规模的分页请求数")
+@click.option("--user-share", default=0.01, show_default=True, help="测试用户拥有的任务比例")
+@click.option("--segments", default=5_000, show_default=True, help="转录窗口测试的分段数")
+@click.option("--window-requests", default=500, show_default=True, help="转录窗口请求数")
+@click.option("--window", default=30.0, show_default=True, help="转录窗口长度（秒）")
+@click.option("--crawl-accounts", default=8, show_default=True, help="并发抓取的账号数")
+@click.option("--platform-rate", default=20.0, show_default=True, help="平台替身每秒允许的请求数")
+@click.option("--memory-tasks", default=10_000, show_default=True, help="内存测试任务数")
+@click.option("--supabase-latency", default=0.0, show_default=True, help="Supabase替身附加延迟（毫秒）")
+@click.option("--gpu-latency", default=0.0, show_default=True, help="GPU查询替身附加延迟（毫秒）")
+@click.option("--output", type=click.Path(dir_okay=False), help="结果输出文件（默认输出到stdout）")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="用于比较的基线结果")
+@click.option("--tolerance", default=0.2, show_default=True, help="允许的相对回退幅度")
+def main(output, baseline, tolerance, history_sizes, **options):
+    """运行分析API基准测试"""
+    options["history_sizes"] = [int(size) for size in history_sizes.split(",") if size]
+    report = asyncio.run(run_all(options))
+
+    data = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        Path(output).write_text(data, encoding="utf-8")
+        click.echo(f"✅ 结果已写入 {output}", err=True)
+    else:
+        click.echo(data)
+
+    if baseline:
+        regressions = compare_with_baseline(report, json.loads(Path(baseline).read_text(encoding="utf-8")), tolerance)
+        if regressions:
+            click.echo("❌ 检测到性能回退:", err=True)
+            for line in regressions:
+                click.echo(f"  {line}", err=True)
+            sys.exit(1)
+        click.echo("✅ 未发现超出容差的性能回退", err=True)
+
+
+if __name__ == "__main__":
+    main()
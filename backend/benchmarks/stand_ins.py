@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 基准测试替身服务
+本地Supabase Auth/PostgREST替身、GPU监控服务替身与视频平台数据接口替身，让基准测试无需外部依赖；
+当前代码树中缺失的模块（GPU监控服务、Supabase配置中的部分函数）在导入被测模块前由替身补上
+"""
+
+import asyncio
+import base64
+import importlib
+import importlib.util
+import json
+import sys
+import threading
+import types
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def _b64(data: Dict[str, Any]) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def make_token(user_id: str, role: str = "user", ttl: int = 3600) -> str:
+    """生成替身服务可识别的JWT（不签名，仅用于本地基准测试）"""
+    header = _b64({"alg": "HS256", "typ": "JWT"})
+    payload = _b64({
+        "sub": user_id,
+        "role": "authenticated",
+        "exp": int(time.time()) + ttl,
+        "user_metadata": {"role": role}
+    })
+    # 签名段必须是合法的base64url，新版supabase客户端会先解码令牌结构
+    signature = base64.urlsafe_b64encode(b"benchmark").rstrip(b"=").decode()
+    return f"{header}.{payload}.{signature}"
+
+
+def _decode_token(token: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return None
+
+
+class _SupabaseHandler(BaseHTTPRequestHandler):
+    """模拟 /auth/v1/user 与 /rest/v1/<table> 接口"""
+
+    protocol_version = "HTTP/1.1"
+    server: "FakeSupabaseServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Any):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length))
+
+    def _delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_GET(self):
+        self._delay()
+        self.server.request_count += 1
+        if self.path.startswith("/auth/v1/user"):
+            token = (self.headers.get("Authorization") or "").replace("Bearer ", "")
+            claims = _decode_token(token)
+            if not claims or claims.get("exp", 0) < time.time():
+                self._send_json(401, {"msg": "invalid token"})
+                return
+            self._send_json(200, {
+                "id": claims["sub"],
+                "aud": "authenticated",
+                "role": "authenticated",
+                "email": f"{claims['sub']}@bench.local",
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "last_sign_in_at": datetime.utcnow().isoformat() + "Z",
+                "app_metadata": {},
+                "user_metadata": claims.get("user_metadata", {})
+            })
+            return
+        self._send_json(200, [])
+
+    def _echo_rows(self):
+        self._delay()
+        self.server.request_count += 1
+        body = self._read_body()
+        rows = body if isinstance(body, list) else [body or {}]
+        self._send_json(201, rows)
+
+    do_POST = _echo_rows
+    do_PATCH = _echo_rows
+
+    def do_DELETE(self):
+        self._delay()
+        self.server.request_count += 1
+        self._send_json(200, [])
+
+
+class FakeSupabaseServer(ThreadingHTTPServer):
+    """本地Supabase替身服务（后台线程运行）"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        super().__init__((host, port), _SupabaseHandler)
+        self.latency = latency
+        self.request_count = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSupabaseServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _PlatformHandler(BaseHTTPRequestHandler):
+    """
+    模拟平台数据接口
+
+    GET /<平台>/accounts/videos?account_url=&cursor=&count=   账号视频分页
+    GET /<平台>/videos/<视频ID>                                视频详情
+    GET /<平台>/media?video_url=                               视频媒体文件地址
+    超过每个平台的请求速率时返回429和Retry-After，与真实平台的限流行为一致
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "FakePlatformServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        segments = [segment for segment in parts.path.split("/") if segment]
+        if not segments:
+            self._send_json(404, {"error": "not found"})
+            return
+        platform = segments[0]
+        retry_after = self.server.admit(platform)
+        if retry_after is not None:
+            self._send_json(429, {"error": "rate limited"}, {"Retry-After": f"{retry_after:.2f}"})
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if segments[1:] == ["accounts", "videos"]:
+            query = parse_qs(parts.query)
+            account = (query.get("account_url") or [""])[0]
+            offset = int((query.get("cursor") or ["0"])[0] or 0)
+            count = int((query.get("count") or ["20"])[0])
+            end = min(self.server.videos_per_account, offset + count)
+            prefix = uuid.uuid5(uuid.NAMESPACE_URL, account).hex[:8]
+            self._send_json(200, {
+                "videos": [
+                    {"video_id": f"{platform}_{prefix}_{index + 1}", "title": f"视频{index + 1}"}
+                    for index in range(offset, end)
+                ],
+                "next_cursor": str(end) if end < self.server.videos_per_account else None
+            })
+        elif segments[1:] == ["media"]:
+            video_url = (parse_qs(parts.query).get("video_url") or [""])[0]
+            key = uuid.uuid5(uuid.NAMESPACE_URL, video_url).hex
+            self._send_json(200, {"media_url": f"https://v.{platform}vod.com/{key}.mp4"})
+        elif len(segments) == 3 and segments[1] == "videos":
+            self._send_json(200, {
+                "video_id": segments[2],
+                "title": f"视频{segments[2].rsplit('_', 1)[-1]}",
+                "duration": 120,
+                "views": 5000
+            })
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+class FakePlatformServer(ThreadingHTTPServer):
+    """本地视频平台替身服务：每个平台按令牌桶限流（后台线程运行）"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, rate: float = 20.0, burst: float = 5.0,
+                 latency: float = 0.0, videos_per_account: int = 50):
+        super().__init__((host, port), _PlatformHandler)
+        self.rate = rate
+        self.burst = burst
+        self.latency = latency
+        self.videos_per_account = videos_per_account
+        self.request_count = 0
+        self.throttled_count = 0
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def admit(self, platform: str) -> Optional[float]:
+        """放行返回None，限流时返回建议的重试等待秒数"""
+        with self._lock:
+            self.request_count += 1
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(platform, [self.burst, now])
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._buckets[platform] = [tokens - 1, now]
+                return None
+            self._buckets[platform] = [tokens, now]
+            self.throttled_count += 1
+            return (1 - tokens) / self.rate
+
+    def url(self, platform: str) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{platform}"
+
+    def start(self) -> "FakePlatformServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeGPUMonitorService:
+    """GPU监控服务替身：固定数量的在线GPU，可配置查询延迟"""
+
+    gpu_count = 8
+    latency = 0.0
+
+    def _servers(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": f"bench-gpu-{index}",
+                "status": "online",
+                "gpu_memory_total": 24.0,
+                "gpu_memory_used": 4.0
+            }
+            for index in range(self.gpu_count)
+        ]
+
+    async def get_available_gpus(self, min_count: int = 1) -> List[Dict[str, Any]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._servers()
+
+    async def get_gpu_status(self) -> List[Dict[str, Any]]:
+        return self._servers()
+
+
+def _find_spec(name: str):
+    try:
+        return importlib.util.find_spec(name)
+    except ModuleNotFoundError:
+        return None
+
+
+def install_missing_modules(packages=("services",), configs=("config",)):
+    """
+    在导入分析API之前补上代码树中缺失的依赖，已存在的模块和函数保持不变
+
+    - <services>.gpu_monitor_service：使用 FakeGPUMonitorService
+    - <config>.supabase_config 中的 get_supabase_service_client / get_settings
+    """
+    for package in packages:
+        name = f"{package}.gpu_monitor_service"
+        if name in sys.modules or _find_spec(package) is None or _find_spec(name) is not None:
+            continue
+        module = types.ModuleType(name, "GPU监控服务替身（基准测试）")
+        module.GPUMonitorService = FakeGPUMonitorService
+        module.gpu_monitor_service = FakeGPUMonitorService()
+        sys.modules[name] = module
+
+    for package in configs:
+        if _find_spec(package) is None:
+            continue
+        config = importlib.import_module(f"{package}.supabase_config")
+        if not hasattr(config, "get_supabase_service_client"):
+            config.get_supabase_service_client = lambda: config.get_supabase_client(use_service_role=True)
+        if not hasattr(config, "get_settings"):
+            config.get_settings = config.get_supabase_config
+
+
+def make_task(index: int, user_id: str, status: str = "completed") -> Dict[str, Any]:
+    """构造与真实任务记录结构一致的合成任务"""
+    created_at = datetime.utcfromtimestamp(1_700_000_000 + index)
+    task = {
+        "task_id": str(uuid.UUID(int=index + 1)),
+        "user_id": user_id,
+        "type": "single_video",
+        "status": status,
+        "video_url": f"https://www.douyin.com/video/{7_000_000_000 + index}",
+        "platform": "douyin",
+        "analysis_type": "standard",
+        "options": {},
+        "created_at": created_at,
+        "gpu_id": f"bench-gpu-{index % 8}",
+        "job_class": "standard"
+    }
+    if status == "completed":
+        task.update({
+            "started_at": created_at,
+            "completed_at": created_at,
+            "processing_time": 5.0,
+            "result": {
+                "video_info": {"title": f"视频{index}", "duration": 120, "platform": "douyin", "url": task["video_url"]},
+                "transcript": {
+                    "text": "这是视频的转录文本...",
+                    "segments": {"start": [0.0, 10.0], "end": [10.0, 20.0], "text": ["开头部分", "中间部分"]}
+                },
+                "analysis": {
+                    "sentiment": "positive",
+                    "topics": ["科技", "教育"],
+                    "keywords": ["AI", "机器学习", "深度学习"],
+                    "summary": "这是一个关于AI技术的教育视频..."
+                },
+                "metrics": {"engagement_score": 8.5, "content_quality": 9.0, "educational_value": 8.8}
+            }
+        })
+    return task
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 命令行入口
+
+用法:
+    python cli.py serve                  # 生产模式，Redis状态后端时worker数默认等于可用CPU核数
+    python cli.py serve --workers 4
+    python cli.py serve --reload         # 本地开发（单进程热重载）
+
+注意：调度器并发上限（SCHEDULER_MAX_CONCURRENCY）、quick预留槽位、账号任务上限、
+平台并发上限（PLATFORM_CONCURRENCY）与指标/请求剖析均为每个worker各自独立，
+多worker时整体上限为 worker数 × 配置值；GPU预留负载与平台请求限速额度在所有worker间共享
+"""
+
+import os
+
+import click
+import uvicorn
+
+
+def default_workers() -> int:
+    """可用CPU核数（容器内按CPU亲和性计算）"""
+    if os.getenv('WEB_CONCURRENCY'):
+        return max(1, int(os.getenv('WEB_CONCURRENCY')))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+@click.group()
+def cli():
+    """猫头鹰工厂后台管理系统"""
+
+
+@cli.command()
+@click.option('--host', default=lambda: os.getenv('HOST', '0.0.0.0'), show_default='0.0.0.0', help='监听地址')
+@click.option('--port', default=lambda: int(os.getenv('PORT', '8000')), show_default='8000', type=int, help='监听端口')
+@click.option('--workers', type=int, help='worker进程数（默认：Redis状态后端时为CPU核数，内存后端时为1）')
+@click.option('--reload', is_flag=True, help='开发模式：单进程并在代码变更时重载')
+@click.option('--log-level', default='info', show_default=True, help='uvicorn日志级别')
+def serve(host, port, workers, reload, log_level):
+    """启动API服务"""
+    backend = os.getenv('STATE_BACKEND', 'memory').lower()
+    if reload:
+        workers = 1
+    elif workers is None:
+        workers = default_workers() if backend == 'redis' else 1
+    elif workers > 1 and backend != 'redis':
+        raise click.UsageError(
+            f"多worker模式需要共享状态后端，请设置 STATE_BACKEND=redis（当前: {backend}），或使用 --workers 1"
+        )
+
+    # worker进程继承该变量，日志配置据此为每个worker使用独立的日志文件
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    drain_timeout = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '30'))
+    click.echo(f"🚀 启动API服务 {host}:{port}，worker数 {workers}，状态后端 {backend}", err=True)
+    if workers > 1:
+        max_concurrency = int(os.getenv('SCHEDULER_MAX_CONCURRENCY', '8'))
+        click.echo(
+            f"ℹ️ 调度器与平台并发上限按worker计算：整体分析并发上限为 {workers} × {max_concurrency} = "
+            f"{workers * max_concurrency}，如需保持整体上限请按worker数调小 SCHEDULER_* / PLATFORM_CONCURRENCY",
+            err=True
+        )
+    uvicorn.run(
+        'main:app',
+        host=host,
+        port=port,
+        workers=workers,
+        reload=reload,
+        log_level=log_level,
+        timeout_graceful_shutdown=int(drain_timeout) + 5
+    )
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 日志配置
+loguru日志先写入有界队列，由后台线程批量写到stdout和按天轮转的文件，
+请求处理线程不再直接等待磁盘IO；支持JSON结构化输出、按路径采样INFO日志，
+队列满时丢弃并计数。多worker（WEB_CONCURRENCY > 1）时各进程不能共同轮转同一个文件：
+默认每个worker写入带进程号的文件（app.<pid>.log），LOG_FILE_MODE=watched 时共用一个文件、
+由外部工具（如logrotate）轮转
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import TimedRotatingFileHandler, WatchedFileHandler
+from typing import Callable, List, Tuple
+
+from loguru import logger
+
+from services.metrics_service import metrics
+
+LOG_RECORDS = metrics.counter('owl_log_records_total', '日志记录数', ('sink', 'result'))
+LOG_QUEUE_SIZE = metrics.gauge('owl_log_queue_size', '日志队列待写入条数', ('sink',))
+
+TEXT_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}"
+
+_STOP = object()
+
+
+class QueuedSink:
+    """有界队列 + 后台写线程的loguru sink"""
+
+    def __init__(self, name: str, write: Callable[[str], None], flush: Callable[[], None],
+                 capacity: int = 10000, batch_size: int = 256):
+        self.name = name
+        self._write = write
+        self._flush = flush
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue(maxsize=capacity)
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{name}", daemon=True)
+        self._thread.start()
+
+    def __call__(self, message):
+        text = str(message)
+        try:
+            if message.record['level'].no >= logging.ERROR:
+                # 错误日志尽量不丢，短暂等待队列空位
+                self._queue.put(text, timeout=0.1)
+            else:
+                self._queue.put_nowait(text)
+        except queue.Full:
+            LOG_RECORDS.inc(sink=self.name, result='dropped')
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            written = 0
+            for text in batch:
+                if text is _STOP:
+                    stop = True
+                    continue
+                try:
+                    self._write(text)
+                    written += 1
+                except Exception:
+                    LOG_RECORDS.inc(sink=self.name, result='error')
+            try:
+                self._flush()
+            except Exception:
+                pass
+            if written:
+                LOG_RECORDS.inc(written, sink=self.name, result='written')
+            if stop:
+                return
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中剩余日志后停止后台线程"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+def _worker_count() -> int:
+    """API服务的worker进程数（由 cli.py serve 写入 WEB_CONCURRENCY）"""
+    try:
+        return max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    except ValueError:
+        return 1
+
+
+def _file_handler(path: str, retention_days: int) -> logging.Handler:
+    """
+    单进程时按天轮转；多worker时按 LOG_FILE_MODE 选择：
+    pid（默认）每个worker独立文件并各自轮转，watched 共用文件、检测到外部轮转后重新打开
+    """
+    if _worker_count() > 1:
+        if os.getenv('LOG_FILE_MODE', 'pid').lower() == 'watched':
+            return WatchedFileHandler(path, encoding='utf-8', delay=True)
+        root, ext = os.path.splitext(path)
+        path = f'{root}.{os.getpid()}{ext}'
+    return TimedRotatingFileHandler(
+        path, when='midnight', backupCount=retention_days, encoding='utf-8', delay=True
+    )
+
+
+class _FileWriter:
+    """日志文件写入器（仅在后台写线程中使用）"""
+
+    def __init__(self, path: str, retention_days: int):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._handler = _file_handler(path, retention_days)
+        self._handler.setFormatter(logging.Formatter('%(message)s'))
+        self._handler.terminator = ''
+
+    def write(self, text: str):
+        self._handler.emit(logging.makeLogRecord({'msg': text}))
+
+    def flush(self):
+        self._handler.flush()
+
+
+def _parse_days(value: str, default: int) -> int:
+    """解析 '30 days' 形式的保留时长"""
+    try:
+        return int(value.strip().split()[0])
+    except (ValueError, IndexError, AttributeError):
+        return default
+
+
+def _parse_sample_rates(value: str) -> List[Tuple[str, float]]:
+    """解析 '/api/analysis/status=0.01,/api/analysis/history=0.1'，按前缀长度降序"""
+    rates = []
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        prefix, rate = item.rsplit('=', 1)
+        try:
+            rates.append((prefix.strip(), max(0.0, min(1.0, float(rate)))))
+        except ValueError:
+            continue
+    return sorted(rates, key=lambda entry: len(entry[0]), reverse=True)
+
+
+class _PathSampler:
+    """按请求路径前缀对INFO及以下级别日志采样"""
+
+    def __init__(self, rates: List[Tuple[str, float]]):
+        self.rates = rates
+
+    def __call__(self, record) -> bool:
+        if not self.rates or record['level'].no > logging.INFO:
+            return True
+        path = record['extra'].get('path')
+        if not path:
+            return True
+        # 同一条记录会经过每个sink的过滤器，只在第一次时做采样决定
+        keep = record['extra'].get('_sample_keep')
+        if keep is None:
+            keep = True
+            for prefix, rate in self.rates:
+                if path.startswith(prefix):
+                    keep = random.random() < rate
+                    break
+            record['extra']['_sample_keep'] = keep
+            if not keep:
+                LOG_RECORDS.inc(sink='all', result='sampled_out')
+        return keep
+
+
+def _json_format(record) -> str:
+    """结构化JSON格式"""
+    payload = {
+        'time': record['time'].isoformat(),
+        'level': record['level'].name,
+        'logger': record['name'],
+        'function': record['function'],
+        'line': record['line'],
+        'message': record['message'],
+    }
+    extra = {key: value for key, value in record['extra'].items() if not key.startswith('_')}
+    if extra:
+        payload['extra'] = extra
+    if record['exception'] is not None:
+        payload['exception'] = repr(record['exception'].value)
+    record['extra']['_json'] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+_sinks: List[QueuedSink] = []
+
+
+def setup_logging():
+    """配置loguru：队列化后台写入、JSON/文本格式、按路径采样"""
+    level = os.getenv('LOG_LEVEL', 'INFO')
+    log_file = os.getenv('LOG_FILE', 'logs/app.log')
+    use_json = os.getenv('LOG_FORMAT', 'text').lower() == 'json'
+    capacity = int(os.getenv('LOG_QUEUE_CAPACITY', '10000'))
+    retention_days = _parse_days(os.getenv('LOG_RETENTION', '30 days'), 30)
+    sampler = _PathSampler(_parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', '')))
+    log_format = _json_format if use_json else TEXT_FORMAT
+
+    logger.remove()
+
+    stdout_sink = QueuedSink('stdout', sys.stdout.write, sys.stdout.flush, capacity)
+    logger.add(stdout_sink, format=log_format, level=level, filter=sampler, colorize=False)
+
+    file_writer = _FileWriter(log_file, retention_days)
+    file_sink = QueuedSink('file', file_writer.write, file_writer.flush, capacity)
+    logger.add(file_sink, format=log_format, level=level, filter=sampler, colorize=False)
+
+    _sinks[:] = [stdout_sink, file_sink]
+    metrics.register_collector(_collect_queue_sizes)
+    atexit.register(shutdown_logging)
+
+
+def _collect_queue_sizes():
+    for sink in _sinks:
+        LOG_QUEUE_SIZE.set(sink.qsize(), sink=sink.name)
+
+
+def shutdown_logging(timeout: float = 5.0):
+    """关闭时写出队列中剩余的日志"""
+    for sink in _sinks:
+        sink.close(timeout)
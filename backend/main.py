@@ -5,76 +5,151 @@
 """
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from contextlib import asynccontextmanager
 from datetime import datetime
 from loguru import logger
-import sys
-
-# 配置日志
-logger.remove()
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="INFO"
-)
-logger.add(
-    "logs/app.log",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-    level="INFO",
-    rotation="1 day",
-    retention="30 days"
-)
+import asyncio
+import importlib
+import os
+import time
+
+# 配置日志（队列化后台写入）
+from config.logging_config import setup_logging, shutdown_logging
+setup_logging()
+
+# 导入轻量服务（Supabase客户端、GPU监控、各业务路由在后台启动任务中再导入）
+from services.startup_service import startup_tracker
+with startup_tracker.phase("import:services"):
+    from services.task_scheduler import task_scheduler
+    from services.metrics_service import metrics, HTTP_REQUEST_DURATION
+    from services.health_service import health_service
+    from services.audit_service import audit_logger
+    from services.retention_service import retention_service
+    from services.prefetch_service import video_prefetcher
+    from services.platform_fetcher import platform_fetcher
+    from middleware.supabase_auth import get_current_user, get_admin_user
+    from middleware.request_profiler import RequestProfilerMiddleware, slowest_profiles
+
+# 关闭时等待运行中分析任务的最长时间（秒）
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '30'))
+
+# API路由表：(模块, 前缀, 标签)，启动后在后台线程中导入并注册
+ROUTERS = [
+    ("api.auth_routes", "/api/auth", ["认证"]),
+    ("api.user_routes", "/api/users", ["用户管理"]),
+    ("api.recharge_routes", "/api/recharge", ["充值管理"]),
+    ("api.gpu_routes", "/api/gpu", ["GPU管理"]),
+    ("api.admin_routes", "/api/admin", ["管理员"]),
+    ("api.log_routes", "/api/logs", ["日志管理"]),
+    # 分析路由自带 /api/analysis 前缀与标签
+    ("api.intelligent_analysis_api", "", []),
+]
+
+# 分析任务模块：启动调度器前显式注册其调度器钩子、指标收集器与保留策略监听器
+ANALYSIS_MODULE = "api.intelligent_analysis_api"
+
+def _import_router(module_path: str):
+    return importlib.import_module(module_path).router
 
-# 导入配置和服务
-from config.supabase_config import settings, supabase_manager
-from services.recharge_service import recharge_service
-from services.gpu_monitor_service import gpu_monitor_service
+async def include_routers(app: FastAPI):
+    """逐个导入并注册业务路由，记录每个路由模块的导入耗时"""
+    for module_path, prefix, tags in ROUTERS:
+        try:
+            with startup_tracker.phase(f"router:{module_path}"):
+                router = await asyncio.to_thread(_import_router, module_path)
+        except Exception as e:
+            logger.error(f"❌ 路由加载失败 {module_path}: {e}")
+            continue
+        app.include_router(router, prefix=prefix, tags=tags)
+    # 路由表变化后重新生成OpenAPI文档
+    app.openapi_schema = None
 
-# 导入API路由
-from api.auth_routes import router as auth_router
-from api.user_routes import router as user_router
-from api.recharge_routes import router as recharge_router
-from api.gpu_routes import router as gpu_router
-from api.admin_routes import router as admin_router
-from api.log_routes import router as log_router
+async def check_supabase_connection():
+    """测试Supabase连接（同步客户端放到线程中执行）"""
+    with startup_tracker.phase("supabase_probe"):
+        from config.supabase_config import supabase_manager
+        connected = await asyncio.to_thread(supabase_manager.test_connection)
+    if connected:
+        logger.info("✅ Supabase连接测试成功")
+    else:
+        logger.warning("⚠️ Supabase连接测试失败")
 
-# 导入Supabase认证中间件
-from middleware.supabase_auth import get_current_user, get_admin_user
+async def sync_gpu_servers():
+    """增量同步GPU服务器配置（只写入有变化的服务器，与其他启动步骤并发执行）"""
+    with startup_tracker.phase("gpu_sync"):
+        from services.gpu_config_sync import sync_gpu_servers_config
+        sync_result = await sync_gpu_servers_config()
+    if sync_result["success"]:
+        logger.info(f"✅ GPU服务器配置同步成功: {sync_result['message']}")
+    else:
+        logger.warning(f"⚠️ GPU服务器配置同步失败: {sync_result['message']}")
+
+async def start_scheduler():
+    """注册分析任务钩子后启动任务调度器（接管其他实例重新入队的任务）"""
+    with startup_tracker.phase("scheduler"):
+        try:
+            analysis_api = await asyncio.to_thread(importlib.import_module, ANALYSIS_MODULE)
+            analysis_api.register_hooks()
+        except Exception as e:
+            logger.error(f"❌ 分析任务钩子注册失败: {e}")
+        await task_scheduler.start()
+
+async def run_startup(app: FastAPI):
+    """后台并发执行启动工作，全部结束后 /ready 才可能返回就绪"""
+    results = await asyncio.gather(
+        include_routers(app),
+        check_supabase_connection(),
+        sync_gpu_servers(),
+        start_scheduler(),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"❌ 启动步骤失败: {result}")
+    startup_tracker.mark_completed()
+    timings = ", ".join(f"{name}={ms}ms" for name, ms in startup_tracker.timings.items())
+    logger.info(f"🎉 系统启动完成，耗时明细: {timings}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    # 启动时执行
+    # 启动时执行：只启动后台任务，不等待依赖，进程立即开始监听
     logger.info("🚀 猫头鹰工厂后台管理系统启动中...")
     
-    try:
-        # 测试Supabase连接
-        if supabase_manager.test_connection():
-            logger.info("✅ Supabase连接测试成功")
-        else:
-            logger.warning("⚠️ Supabase连接测试失败")
-        
-        # 同步GPU服务器配置
-        sync_result = await gpu_monitor_service.sync_gpu_servers_to_database()
-        if sync_result["success"]:
-            logger.info(f"✅ GPU服务器配置同步成功: {sync_result['message']}")
-        else:
-            logger.warning(f"⚠️ GPU服务器配置同步失败: {sync_result['message']}")
-        
-        logger.info("🎉 系统启动完成")
-        
-    except Exception as e:
-        logger.error(f"❌ 系统启动失败: {e}")
+    # 依赖健康探测、审计日志写入与过期任务清理都在后台运行
+    health_service.start()
+    audit_logger.start()
+    retention_service.start()
+    video_prefetcher.start()
+    startup_task = asyncio.create_task(run_startup(app))
     
     yield
     
-    # 关闭时执行
+    if not startup_task.done():
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+    
+    # 关闭时执行：停止接收新任务，等待运行中的分析任务，超时的任务重新入队
+    logger.info("⏳ 正在等待分析任务结束...")
+    drain_result = await task_scheduler.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    logger.info(
+        f"✅ 分析任务处理完毕: 完成 {drain_result['completed']} 个, "
+        f"重新入队 {drain_result['requeued']} 个, 中断 {drain_result['interrupted']} 个"
+    )
+    await health_service.stop()
+    await retention_service.stop()
+    await audit_logger.stop()
+    await video_prefetcher.stop()
+    video_prefetcher.shutdown()
+    platform_fetcher.close()
     logger.info("👋 猫头鹰工厂后台管理系统关闭")
+    shutdown_logging()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -107,6 +182,59 @@ app.add_middleware(
     allowed_hosts=["localhost", "127.0.0.1", "*.your-domain.com"]
 )
 
+# 请求剖析中间件（按采样率或X-Profile请求头开启）
+app.add_middleware(RequestProfilerMiddleware)
+
+# 请求耗时指标（按路由模板聚合）
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        # 绑定请求路径，供日志按路径采样
+        with logger.contextualize(path=request.url.path):
+            response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=status_code
+        )
+
+# 调度队列与GPU指标
+QUEUE_DEPTH_GAUGE = metrics.gauge("owl_analysis_queue_depth", "调度队列排队任务数", ("job_class",))
+RUNNING_JOBS_GAUGE = metrics.gauge("owl_analysis_running_jobs", "运行中的分析任务数", ("job_class",))
+PREPARING_JOBS_GAUGE = metrics.gauge("owl_analysis_preparing_jobs", "预取阶段中的分析任务数")
+GPU_UTILIZATION_GAUGE = metrics.gauge("owl_gpu_memory_utilization_ratio", "GPU显存利用率", ("server",))
+GPU_SERVER_UP_GAUGE = metrics.gauge("owl_gpu_server_up", "GPU服务器是否在线", ("server",))
+
+def collect_scheduler_metrics():
+    stats = task_scheduler.get_stats()
+    for job_class, depth in stats["queued"].items():
+        QUEUE_DEPTH_GAUGE.set(depth, job_class=job_class)
+    for job_class, running in stats["running"].items():
+        RUNNING_JOBS_GAUGE.set(running, job_class=job_class)
+    PREPARING_JOBS_GAUGE.set(stats["preparing"])
+
+def collect_gpu_metrics():
+    # 复用健康探测缓存的GPU状态，抓取指标时不直接查询GPU集群
+    gpu_details = health_service.get_details("gpu") or {}
+    servers = gpu_details.get("servers", [])
+    GPU_UTILIZATION_GAUGE.clear()
+    GPU_SERVER_UP_GAUGE.clear()
+    for server in servers:
+        memory_total = server.get("gpu_memory_total") or 0
+        utilization = server.get("gpu_memory_used", 0) / memory_total if memory_total else 0
+        GPU_UTILIZATION_GAUGE.set(utilization, server=server["id"])
+        GPU_SERVER_UP_GAUGE.set(1 if server.get("status") == "online" else 0, server=server["id"])
+
+metrics.register_collector(collect_scheduler_metrics)
+metrics.register_collector(collect_gpu_metrics)
+
 # 全局异常处理
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -119,7 +247,7 @@ async def global_exception_handler(request, exc):
 # 健康检查端点
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
+    """存活检查端点（不访问任何依赖）"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
@@ -127,6 +255,42 @@ async def health_check():
         "service": "猫头鹰工厂后台管理系统"
     }
 
+# 就绪检查端点
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查端点，返回后台探测缓存的依赖状态"""
+    ready = startup_tracker.is_ready() and health_service.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content=jsonable_encoder({
+            "status": "ready" if ready else "not_ready",
+            "timestamp": datetime.now().isoformat(),
+            "startup": startup_tracker.report(),
+            "dependencies": health_service.snapshot()
+        })
+    )
+
+# 指标端点
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus指标端点"""
+    return PlainTextResponse(
+        await metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+# 最慢请求剖析结果
+@app.get("/debug/profiles", include_in_schema=False)
+async def get_slowest_profiles(limit: int = 20, admin_user: dict = Depends(get_admin_user)):
+    """导出最慢请求的分段耗时"""
+    return {"profiles": slowest_profiles.dump()[:limit]}
+
+@app.delete("/debug/profiles", include_in_schema=False)
+async def clear_slowest_profiles(admin_user: dict = Depends(get_admin_user)):
+    """清空剖析记录"""
+    slowest_profiles.clear()
+    return {"message": "剖析记录已清空"}
+
 # 根端点
 @app.get("/")
 async def root():
@@ -135,22 +299,16 @@ async def root():
         "message": "🦉 欢迎使用猫头鹰工厂后台管理系统",
         "version": "1.0.0",
         "docs": "/docs",
-        "health": "/health"
+        "health": "/health",
+        "ready": "/ready"
     }
 
-# 注册API路由
-app.include_router(auth_router, prefix="/api/auth", tags=["认证"])
-app.include_router(user_router, prefix="/api/users", tags=["用户管理"])
-app.include_router(recharge_router, prefix="/api/recharge", tags=["充值管理"])
-app.include_router(gpu_router, prefix="/api/gpu", tags=["GPU管理"])
-app.include_router(admin_router, prefix="/api/admin", tags=["管理员"])
-app.include_router(log_router, prefix="/api/logs", tags=["日志管理"])
-
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        timeout_graceful_shutdown=int(SHUTDOWN_DRAIN_TIMEOUT) + 5
     )
\ No newline at end of file
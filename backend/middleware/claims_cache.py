@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 已验证令牌缓存
+同一会话的重复请求直接复用已验证的用户信息，跳过Supabase远程校验；
+缓存有容量上限，过期时间不晚于令牌自身的exp，支持按令牌/按用户吊销，
+吊销记录写入共享状态后端，所有worker同时生效
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set, Tuple
+
+import jwt
+from loguru import logger
+
+from services.metrics_service import metrics
+from services.state_backend import TaskStore, task_store
+
+AUTH_CACHE_ENTRIES = metrics.gauge('owl_auth_cache_entries', '已验证令牌缓存条目数')
+
+# 令牌过期前预留的余量（秒），避免临界时刻仍命中缓存
+EXPIRY_SKEW = 5.0
+
+
+@dataclass
+class CachedClaims:
+    """缓存的已验证用户信息"""
+    user: Dict[str, Any]
+    user_id: str
+    cached_at: float
+    expires_at: float
+
+
+def token_key(token: str) -> str:
+    """令牌的摘要（缓存中不保存原始令牌）"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """读取令牌的exp（签名已由远程校验确认，这里只用exp缩短缓存时间）"""
+    try:
+        payload = jwt.decode(token, options={'verify_signature': False, 'verify_exp': False})
+        exp = payload.get('exp')
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+class VerifiedClaimsCache:
+    """按令牌缓存的已验证用户信息（LRU）"""
+
+    def __init__(self, capacity: int = 10000, ttl: float = 300.0, store: Optional[TaskStore] = None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.store = store if store is not None else task_store
+        self._entries: "OrderedDict[str, CachedClaims]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry.user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry.user_id]
+
+    async def lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        查询缓存，返回(用户信息, 令牌是否已吊销)
+
+        只在本地命中时读取吊销记录，未命中直接返回，由调用方远程校验后再用is_revoked检查；
+        用户被吊销（如角色变更）时丢弃该用户在吊销前缓存的条目，由调用方重新远程校验
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.time():
+            self._evict(key)
+            entry = None
+        if entry is None:
+            return None, False
+
+        try:
+            revoked = await self.store.get_revocations([f'token:{key}', f'user:{entry.user_id}'])
+        except Exception as e:
+            # 吊销记录不可用时不使用缓存，回退到远程校验
+            logger.warning(f"读取令牌吊销记录失败: {e}")
+            return None, False
+
+        if f'token:{key}' in revoked:
+            self._evict(key)
+            return None, True
+        user_revoked_at = revoked.get(f'user:{entry.user_id}')
+        if user_revoked_at is not None and entry.cached_at <= user_revoked_at:
+            self._evict(key)
+            return None, False
+
+        self._entries.move_to_end(key)
+        return entry.user, False
+
+    async def is_revoked(self, key: str) -> bool:
+        """远程校验通过后检查令牌是否已被吊销（吊销记录不可用时按未吊销处理，与远程校验结果一致）"""
+        try:
+            return f'token:{key}' in await self.store.get_revocations([f'token:{key}'])
+        except Exception as e:
+            logger.warning(f"读取令牌吊销记录失败: {e}")
+            return False
+
+    def put(self, key: str, token: str, user: Dict[str, Any]):
+        """缓存远程校验通过的用户信息"""
+        now = time.time()
+        expires_at = now + self.ttl
+        exp = token_expiry(token)
+        if exp is not None:
+            expires_at = min(expires_at, exp - EXPIRY_SKEW)
+        if expires_at <= now:
+            return
+
+        self._evict(key)
+        self._entries[key] = CachedClaims(user=user, user_id=user['id'], cached_at=now, expires_at=expires_at)
+        self._by_user.setdefault(user['id'], set()).add(key)
+        while len(self._entries) > self.capacity:
+            oldest, _ = next(iter(self._entries.items()))
+            self._evict(oldest)
+
+    async def revoke_token(self, token: str):
+        """吊销单个令牌（如注销登录），在令牌过期前所有worker都拒绝该令牌"""
+        key = token_key(token)
+        self._evict(key)
+        now = time.time()
+        exp = token_expiry(token)
+        ttl = exp - now if exp is not None and exp > now else self.ttl
+        await self.store.add_revocation(f'token:{key}', now, ttl + EXPIRY_SKEW)
+
+    async def revoke_user(self, user_id: str):
+        """
+        吊销用户已缓存的所有会话（如角色或权限变更）
+
+        吊销后的请求重新远程校验，记录只需保留一个缓存周期
+        """
+        for key in list(self._by_user.get(user_id, ())):
+            self._evict(key)
+        await self.store.add_revocation(f'user:{user_id}', time.time(), self.ttl + EXPIRY_SKEW)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+
+# 全局令牌缓存实例（AUTH_CACHE_TTL=0 时关闭缓存）
+claims_cache = VerifiedClaimsCache(
+    capacity=int(os.getenv('AUTH_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('AUTH_CACHE_TTL', '300'))
+)
+
+metrics.register_collector(lambda: AUTH_CACHE_ENTRIES.set(len(claims_cache)))
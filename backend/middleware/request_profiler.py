@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 请求级性能剖析中间件
+按采样率或管理员请求头开启剖析，记录认证、数据库、GPU查询、序列化等分段耗时，
+通过Server-Timing响应头返回，并保留最慢的N个请求供排查
+"""
+
+import heapq
+import hmac
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from starlette.datastructures import MutableHeaders
+
+PROFILE_HEADER = b"x-profile"
+
+
+class RequestProfile:
+    """单个请求的分段耗时记录"""
+
+    __slots__ = ('method', 'path', 'route', 'status', 'started_at', '_start', 'duration', 'spans', '_lock')
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_at = datetime.utcnow()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        # 分段名 -> [累计耗时(秒), 次数]
+        self.spans: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, duration: float):
+        with self._lock:
+            span = self.spans.setdefault(name, [0.0, 0])
+            span[0] += duration
+            span[1] += 1
+
+    def finish(self) -> float:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+        return self.duration
+
+    def server_timing(self) -> str:
+        """生成Server-Timing响应头"""
+        parts = [
+            f"{name};dur={total * 1000:.2f}"
+            for name, (total, _count) in self.spans.items()
+        ]
+        parts.append(f"total;dur={self.finish() * 1000:.2f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'method': self.method,
+            'path': self.path,
+            'route': self.route,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': round(self.finish() * 1000, 2),
+            'spans': {
+                name: {'duration_ms': round(total * 1000, 2), 'count': count}
+                for name, (total, count) in self.spans.items()
+            }
+        }
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar('request_profile', default=None)
+
+
+@contextmanager
+def profile_span(name: str):
+    """
+    记录一段代码的耗时
+
+    当前请求未开启剖析时不做任何计时
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, time.perf_counter() - start)
+
+
+class SlowestProfiles:
+    """保留耗时最长的N个请求剖析结果"""
+
+    def __init__(self, capacity: int = 50):
+        self.capacity = capacity
+        self._heap: List[tuple] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        entry = (profile.finish(), self._seq, profile)
+        with self._lock:
+            self._seq += 1
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def dump(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = sorted(self._heap, key=lambda entry: entry[0], reverse=True)
+        return [profile.to_dict() for _duration, _seq, profile in entries]
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+# 全局最慢请求记录
+slowest_profiles = SlowestProfiles(int(os.getenv('PROFILING_KEEP_SLOWEST', '50')))
+
+
+class RequestProfilerMiddleware:
+    """请求剖析ASGI中间件"""
+
+    def __init__(self, app, sample_rate: Optional[float] = None, trigger_token: Optional[str] = None):
+        self.app = app
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+        token = trigger_token if trigger_token is not None else os.getenv('PROFILING_TRIGGER_TOKEN', '')
+        self.trigger_token = token.encode() if token else None
+
+    def _should_profile(self, scope) -> bool:
+        if self.trigger_token is not None:
+            for name, value in scope.get('headers', []):
+                if name == PROFILE_HEADER and hmac.compare_digest(value, self.trigger_token):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope['method'], scope['path'])
+        context_token = _current_profile.set(profile)
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                profile.status = message['status']
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', profile.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_profile.reset(context_token)
+            route = scope.get('route')
+            profile.route = route.path if route else None
+            profile.finish()
+            slowest_profiles.add(profile)
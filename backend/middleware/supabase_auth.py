@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """
 🦉 猫头鹰工厂 - Supabase认证中间件
-处理JWT令牌验证和用户权限检查
+处理JWT令牌验证和用户权限检查（已验证的令牌按会话缓存）
 """
 
 import jwt
@@ -10,8 +10,12 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from typing import Dict, Any, Optional
 from loguru import logger
 from datetime import datetime
+import time
 
 from config.supabase_config import get_supabase_client, get_supabase_service_client, get_settings
+from services.metrics_service import AUTH_VERIFY_DURATION, observe_supabase
+from middleware.request_profiler import profile_span
+from middleware.claims_cache import claims_cache, token_key
 
 security = HTTPBearer()
 settings = get_settings()
@@ -20,15 +24,34 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     """
     验证Supabase JWT令牌
     """
+    start = time.perf_counter()
+    auth_result = "error"
+    auth_mode = "remote"
     try:
         token = credentials.credentials
         
+        # 同一令牌已验证过时直接复用缓存的用户信息
+        cache_key = token_key(token)
+        cached_user, revoked = await claims_cache.lookup(cache_key)
+        if revoked:
+            auth_mode = "cache"
+            auth_result = "revoked"
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="认证令牌已注销"
+            )
+        if cached_user is not None:
+            auth_mode = "cache"
+            auth_result = "ok"
+            return cached_user
+        
         # 使用Supabase客户端验证令牌
         supabase = get_supabase_client()
         
         # 设置令牌并获取用户信息
-        supabase.auth.set_session(token, "")
-        user_response = supabase.auth.get_user(token)
+        with profile_span("auth"), observe_supabase("auth.get_user"):
+            supabase.auth.set_session(token, "")
+            user_response = supabase.auth.get_user(token)
         
         if not user_response.user:
             raise HTTPException(
@@ -36,10 +59,19 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
                 detail="无效的认证令牌"
             )
         
+        # 缓存未命中时才检查吊销记录（注销后的令牌在过期前仍能通过远程校验）
+        if await claims_cache.is_revoked(cache_key):
+            auth_result = "revoked"
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="认证令牌已注销"
+            )
+        
         user = user_response.user
+        auth_result = "ok"
         
         # 返回用户信息
-        return {
+        user_info = {
             "id": user.id,
             "email": user.email,
             "role": user.user_metadata.get("role", "user"),
@@ -48,6 +80,8 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
             "user_metadata": user.user_metadata,
             "app_metadata": user.app_metadata
         }
+        claims_cache.put(cache_key, token, user_info)
+        return user_info
         
     except HTTPException:
         raise
@@ -57,6 +91,8 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="认证失败"
         )
+    finally:
+        AUTH_VERIFY_DURATION.observe(time.perf_counter() - start, mode=auth_mode, result=auth_result)
 
 async def get_current_user(user: Dict[str, Any] = Depends(verify_token)) -> Dict[str, Any]:
     """
@@ -95,7 +131,8 @@ async def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
     try:
         supabase = get_supabase_service_client()
         
-        response = supabase.table("user_profiles").select("*").eq("user_id", user_id).execute()
+        with profile_span("db"), observe_supabase("user_profiles.select"):
+            response = supabase.table("user_profiles").select("*").eq("user_id", user_id).execute()
         
         if response.data:
             return response.data[0]
@@ -115,7 +152,8 @@ async def update_user_profile(user_id: str, profile_data: Dict[str, Any]) -> Dic
         # 添加更新时间
         profile_data["updated_at"] = datetime.utcnow().isoformat()
         
-        response = supabase.table("user_profiles").update(profile_data).eq("user_id", user_id).execute()
+        with profile_span("db"), observe_supabase("user_profiles.update"):
+            response = supabase.table("user_profiles").update(profile_data).eq("user_id", user_id).execute()
         
         if response.data:
             return response.data[0]
@@ -124,7 +162,8 @@ async def update_user_profile(user_id: str, profile_data: Dict[str, Any]) -> Dic
             profile_data["user_id"] = user_id
             profile_data["created_at"] = datetime.utcnow().isoformat()
             
-            create_response = supabase.table("user_profiles").insert(profile_data).execute()
+            with profile_span("db"), observe_supabase("user_profiles.insert"):
+                create_response = supabase.table("user_profiles").insert(profile_data).execute()
             return create_response.data[0]
             
     except Exception as e:
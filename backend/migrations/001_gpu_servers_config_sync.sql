@@ -0,0 +1,7 @@
+-- 🦉 猫头鹰工厂 - GPU服务器配置同步字段
+-- config_managed: 记录由 GPU_SERVERS 配置同步维护，只有这些记录会在移出配置时被标记离线
+-- config_removed_at: 移出配置的时间；status 仍由GPU监控维护，重新加入配置时清空本字段并恢复 online
+
+ALTER TABLE gpu_servers
+    ADD COLUMN IF NOT EXISTS config_managed boolean NOT NULL DEFAULT false,
+    ADD COLUMN IF NOT EXISTS config_removed_at timestamptz;
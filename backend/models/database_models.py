@@ -83,6 +83,8 @@ class GPUServer(BaseModel):
     memory_usage: float = 0.0
     disk_usage: float = 0.0
     last_check: Optional[datetime] = None
+    config_managed: bool = False  # 由 GPU_SERVERS 配置同步维护
+    config_removed_at: Optional[datetime] = None  # 移出配置的时间，重新加入配置时清空
     created_at: datetime
     updated_at: datetime
 
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 审计日志服务
+请求处理中只把结构化事件写入内存环形缓冲区，由后台任务批量写入
+system_logs / admin_operations 表；缓冲区有上限，数据库变慢时丢弃最旧事件并计数。
+写入失败时只重试临时性错误（网络、超时、5xx/429、数据库连接类），且有次数上限；
+数据错误（4xx、约束冲突等）逐条定位后与超过重试次数的事件一起写入死信文件
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config.supabase_config import get_supabase_client, Tables
+from .metrics_service import metrics, observe_supabase
+
+try:
+    import httpx
+    _TRANSIENT_ERRORS: Tuple[type, ...] = (OSError, httpx.TransportError)
+except ImportError:  # pragma: no cover - httpx随supabase客户端安装
+    _TRANSIENT_ERRORS = (OSError,)
+
+AUDIT_EVENTS = metrics.counter('owl_audit_events_total', '审计事件数', ('table', 'result'))
+AUDIT_BUFFER_SIZE = metrics.gauge('owl_audit_buffer_size', '审计缓冲区待写入事件数')
+
+
+# 可重试的SQLSTATE类别：连接异常、事务回滚（死锁/序列化失败）、资源不足、管理员干预（如数据库重启）
+TRANSIENT_SQLSTATE_CLASSES = ('08', '40', '53', '57')
+
+
+def is_transient_error(error: Exception) -> bool:
+    """写入失败是否可能在重试后成功（无法识别的错误按临时性处理，由重试次数上限兜底）"""
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    code = getattr(error, 'code', None)
+    if status is None and isinstance(code, int):
+        # PostgREST返回非JSON错误时code为HTTP状态码
+        status = code
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(code, str) and code:
+        if code.startswith('PGRST'):
+            # PGRST000-003 为数据库连接与连接池超时
+            return code.startswith('PGRST00')
+        return code[:2] in TRANSIENT_SQLSTATE_CLASSES
+    return True
+
+
+def get_request_meta(request) -> Tuple[Optional[str], Optional[str]]:
+    """从请求中提取客户端IP和User-Agent"""
+    if request is None:
+        return None, None
+    forwarded = request.headers.get('x-forwarded-for')
+    if forwarded:
+        ip_address = forwarded.split(',')[0].strip()
+    else:
+        ip_address = request.client.host if request.client else None
+    return ip_address, request.headers.get('user-agent')
+
+
+class AuditLogger:
+    """异步批量审计日志"""
+
+    def __init__(
+        self,
+        capacity: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        max_attempts: int = 5,
+        dead_letter_path: Optional[str] = None
+    ):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.dead_letter_path = dead_letter_path
+        # (表名, 事件, 已失败次数)
+        self._buffer: Deque[Tuple[str, Dict[str, Any], int]] = deque(maxlen=capacity)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.dropped = 0
+
+    def _enqueue(self, table: str, row: Dict[str, Any]):
+        if len(self._buffer) >= self.capacity:
+            # 环形缓冲区已满，最旧的事件会被覆盖
+            self.dropped += 1
+            AUDIT_EVENTS.inc(table=self._buffer[0][0], result='dropped')
+        self._buffer.append((table, row, 0))
+        AUDIT_EVENTS.inc(table=table, result='enqueued')
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def log_action(
+        self,
+        action: str,
+        user_id: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None,
+        request=None
+    ):
+        """记录用户操作到system_logs（不阻塞请求）"""
+        ip_address, user_agent = get_request_meta(request)
+        self._enqueue(Tables.SYSTEM_LOGS, {
+            'user_id': user_id,
+            'action': action,
+            'details': details or {},
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'created_at': datetime.utcnow().isoformat()
+        })
+
+    def log_admin_operation(
+        self,
+        operation: str,
+        admin_id: str,
+        target_type: Optional[str] = None,
+        target_id: Optional[str] = None,
+        details: Optional[Dict[str, Any]] = None,
+        request=None
+    ):
+        """记录管理员操作到admin_operations（不阻塞请求）"""
+        ip_address, user_agent = get_request_meta(request)
+        self._enqueue(Tables.ADMIN_OPERATIONS, {
+            'admin_id': admin_id,
+            'operation': operation,
+            'target_type': target_type,
+            'target_id': target_id,
+            'details': details or {},
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'created_at': datetime.utcnow().isoformat()
+        })
+
+    def _take_batch(self) -> Dict[str, List[Tuple[Dict[str, Any], int]]]:
+        batch: Dict[str, List[Tuple[Dict[str, Any], int]]] = {}
+        for _ in range(min(self.batch_size, len(self._buffer))):
+            table, row, attempts = self._buffer.popleft()
+            batch.setdefault(table, []).append((row, attempts))
+        return batch
+
+    def _requeue(self, table: str, entries: List[Tuple[Dict[str, Any], int]]):
+        """放回队首等待下次重试，超出容量的部分按丢弃计数"""
+        space = self.capacity - len(self._buffer)
+        retained = entries[:max(0, space)]
+        for row, attempts in reversed(retained):
+            self._buffer.appendleft((table, row, attempts))
+        if len(entries) > len(retained):
+            self.dropped += len(entries) - len(retained)
+            AUDIT_EVENTS.inc(len(entries) - len(retained), table=table, result='dropped')
+
+    def _write_dead_letters(self, table: str, rows: List[Dict[str, Any]]):
+        os.makedirs(os.path.dirname(self.dead_letter_path) or '.', exist_ok=True)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps({'table': table, 'row': row}, ensure_ascii=False, default=str) + '\n')
+
+    async def _dead_letter(self, table: str, rows: List[Dict[str, Any]], reason: str):
+        """不再重试的事件写入死信文件（未配置时丢弃），两种情况都计数"""
+        AUDIT_EVENTS.inc(len(rows), table=table, result='dead_letter')
+        logger.error(f"审计日志放弃写入（{table}，{len(rows)}条）: {reason}")
+        if not self.dead_letter_path:
+            self.dropped += len(rows)
+            return
+        try:
+            await asyncio.to_thread(self._write_dead_letters, table, rows)
+        except OSError as e:
+            self.dropped += len(rows)
+            logger.error(f"审计日志死信文件写入失败: {e}")
+
+    async def _insert(self, table: str, rows: List[Dict[str, Any]]):
+        client = get_supabase_client(use_service_role=True)
+        with observe_supabase(f'{table}.insert'):
+            await asyncio.to_thread(lambda: client.table(table).insert(rows).execute())
+
+    async def _isolate_rejected(self, table: str, entries: List[Tuple[Dict[str, Any], int]]) -> int:
+        """整批因数据错误被拒绝时逐条写入，只把被拒绝的事件写入死信，返回写入条数"""
+        written = 0
+        try:
+            for index, (row, _) in enumerate(entries):
+                try:
+                    await self._insert(table, [row])
+                    written += 1
+                except asyncio.CancelledError:
+                    self._requeue(table, entries[index:])
+                    raise
+                except Exception as e:
+                    if is_transient_error(e):
+                        # 逐条写入期间出现临时性错误，剩余事件放回等待下次重试
+                        self._requeue(table, entries[index:])
+                        break
+                    await self._dead_letter(table, [row], str(e))
+        finally:
+            if written:
+                AUDIT_EVENTS.inc(written, table=table, result='written')
+        return written
+
+    async def flush(self) -> int:
+        """批量写入一批事件，返回写入条数"""
+        batch = list(self._take_batch().items())
+        written = 0
+        for index, (table, entries) in enumerate(batch):
+            rows = [row for row, _ in entries]
+            try:
+                await self._insert(table, rows)
+                written += len(rows)
+                AUDIT_EVENTS.inc(len(rows), table=table, result='written')
+            except asyncio.CancelledError:
+                # 写入中途被取消：本表及之后尚未写入的事件按原顺序放回队首
+                # （线程中的写入可能已经完成，此时会重复写入一次，审计日志宁可重复不能丢失）
+                for pending_table, pending_entries in reversed(batch[index:]):
+                    self._requeue(pending_table, pending_entries)
+                raise
+            except Exception as e:
+                logger.error(f"审计日志写入失败（{table}，{len(rows)}条）: {e}")
+                AUDIT_EVENTS.inc(len(rows), table=table, result='failed')
+                if not is_transient_error(e):
+                    try:
+                        written += await self._isolate_rejected(table, entries)
+                    except asyncio.CancelledError:
+                        for pending_table, pending_entries in reversed(batch[index + 1:]):
+                            self._requeue(pending_table, pending_entries)
+                        raise
+                    continue
+                retry = [(row, attempts + 1) for row, attempts in entries if attempts + 1 < self.max_attempts]
+                exhausted = [row for row, attempts in entries if attempts + 1 >= self.max_attempts]
+                if exhausted:
+                    await self._dead_letter(table, exhausted, f"重试{self.max_attempts}次仍失败: {e}")
+                self._requeue(table, retry)
+        return written
+
+    async def _drain(self) -> bool:
+        """写出缓冲区中的全部事件，写入失败时返回False"""
+        while self._buffer:
+            pending = len(self._buffer)
+            if await self.flush() == 0 and len(self._buffer) >= pending:
+                return False
+        return True
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # 写入失败时等待下个周期重试
+            await self._drain()
+
+    def start(self):
+        """启动后台批量写入"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        停止后台任务并写出剩余事件
+
+        先让后台任务写完当前批次后自行退出，超时才取消（被取消的批次放回缓冲区），
+        最后再写出缓冲区中剩余的事件
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            done, _ = await asyncio.wait({self._task}, timeout=timeout)
+            if not done:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if not await self._drain():
+            logger.warning(f"关闭时仍有 {len(self._buffer)} 条审计日志未写入")
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+
+# 全局审计日志实例
+audit_logger = AuditLogger(
+    capacity=int(os.getenv('AUDIT_BUFFER_CAPACITY', '10000')),
+    batch_size=int(os.getenv('AUDIT_BATCH_SIZE', '500')),
+    flush_interval=float(os.getenv('AUDIT_FLUSH_INTERVAL', '2')),
+    max_attempts=int(os.getenv('AUDIT_MAX_ATTEMPTS', '5')),
+    dead_letter_path=os.getenv('AUDIT_DEAD_LETTER_FILE', 'logs/audit_dead_letter.jsonl') or None
+)
+
+metrics.register_collector(lambda: AUDIT_BUFFER_SIZE.set(audit_logger.pending()))
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - GPU服务器配置同步
+启动时把 GPU_SERVERS 环境变量中的服务器列表增量同步到 gpu_servers 表：
+按配置字段的内容摘要与已有记录比较，只把有变化的服务器批量upsert；
+status 由GPU监控维护，不参与比较也不由配置写入（配置中的status被忽略），
+仅在新增服务器或被移除后重新加入配置时设为 online。
+配置中已移除的服务器（仅限 config_managed 的记录）记录 config_removed_at 并标记离线；
+未设置 GPU_SERVERS 时不做任何同步。所需字段见 migrations/001_gpu_servers_config_sync.sql
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from config.supabase_config import get_supabase_client, Tables
+from models.database_models import GPUStatus
+from .metrics_service import metrics, observe_supabase
+
+GPU_CONFIG_SYNC_ROWS = metrics.counter('owl_gpu_config_sync_rows_total', 'GPU服务器配置同步的记录数', ('action',))
+
+# 由GPU监控维护的字段，配置同步不比较也不覆盖
+MONITOR_FIELDS = ('status',)
+
+
+def parse_gpu_servers(value: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """解析 GPU_SERVERS（JSON数组，每项必须有id），未设置时返回None"""
+    if not value or not value.strip():
+        return None
+    servers = json.loads(value)
+    if not isinstance(servers, list):
+        raise ValueError("GPU_SERVERS 必须是JSON数组")
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for server in servers:
+        if not isinstance(server, dict) or not server.get('id'):
+            raise ValueError(f"GPU服务器配置缺少id: {server}")
+        entry = {key: value for key, value in server.items() if key not in MONITOR_FIELDS}
+        by_id[str(server['id'])] = {**entry, 'id': str(server['id']), 'config_managed': True}
+    return list(by_id.values())
+
+
+def content_hash(record: Dict[str, Any], fields: List[str]) -> str:
+    """按指定字段计算内容摘要（字段顺序无关）"""
+    payload = {field: record.get(field) for field in sorted(fields)}
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def diff_servers(
+    configured: List[Dict[str, Any]],
+    existing: List[Dict[str, Any]],
+    now: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    比较配置与数据库记录
+
+    只比较配置中出现的字段，数据库中由监控写入的字段（状态、利用率等）不影响比较结果；
+    新增的服务器以 online 状态写入，曾因移出配置而离线、又重新加入配置的服务器恢复为 online，
+    被监控标记为离线的服务器保持原状态
+    """
+    now = now or datetime.now(timezone.utc).isoformat()
+    rows_by_id = {str(row['id']): row for row in existing}
+    changed = []
+    for server in configured:
+        row = rows_by_id.get(server['id'])
+        if row is None or row.get('config_removed_at'):
+            changed.append({**server, 'status': GPUStatus.ONLINE.value, 'config_removed_at': None})
+        elif content_hash(server, list(server)) != content_hash(row, list(server)):
+            changed.append(server)
+    configured_ids = {server['id'] for server in configured}
+    removed = [
+        server_id for server_id, row in rows_by_id.items()
+        if server_id not in configured_ids
+        and row.get('config_managed')
+        and not row.get('config_removed_at')
+    ]
+    return {
+        'changed': changed,
+        'removed': removed,
+        'removed_at': now,
+        'unchanged': len(configured) - len(changed)
+    }
+
+
+def _group_by_columns(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """按字段集合分组：批量upsert时缺失的列会被写成NULL，字段不同的记录分开写入"""
+    def columns(row):
+        return tuple(sorted(row))
+    return [list(group) for _, group in groupby(sorted(rows, key=columns), key=columns)]
+
+
+async def sync_gpu_servers_config(value: Optional[str] = None) -> Dict[str, Any]:
+    """
+    增量同步GPU服务器配置
+
+    返回 {'success', 'message', 'upserted', 'offline', 'unchanged'}
+    """
+    try:
+        configured = parse_gpu_servers(os.getenv('GPU_SERVERS') if value is None else value)
+    except ValueError as e:
+        return {'success': False, 'message': f"GPU_SERVERS 配置无效: {e}"}
+    if configured is None:
+        # 未配置时不能据此判断哪些服务器已移除，保持数据库现状
+        return {
+            'success': True,
+            'message': "未设置 GPU_SERVERS，跳过同步",
+            'upserted': 0,
+            'offline': 0,
+            'unchanged': 0
+        }
+
+    try:
+        client = get_supabase_client(use_service_role=True)
+        with observe_supabase(f'{Tables.GPU_SERVERS}.select'):
+            response = await asyncio.to_thread(
+                lambda: client.table(Tables.GPU_SERVERS).select('*').execute()
+            )
+        diff = diff_servers(configured, response.data or [])
+
+        # 变化的服务器按字段集合批量写入，未变化的不产生写操作
+        for rows in _group_by_columns(diff['changed']):
+            with observe_supabase(f'{Tables.GPU_SERVERS}.upsert'):
+                await asyncio.to_thread(
+                    lambda rows=rows: client.table(Tables.GPU_SERVERS).upsert(rows, on_conflict='id').execute()
+                )
+        if diff['removed']:
+            with observe_supabase(f'{Tables.GPU_SERVERS}.update'):
+                await asyncio.to_thread(
+                    lambda: client.table(Tables.GPU_SERVERS)
+                    .update({'status': GPUStatus.OFFLINE.value, 'config_removed_at': diff['removed_at']})
+                    .in_('id', diff['removed'])
+                    .execute()
+                )
+    except Exception as e:
+        logger.error(f"GPU服务器配置同步失败: {e}")
+        return {'success': False, 'message': str(e)}
+
+    GPU_CONFIG_SYNC_ROWS.inc(len(diff['changed']), action='upserted')
+    GPU_CONFIG_SYNC_ROWS.inc(len(diff['removed']), action='offline')
+    GPU_CONFIG_SYNC_ROWS.inc(diff['unchanged'], action='unchanged')
+    return {
+        'success': True,
+        'message': (
+            f"更新 {len(diff['changed'])} 台, 标记离线 {len(diff['removed'])} 台, "
+            f"未变化 {diff['unchanged']} 台"
+        ),
+        'upserted': len(diff['changed']),
+        'offline': len(diff['removed']),
+        'unchanged': diff['unchanged']
+    }
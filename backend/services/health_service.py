@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 依赖健康探测服务
+后台周期性探测Supabase、Redis与GPU集群，缓存延迟和最近成功时间，
+/ready 只读取缓存结果，负载均衡器的高频探测不会打到依赖服务
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from config.supabase_config import get_supabase_client, Tables
+from .metrics_service import metrics
+
+PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', '15'))
+PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', '5'))
+# 超过该时间未成功即视为不可用
+PROBE_STALE_AFTER = float(os.getenv('HEALTH_PROBE_STALE_AFTER', str(PROBE_INTERVAL * 3)))
+
+DEPENDENCY_UP = metrics.gauge('owl_dependency_up', '依赖服务是否可用', ('dependency',))
+DEPENDENCY_LATENCY = metrics.gauge('owl_dependency_probe_latency_seconds', '依赖服务探测延迟', ('dependency',))
+
+ProbeFunc = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class DependencyProbe:
+    """单个依赖的探测配置与最近结果"""
+
+    def __init__(self, name: str, func: ProbeFunc, required: bool = True):
+        self.name = name
+        self.func = func
+        self.required = required
+        self.status = 'unknown'
+        self.latency_ms: Optional[float] = None
+        self.last_checked: Optional[datetime] = None
+        self.last_success: Optional[datetime] = None
+        self._last_success_monotonic: Optional[float] = None
+        self.error: Optional[str] = None
+        self.details: Optional[Dict[str, Any]] = None
+
+    def is_healthy(self) -> bool:
+        if self.status != 'ok' or self._last_success_monotonic is None:
+            return False
+        return time.monotonic() - self._last_success_monotonic <= PROBE_STALE_AFTER
+
+    async def run(self):
+        """执行一次探测并更新结果"""
+        start = time.perf_counter()
+        try:
+            self.details = await asyncio.wait_for(self.func(), timeout=PROBE_TIMEOUT)
+            self.status = 'ok'
+            self.error = None
+            self.last_success = datetime.utcnow()
+            self._last_success_monotonic = time.monotonic()
+        except Exception as e:
+            self.status = 'error'
+            self.error = str(e) or type(e).__name__
+        finally:
+            latency = time.perf_counter() - start
+            self.latency_ms = round(latency * 1000, 2)
+            self.last_checked = datetime.utcnow()
+            DEPENDENCY_UP.set(1 if self.status == 'ok' else 0, dependency=self.name)
+            DEPENDENCY_LATENCY.set(latency, dependency=self.name)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'status': self.status if self.is_healthy() or self.status != 'ok' else 'stale',
+            'required': self.required,
+            'latency_ms': self.latency_ms,
+            'last_checked': self.last_checked,
+            'last_success': self.last_success,
+            'error': self.error,
+            'details': self.details
+        }
+
+
+class HealthProbeService:
+    """依赖健康探测服务"""
+
+    def __init__(self, interval: float = PROBE_INTERVAL):
+        self.interval = interval
+        self.probes: Dict[str, DependencyProbe] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, func: ProbeFunc, required: bool = True):
+        self.probes[name] = DependencyProbe(name, func, required)
+
+    async def probe_all(self):
+        """并发执行所有探测"""
+        await asyncio.gather(*(probe.run() for probe in self.probes.values()))
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.error(f"依赖健康探测异常: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """启动后台探测"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def is_ready(self) -> bool:
+        """所有必需依赖最近一次探测成功且未过期"""
+        return all(probe.is_healthy() for probe in self.probes.values() if probe.required)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: probe.to_dict() for name, probe in self.probes.items()}
+
+    def get_details(self, name: str) -> Optional[Dict[str, Any]]:
+        """读取某个依赖最近一次成功探测的附带信息"""
+        probe = self.probes.get(name)
+        return probe.details if probe else None
+
+
+# 探测函数
+async def probe_supabase() -> Dict[str, Any]:
+    """执行一次轻量查询"""
+    client = get_supabase_client()
+    await asyncio.to_thread(
+        lambda: client.table(Tables.USER_PROFILES).select('id').limit(1).execute()
+    )
+    return {}
+
+
+_redis_client = None
+
+
+async def probe_redis() -> Dict[str, Any]:
+    """PING Redis（复用同一个连接池）"""
+    global _redis_client
+    if _redis_client is None:
+        import redis.asyncio as redis_asyncio
+        _redis_client = redis_asyncio.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    await _redis_client.ping()
+    return {}
+
+
+async def probe_gpu_fleet() -> Dict[str, Any]:
+    """读取GPU集群状态，结果供指标采集复用"""
+    # 首次探测时再导入GPU监控服务，避免拖慢进程启动
+    from .gpu_monitor_service import gpu_monitor_service
+    servers: List[Dict[str, Any]] = await gpu_monitor_service.get_gpu_status()
+    online = sum(1 for server in servers if server.get('status') == 'online')
+    if servers and online == 0:
+        raise RuntimeError("没有在线的GPU服务器")
+    return {'total': len(servers), 'online': online, 'servers': servers}
+
+
+# 全局探测服务实例
+health_service = HealthProbeService()
+health_service.register('supabase', probe_supabase)
+health_service.register('gpu', probe_gpu_fleet)
+# 使用Redis作为共享状态后端时Redis为必需依赖
+if os.getenv('STATE_BACKEND', 'memory').lower() == 'redis':
+    health_service.register('redis', probe_redis)
+elif os.getenv('REDIS_URL'):
+    health_service.register('redis', probe_redis, required=False)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 平台请求调度
+所有对视频平台的请求（账号视频枚举、视频详情、视频下载）都经由同一个调度器：
+- 按平台限制并发请求数，每个平台复用一个HTTP会话（连接池）；
+  并发上限由进程内的信号量实现，按worker计算，多worker时整体并发为 worker数 × PLATFORM_CONCURRENCY
+- 按平台令牌桶限速，令牌桶存放在共享状态后端，所有任务和worker共用同一份请求额度
+- 被限流（429）或临时故障时指数退避重试，优先遵循平台返回的Retry-After
+"""
+
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from .metrics_service import metrics
+from .state_backend import TaskStore, task_store
+
+PLATFORM_REQUESTS = metrics.counter('owl_platform_requests_total', '平台请求次数', ('platform', 'result'))
+PLATFORM_WAIT = metrics.histogram(
+    'owl_platform_wait_seconds', '平台请求等待并发槽位与限速额度的时间', ('platform',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+def parse_platform_values(value: str) -> Dict[str, float]:
+    """解析 'douyin=4,bilibili=2.5'"""
+    values = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        platform, number = item.split('=', 1)
+        try:
+            values[platform.strip()] = float(number)
+        except ValueError:
+            continue
+    return values
+
+
+def parse_api_urls(value: str) -> Dict[str, str]:
+    """解析 'douyin=http://crawler:8080/douyin,bilibili=...'"""
+    urls = {}
+    for item in (value or '').split(','):
+        platform, _, url = item.partition('=')
+        if platform.strip() and url.strip():
+            urls[platform.strip()] = url.strip().rstrip('/')
+    return urls
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PlatformRequestError(Exception):
+    """平台请求重试后仍失败"""
+
+    def __init__(self, platform: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{platform} 请求失败: {message}")
+        self.platform = platform
+        self.status_code = status_code
+
+
+class PlatformFetcher:
+    """按平台调度请求"""
+
+    def __init__(
+        self,
+        api_urls: Optional[Dict[str, str]] = None,
+        concurrency: Optional[Dict[str, float]] = None,
+        rates: Optional[Dict[str, float]] = None,
+        default_concurrency: int = 4,
+        default_rate: float = 5.0,
+        burst: float = 5.0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 30.0,
+        store: Optional[TaskStore] = None
+    ):
+        self.api_urls = api_urls or {}
+        self.concurrency = concurrency or {}
+        self.rates = rates or {}
+        self.default_concurrency = default_concurrency
+        self.default_rate = default_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.store = store if store is not None else task_store
+
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._sessions: Dict[str, Any] = {}
+
+    def api_base(self, platform: str) -> Optional[str]:
+        """平台数据接口地址，未配置时返回None（使用模拟数据）"""
+        return self.api_urls.get(platform)
+
+    def _limit(self, platform: str) -> int:
+        return max(1, int(self.concurrency.get(platform, self.default_concurrency)))
+
+    def _semaphore(self, platform: str) -> asyncio.Semaphore:
+        if platform not in self._semaphores:
+            self._semaphores[platform] = asyncio.Semaphore(self._limit(platform))
+        return self._semaphores[platform]
+
+    def session(self, platform: str):
+        """每个平台复用一个HTTP会话，连接池大小与并发上限一致"""
+        if platform not in self._sessions:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._limit(platform))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._sessions[platform] = session
+        return self._sessions[platform]
+
+    async def _wait_for_rate(self, platform: str):
+        rate = self.rates.get(platform, self.default_rate)
+        if rate <= 0:
+            return
+        while True:
+            wait = await self.store.take_tokens(f'platform:{platform}', rate, max(1.0, self.burst))
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self, platform: str):
+        """占用一个并发槽位并取得一次请求额度"""
+        start = time.perf_counter()
+        async with self._semaphore(platform):
+            await self._wait_for_rate(platform)
+            PLATFORM_WAIT.observe(time.perf_counter() - start, platform=platform)
+            yield self.session(platform)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def call(self, platform: str, operation: Callable[[Any], Any]) -> Any:
+        """
+        在线程中执行 operation(session)，失败时退避重试
+
+        operation 应对非2xx响应调用 raise_for_status；429/5xx 与连接错误会重试，
+        其他HTTP错误直接抛出。每次重试都重新占用并发槽位和请求额度
+        """
+        import requests
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            status_code = None
+            try:
+                async with self.slot(platform) as session:
+                    result = await asyncio.to_thread(operation, session)
+                PLATFORM_REQUESTS.inc(platform=platform, result='ok')
+                return result
+            except requests.HTTPError as e:
+                response = e.response
+                status_code = response.status_code if response is not None else None
+                if status_code not in RETRYABLE_STATUS:
+                    PLATFORM_REQUESTS.inc(platform=platform, result='error')
+                    raise
+                retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            PLATFORM_REQUESTS.inc(platform=platform, result='throttled' if status_code == 429 else 'retry')
+            if attempt == self.max_retries:
+                PLATFORM_REQUESTS.inc(platform=platform, result='error')
+                raise PlatformRequestError(platform, str(error), status_code) from error
+            delay = self._backoff(attempt, retry_after)
+            logger.warning(f"{platform} 请求失败（{error}），{delay:.1f}秒后第{attempt + 1}次重试")
+            await asyncio.sleep(delay)
+
+    async def get_json(self, platform: str, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET请求并解析JSON"""
+        def operation(session):
+            response = session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        return await self.call(platform, operation)
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+# 全局平台请求调度器（PLATFORM_API_URLS 配置各平台的数据接口地址）
+platform_fetcher = PlatformFetcher(
+    api_urls=parse_api_urls(os.getenv('PLATFORM_API_URLS', '')),
+    concurrency=parse_platform_values(os.getenv('PLATFORM_CONCURRENCY', '')),
+    rates=parse_platform_values(os.getenv('PLATFORM_RATE_LIMITS', '')),
+    default_concurrency=int(os.getenv('PLATFORM_DEFAULT_CONCURRENCY', '4')),
+    default_rate=float(os.getenv('PLATFORM_DEFAULT_RATE', '5')),
+    burst=float(os.getenv('PLATFORM_RATE_BURST', '5')),
+    max_retries=int(os.getenv('PLATFORM_MAX_RETRIES', '4')),
+    backoff_base=float(os.getenv('PLATFORM_BACKOFF_BASE', '0.5')),
+    backoff_max=float(os.getenv('PLATFORM_BACKOFF_MAX', '30')),
+    timeout=float(os.getenv('PLATFORM_TIMEOUT', '30'))
+)
@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 视频预取服务
+在占用GPU之前完成视频下载与音频/关键帧抽取：
+- 分块流式写盘，下载经由平台请求调度器（共享平台并发、限速与重试）
+- 音频/关键帧抽取在进程池中执行，不占用事件循环；视频时长由抽取出的音频得到，供耗时预估按时长分桶
+- 按规范化视频ID去重，同一视频只下载一次（进程内合并等待，同机多worker之间用文件锁互斥）
+- 媒体地址只通过平台数据接口解析，下载前（包括每次重定向）校验协议、主机白名单与解析出的IP
+- 全部产物写完后才原子写入完成标记，只有带完成标记的产物会交给GPU阶段
+- 后台定期清理：超过保留时长未使用的产物删除，总大小超过上限时按最近使用时间淘汰；
+  任务被删除时一并删除其产物（最近仍被使用的产物保留）
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import ipaddress
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import uuid
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import IO, Any, Dict, Iterable, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+from loguru import logger
+
+from .metrics_service import metrics
+from .platform_fetcher import PlatformFetcher, platform_fetcher
+
+PREFETCH_TOTAL = metrics.counter('owl_prefetch_total', '视频预取次数', ('platform', 'result'))
+PREFETCH_BYTES = metrics.counter('owl_prefetch_bytes_total', '视频预取下载字节数', ('platform',))
+PREFETCH_EVICTIONS = metrics.counter('owl_prefetch_evictions_total', '预取产物清理数', ('reason',))
+PREFETCH_CACHE_BYTES = metrics.gauge('owl_prefetch_cache_bytes', '预取产物占用的磁盘空间')
+PREFETCH_DURATION = metrics.histogram(
+    'owl_prefetch_duration_seconds', '视频预取各阶段耗时', ('platform', 'stage'),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+MARKER_NAME = 'READY.json'
+LOCK_DIR = '.locks'
+MAX_REDIRECTS = 5
+
+# 各平台媒体CDN域名白名单（PREFETCH_MEDIA_HOSTS 覆盖，如 'douyin=douyinvod.com|douyincdn.com'）
+DEFAULT_MEDIA_HOSTS = {
+    'douyin': ['douyinvod.com', 'douyincdn.com', 'douyinstatic.com'],
+    'tiktok': ['tiktokcdn.com', 'tiktokcdn-us.com', 'tiktokv.com'],
+    'bilibili': ['bilivideo.com', 'bilivideo.cn', 'hdslb.com'],
+    'xiaohongshu': ['xhscdn.com', 'xhscdn.net'],
+}
+
+# 各平台视频页URL中的视频ID
+VIDEO_ID_PATTERNS = {
+    'douyin': re.compile(r'/(?:video|note)/(\d+)'),
+    'tiktok': re.compile(r'/video/(\d+)'),
+    'bilibili': re.compile(r'/video/(BV[0-9A-Za-z]+|av\d+)'),
+    'xiaohongshu': re.compile(r'/(?:explore|discovery/item)/([0-9a-f]+)'),
+}
+
+
+def canonical_video_id(url: str, platform: str) -> str:
+    """
+    规范化视频ID: '<平台>:<视频ID>'
+
+    无法识别ID时使用去掉查询参数后的URL摘要，分享链接的追踪参数不影响去重
+    """
+    pattern = VIDEO_ID_PATTERNS.get(platform)
+    match = pattern.search(url) if pattern else None
+    if match:
+        return f'{platform}:{match.group(1)}'
+    parts = urlsplit(url)
+    normalized = f'{parts.netloc.lower()}{parts.path.rstrip("/")}'
+    return f'{platform}:{hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]}'
+
+
+class UnsafeMediaURL(ValueError):
+    """媒体地址不在白名单内或指向内网地址"""
+
+
+def parse_media_hosts(value: str) -> Dict[str, List[str]]:
+    """解析 'douyin=douyinvod.com|douyincdn.com,bilibili=bilivideo.com'"""
+    hosts = dict(DEFAULT_MEDIA_HOSTS)
+    for item in (value or '').split(','):
+        platform, _, domains = item.partition('=')
+        if platform.strip() and domains.strip():
+            hosts[platform.strip()] = [domain.strip().lower() for domain in domains.split('|') if domain.strip()]
+    return hosts
+
+
+def validate_media_url(url: str, platform: str, allowed_hosts: Dict[str, List[str]]):
+    """
+    校验媒体地址：仅https、主机属于该平台白名单、解析出的所有IP都不是内网/回环/链路本地地址
+
+    在下载线程中调用（包含DNS解析）
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if parts.scheme != 'https' or not host:
+        raise UnsafeMediaURL(f"媒体地址必须是https: {url}")
+    domains = allowed_hosts.get(platform, [])
+    if not any(host == domain or host.endswith(f'.{domain}') for domain in domains):
+        raise UnsafeMediaURL(f"媒体主机不在 {platform} 白名单内: {host}")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror as e:
+        raise UnsafeMediaURL(f"无法解析媒体主机 {host}: {e}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if not ip.is_global:
+            raise UnsafeMediaURL(f"媒体主机 {host} 解析到非公网地址 {ip}")
+
+
+def extract_media(video_path: str, output_dir: str, frame_interval: float, ffmpeg: str = 'ffmpeg') -> Dict[str, Any]:
+    """
+    抽取16kHz单声道音频与关键帧（在进程池中执行）
+
+    产物先写到临时路径再原子替换，中途失败不会留下半成品
+    """
+    audio_path = os.path.join(output_dir, 'audio.wav')
+    frames_dir = os.path.join(output_dir, 'frames')
+
+    tmp_audio = os.path.join(output_dir, f'audio.{uuid.uuid4().hex}.tmp.wav')
+    subprocess.run(
+        [ffmpeg, '-y', '-loglevel', 'error', '-i', video_path, '-vn', '-ac', '1', '-ar', '16000', tmp_audio],
+        check=True, capture_output=True
+    )
+    os.replace(tmp_audio, audio_path)
+    with wave.open(audio_path, 'rb') as audio:
+        duration = audio.getnframes() / audio.getframerate()
+
+    tmp_frames = tempfile.mkdtemp(prefix='frames.', dir=output_dir)
+    try:
+        subprocess.run(
+            [ffmpeg, '-y', '-loglevel', 'error', '-i', video_path,
+             '-vf', f'fps=1/{frame_interval}', '-q:v', '3', os.path.join(tmp_frames, '%05d.jpg')],
+            check=True, capture_output=True
+        )
+        if os.path.isdir(frames_dir):
+            shutil.rmtree(frames_dir)
+        os.replace(tmp_frames, frames_dir)
+    finally:
+        if os.path.isdir(tmp_frames):
+            shutil.rmtree(tmp_frames, ignore_errors=True)
+
+    return {
+        'audio_path': audio_path,
+        'duration': duration,
+        'frames_dir': frames_dir,
+        'frame_count': len(os.listdir(frames_dir))
+    }
+
+
+def _directory_size(directory: str) -> int:
+    size = 0
+    for path, _, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(path, name)).st_size
+            except FileNotFoundError:
+                continue
+    return size
+
+
+def _write_marker(directory: str, manifest: Dict[str, Any]):
+    """原子写入完成标记"""
+    tmp_path = os.path.join(directory, f'{MARKER_NAME}.{uuid.uuid4().hex}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(directory, MARKER_NAME))
+
+
+class VideoPrefetcher:
+    """视频预取器"""
+
+    def __init__(
+        self,
+        root: str,
+        enabled: bool = False,
+        fetcher: Optional[PlatformFetcher] = None,
+        media_hosts: Optional[Dict[str, List[str]]] = None,
+        extract_workers: int = 2,
+        chunk_size: int = 1024 * 1024,
+        timeout: float = 60.0,
+        max_bytes: int = 2 * 1024 ** 3,
+        frame_interval: float = 5.0,
+        ffmpeg: str = 'ffmpeg',
+        cache_ttl: float = 86400.0,
+        cache_max_bytes: int = 20 * 1024 ** 3,
+        cache_min_age: float = 3600.0,
+        sweep_interval: float = 600.0,
+        lock_poll_interval: float = 0.5
+    ):
+        self.root = root
+        self.enabled = enabled
+        self.fetcher = fetcher if fetcher is not None else platform_fetcher
+        self.media_hosts = media_hosts if media_hosts is not None else dict(DEFAULT_MEDIA_HOSTS)
+        self.extract_workers = max(1, extract_workers)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.frame_interval = frame_interval
+        self.ffmpeg = ffmpeg
+        # 超过cache_ttl秒未使用的产物被删除；总大小超过cache_max_bytes时从最久未使用的开始淘汰，
+        # 但cache_min_age秒内使用过的产物（可能仍在等待GPU）不淘汰
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_min_age = cache_min_age
+        self.sweep_interval = sweep_interval
+        self.lock_poll_interval = lock_poll_interval
+
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def artifact_dir(self, video_id: str) -> str:
+        platform, _, key = video_id.partition(':')
+        return os.path.join(self.root, platform, key)
+
+    def _lock_path(self, video_id: str) -> str:
+        platform, _, key = video_id.partition(':')
+        return os.path.join(self.root, LOCK_DIR, f'{platform}.{key}.lock')
+
+    def _try_lock(self, video_id: str) -> Optional[IO]:
+        """非阻塞获取产物的排他锁（同机各worker的下载与清理互斥），已被占用时返回None"""
+        path = self._lock_path(video_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # 加锁前锁文件可能已被清理删除，此时持有的是旧文件上的锁
+            if os.fstat(handle.fileno()).st_ino != os.stat(path).st_ino:
+                raise BlockingIOError
+        except (BlockingIOError, FileNotFoundError):
+            handle.close()
+            return None
+        return handle
+
+    def _touch(self, video_id: str):
+        """以完成标记的修改时间作为最近使用时间"""
+        try:
+            os.utime(os.path.join(self.artifact_dir(video_id), MARKER_NAME))
+        except FileNotFoundError:
+            pass
+
+    def load_manifest(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """读取已完成产物的清单（无完成标记即视为未完成）"""
+        try:
+            with open(os.path.join(self.artifact_dir(video_id), MARKER_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.extract_workers)
+        return self._executor
+
+    async def resolve_media_url(self, url: str, platform: str) -> str:
+        """通过平台数据接口解析视频页对应的媒体文件地址（不接受客户端提供的地址）"""
+        base = self.fetcher.api_base(platform)
+        if base is None:
+            raise ValueError(f"未配置 {platform} 平台数据接口，无法解析视频地址")
+        detail = await self.fetcher.get_json(platform, f'{base}/media', params={'video_url': url})
+        media_url = (detail or {}).get('media_url')
+        if not media_url:
+            raise ValueError(f"平台数据接口未返回视频地址: {url}")
+        return media_url
+
+    async def prefetch(self, url: str, platform: str) -> Dict[str, Any]:
+        """
+        预取视频并返回产物清单
+
+        同一视频已完成时直接返回；正在预取时等待同一次预取的结果
+        """
+        video_id = canonical_video_id(url, platform)
+        manifest = self.load_manifest(video_id)
+        if manifest is not None:
+            self._touch(video_id)
+            PREFETCH_TOTAL.inc(platform=platform, result='hit')
+            return manifest
+
+        inflight = self._inflight.get(video_id)
+        if inflight is not None:
+            PREFETCH_TOTAL.inc(platform=platform, result='deduped')
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        # 没有其他等待者时也取走异常，避免未读取异常的警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[video_id] = future
+        try:
+            manifest, result = await self._fetch_locked(video_id, url, platform)
+            future.set_result(manifest)
+            PREFETCH_TOTAL.inc(platform=platform, result=result)
+            return manifest
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            PREFETCH_TOTAL.inc(platform=platform, result='failed')
+            raise
+        finally:
+            self._inflight.pop(video_id, None)
+
+    async def _fetch_locked(self, video_id: str, url: str, platform: str):
+        """持有产物锁下载；同机其他worker正在下载同一视频时等待其完成，返回(清单, 结果)"""
+        while True:
+            lock = self._try_lock(video_id)
+            if lock is not None:
+                break
+            await asyncio.sleep(self.lock_poll_interval)
+            manifest = self.load_manifest(video_id)
+            if manifest is not None:
+                self._touch(video_id)
+                return manifest, 'deduped'
+        try:
+            manifest = self.load_manifest(video_id)
+            if manifest is not None:
+                self._touch(video_id)
+                return manifest, 'deduped'
+            media_url = await self.resolve_media_url(url, platform)
+            return await self._fetch(video_id, media_url, platform), 'downloaded'
+        finally:
+            lock.close()
+
+    def _open(self, session, url: str, platform: str):
+        """手动跟随重定向，每一跳都重新校验地址"""
+        for _ in range(MAX_REDIRECTS + 1):
+            validate_media_url(url, platform, self.media_hosts)
+            response = session.get(url, stream=True, timeout=self.timeout, allow_redirects=False)
+            if not response.is_redirect:
+                return response
+            url = urljoin(url, response.headers['Location'])
+            response.close()
+        raise UnsafeMediaURL(f"媒体地址重定向次数过多: {url}")
+
+    def _download(self, session, url: str, platform: str, path: str) -> int:
+        """分块流式下载到临时文件，完成后原子改名（失败重试时从头下载）"""
+        tmp_path = f'{path}.{uuid.uuid4().hex}.part'
+        size = 0
+        try:
+            with self._open(session, url, platform) as response:
+                response.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if not chunk:
+                            continue
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise ValueError(f"视频超过大小上限 {self.max_bytes} 字节")
+                        f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            return size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _fetch(self, video_id: str, url: str, platform: str) -> Dict[str, Any]:
+        directory = self.artifact_dir(video_id)
+        os.makedirs(directory, exist_ok=True)
+        video_path = os.path.join(directory, 'video.mp4')
+
+        # 下载占用平台请求槽位与限速额度；抽取阶段只受进程池大小限制，不占用平台槽位
+        start = time.perf_counter()
+        size = await self.fetcher.call(platform, lambda session: self._download(session, url, platform, video_path))
+        PREFETCH_DURATION.observe(time.perf_counter() - start, platform=platform, stage='download')
+        PREFETCH_BYTES.inc(size, platform=platform)
+
+        start = time.perf_counter()
+        extracted = await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), extract_media, video_path, directory, self.frame_interval, self.ffmpeg
+        )
+        PREFETCH_DURATION.observe(time.perf_counter() - start, platform=platform, stage='extract')
+
+        manifest = {
+            'video_id': video_id,
+            'platform': platform,
+            'video_path': video_path,
+            'size_bytes': size,
+            **extracted,
+            'created_at': datetime.utcnow().isoformat()
+        }
+        await asyncio.to_thread(_write_marker, directory, manifest)
+        logger.info(f"视频预取完成 {video_id}: {size} 字节, {extracted['frame_count']} 帧")
+        return manifest
+
+    def _remove(self, video_id: str) -> bool:
+        """删除产物目录（正在下载或被其他worker清理中时跳过）"""
+        lock = self._try_lock(video_id)
+        if lock is None:
+            return False
+        try:
+            shutil.rmtree(self.artifact_dir(video_id), ignore_errors=True)
+            # 持有锁时删除锁文件，等待者重新加锁时会发现锁文件已更换
+            os.remove(self._lock_path(video_id))
+        finally:
+            lock.close()
+        return True
+
+    def _last_used(self, directory: str) -> float:
+        try:
+            return os.stat(os.path.join(directory, MARKER_NAME)).st_mtime
+        except FileNotFoundError:
+            # 未完成的产物（如进程崩溃时遗留）按目录修改时间计算
+            return os.stat(directory).st_mtime
+
+    def remove_artifacts(self, video_ids: Iterable[str]) -> int:
+        """任务删除后删除其产物，其他任务最近仍在使用的产物保留，返回删除数"""
+        now = time.time()
+        removed = 0
+        for video_id in set(video_ids):
+            directory = self.artifact_dir(video_id)
+            try:
+                if now - self._last_used(directory) < self.cache_min_age:
+                    continue
+            except FileNotFoundError:
+                continue
+            if self._remove(video_id):
+                removed += 1
+        if removed:
+            PREFETCH_EVICTIONS.inc(removed, reason='deleted')
+        return removed
+
+    def sweep(self) -> Dict[str, int]:
+        """清理过期产物并按最近使用时间淘汰到大小上限以内"""
+        now = time.time()
+        entries = []
+        if os.path.isdir(self.root):
+            for platform in os.listdir(self.root):
+                platform_dir = os.path.join(self.root, platform)
+                if platform == LOCK_DIR or not os.path.isdir(platform_dir):
+                    continue
+                for key in os.listdir(platform_dir):
+                    directory = os.path.join(platform_dir, key)
+                    try:
+                        entries.append((self._last_used(directory), _directory_size(directory), f'{platform}:{key}'))
+                    except FileNotFoundError:
+                        continue
+        entries.sort()
+
+        stats = {'expired': 0, 'evicted': 0, 'freed_bytes': 0}
+        total = sum(size for _, size, _ in entries)
+        for last_used, size, video_id in entries:
+            if now - last_used >= self.cache_ttl:
+                reason = 'expired'
+            elif total > self.cache_max_bytes and now - last_used >= self.cache_min_age:
+                reason = 'evicted'
+            else:
+                continue
+            if self._remove(video_id):
+                stats[reason] += 1
+                stats['freed_bytes'] += size
+                total -= size
+                PREFETCH_EVICTIONS.inc(reason=reason)
+        PREFETCH_CACHE_BYTES.set(total)
+        if stats['expired'] or stats['evicted']:
+            logger.info(f"预取产物清理: {stats}")
+        return stats
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"预取产物清理失败: {e}")
+
+    def start(self):
+        """启动后台清理（未启用预取或PREFETCH_SWEEP_INTERVAL=0时不启动）"""
+        if not self.enabled or self.sweep_interval <= 0:
+            return
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局预取器（PREFETCH_ENABLED=true 时分析任务先预取再进入GPU调度队列）
+video_prefetcher = VideoPrefetcher(
+    root=os.getenv('PREFETCH_DIR', 'cache/videos'),
+    enabled=os.getenv('PREFETCH_ENABLED', 'false').lower() == 'true',
+    media_hosts=parse_media_hosts(os.getenv('PREFETCH_MEDIA_HOSTS', '')),
+    extract_workers=int(os.getenv('PREFETCH_EXTRACT_WORKERS', str(max(1, (os.cpu_count() or 2) // 2)))),
+    chunk_size=int(os.getenv('PREFETCH_CHUNK_SIZE', str(1024 * 1024))),
+    timeout=float(os.getenv('PREFETCH_TIMEOUT', '60')),
+    max_bytes=int(os.getenv('PREFETCH_MAX_BYTES', str(2 * 1024 ** 3))),
+    frame_interval=float(os.getenv('PREFETCH_FRAME_INTERVAL', '5')),
+    ffmpeg=os.getenv('FFMPEG_BINARY', 'ffmpeg'),
+    cache_ttl=float(os.getenv('PREFETCH_CACHE_TTL', '86400')),
+    cache_max_bytes=int(os.getenv('PREFETCH_CACHE_MAX_BYTES', str(20 * 1024 ** 3))),
+    cache_min_age=float(os.getenv('PREFETCH_CACHE_MIN_AGE', '3600')),
+    sweep_interval=float(os.getenv('PREFETCH_SWEEP_INTERVAL', '600'))
+)
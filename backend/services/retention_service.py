@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 分析任务保留策略
+按任务状态和类型配置保留时长，后台定期批量清理过期任务，
+可选先归档到冷存储（Supabase analysis_results 表或本地gzip JSONL文件）；
+同时提供管理员按条件批量删除
+"""
+
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from config.supabase_config import get_supabase_client, Tables
+from .metrics_service import metrics, observe_supabase
+from .state_backend import TaskStore, dump_task, task_store
+
+RETENTION_EVICTIONS = metrics.counter(
+    'owl_retention_evicted_tasks_total', '保留策略清理的任务数', ('reason', 'status', 'archived')
+)
+
+# 未结束的任务不参与清理和批量删除（interrupted/requeued 任务等待重新入队或接管，同样视为未结束）
+ACTIVE_STATUSES = ('pending', 'processing', 'interrupted', 'requeued')
+
+DEFAULT_TTLS = 'completed=7d,failed=3d'
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """解析 '30d' / '12h' / '90m' / '3600' 为秒数，'0' 或 'never' 表示永久保留"""
+    value = value.strip().lower()
+    if value in ('', '0', 'never'):
+        return None
+    unit = _UNITS.get(value[-1])
+    if unit is None:
+        return float(value)
+    return float(value[:-1]) * unit
+
+
+class RetentionPolicy:
+    """
+    保留时长配置
+
+    格式: 'completed=7d,failed=3d,complete_account:completed=30d'，
+    '类型:状态' 优先于只按状态的配置
+    """
+
+    def __init__(self, spec: str = DEFAULT_TTLS):
+        self.ttls: Dict[str, Optional[float]] = {}
+        for item in spec.split(','):
+            if '=' not in item:
+                continue
+            key, value = item.split('=', 1)
+            try:
+                self.ttls[key.strip()] = parse_duration(value)
+            except ValueError:
+                logger.warning(f"忽略无效的保留时长配置: {item}")
+
+    def ttl_for(self, task_type: str, status: str) -> Optional[float]:
+        key = f'{task_type}:{status}'
+        if key in self.ttls:
+            return self.ttls[key]
+        return self.ttls.get(status)
+
+    def statuses(self) -> List[str]:
+        """配置了保留时长的状态"""
+        statuses = {key.split(':')[-1] for key, ttl in self.ttls.items() if ttl}
+        return sorted(status for status in statuses if status not in ACTIVE_STATUSES)
+
+    def min_ttl(self, status: str) -> Optional[float]:
+        """该状态下最短的保留时长（用于按创建时间预筛选）"""
+        ttls = [ttl for key, ttl in self.ttls.items() if ttl and key.split(':')[-1] == status]
+        return min(ttls) if ttls else None
+
+    def is_expired(self, task: Dict[str, Any], now: datetime) -> bool:
+        ttl = self.ttl_for(task['type'], task['status'])
+        if not ttl:
+            return False
+        reference = task.get('completed_at') or task['created_at']
+        return now - reference >= timedelta(seconds=ttl)
+
+
+class SupabaseArchive:
+    """归档到 analysis_results 表"""
+
+    name = 'supabase'
+
+    async def write(self, tasks: List[Dict[str, Any]]):
+        archived_at = datetime.utcnow().isoformat()
+        rows = [{
+            'task_id': task['task_id'],
+            'user_id': task['user_id'],
+            'type': task['type'],
+            'status': task['status'],
+            'payload': json.loads(dump_task(task)),
+            'archived_at': archived_at
+        } for task in tasks]
+        client = get_supabase_client(use_service_role=True)
+        with observe_supabase(f'{Tables.ANALYSIS_RESULTS}.upsert'):
+            await asyncio.to_thread(
+                lambda: client.table(Tables.ANALYSIS_RESULTS).upsert(rows, on_conflict='task_id').execute()
+            )
+
+
+class FileArchive:
+    """按天追加写入gzip压缩的JSONL文件"""
+
+    name = 'file'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _append(self, tasks: List[Dict[str, Any]]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"analysis_tasks-{datetime.utcnow():%Y%m%d}.jsonl.gz")
+        with gzip.open(path, 'ab') as f:
+            f.write(b''.join(dump_task(task) + b'\n' for task in tasks))
+
+    async def write(self, tasks: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._append, tasks)
+
+
+def create_archive(kind: str):
+    """按 RETENTION_ARCHIVE 创建归档目标（none | supabase | file）"""
+    kind = (kind or 'none').lower()
+    if kind == 'supabase':
+        return SupabaseArchive()
+    if kind == 'file':
+        return FileArchive(os.getenv('RETENTION_ARCHIVE_DIR', 'archive'))
+    return None
+
+
+class RetentionService:
+    """过期任务后台清理"""
+
+    def __init__(
+        self,
+        policy: RetentionPolicy,
+        store: Optional[TaskStore] = None,
+        archive=None,
+        interval: float = 600.0,
+        batch_size: int = 500
+    ):
+        self.policy = policy
+        self.store = store if store is not None else task_store
+        self.archive = archive
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List = []
+
+    def add_listener(self, listener):
+        """注册任务被清理后的回调（参数为被删除的任务列表，如同步更新搜索索引）"""
+        self._listeners.append(listener)
+
+    async def _evict(self, tasks: List[Dict[str, Any]], reason: str, archive: bool) -> int:
+        """（可选归档后）批量删除任务，归档失败时保留该批任务"""
+        # 扫描后任务可能已被重新执行，删除时再次确认状态仍是扫描时的状态
+        statuses = {task['status'] for task in tasks}
+        archived = archive and self.archive is not None
+        if archived:
+            try:
+                await self.archive.write(tasks)
+            except Exception as e:
+                logger.error(f"任务归档失败（{self.archive.name}，{len(tasks)}个），本批暂不删除: {e}")
+                return 0
+        deleted = await self.store.delete_many((task['task_id'] for task in tasks), statuses=statuses)
+        for task in deleted:
+            RETENTION_EVICTIONS.inc(reason=reason, status=task['status'], archived=str(archived).lower())
+        for listener in self._listeners:
+            try:
+                result = listener(deleted)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"任务清理回调执行失败: {e}")
+        return len(deleted)
+
+    async def sweep(self) -> Dict[str, int]:
+        """清理一轮过期任务，返回各状态清理数量"""
+        now = datetime.utcnow()
+        evicted: Dict[str, int] = {}
+        for status in self.policy.statuses():
+            min_ttl = self.policy.min_ttl(status)
+            # 完成时间不早于创建时间，创建时间未超过最短保留时长的任务一定未过期
+            cutoff = now - timedelta(seconds=min_ttl)
+            count = 0
+            async for batch in self.store.scan(status=status, created_before=cutoff, batch_size=self.batch_size):
+                expired = [task for task in batch if self.policy.is_expired(task, now)]
+                if expired:
+                    count += await self._evict(expired, 'ttl', archive=True)
+            if count:
+                evicted[status] = count
+        if evicted:
+            logger.info(f"保留策略清理过期任务: {evicted}")
+        return evicted
+
+    async def delete_matching(
+        self,
+        status: Optional[str] = None,
+        task_type: Optional[str] = None,
+        user_id: Optional[str] = None,
+        created_before: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        archive: bool = False
+    ) -> int:
+        """按条件批量删除已结束的任务，返回删除数量"""
+        if status in ACTIVE_STATUSES:
+            raise ValueError("不能批量删除未结束的任务")
+        if limit is not None and limit <= 0:
+            raise ValueError("limit 必须为正整数")
+        if archive and self.archive is None:
+            # 要求归档却没有归档目标时不能静默地直接删除
+            raise ValueError("未配置归档目标（RETENTION_ARCHIVE），无法归档后删除")
+        deleted = 0
+        async for batch in self.store.scan(
+            status=status, user_id=user_id, created_before=created_before, batch_size=self.batch_size
+        ):
+            matched = [
+                task for task in batch
+                if task['status'] not in ACTIVE_STATUSES
+                and (task_type is None or task['type'] == task_type)
+            ]
+            if limit is not None:
+                matched = matched[:limit - deleted]
+            if matched:
+                deleted += await self._evict(matched, 'admin', archive=archive)
+            if limit is not None and deleted >= limit:
+                break
+        return deleted
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # 多worker时每个周期只由一个worker执行清理
+                if await self.store.acquire_lock('retention_sweep', self.interval * 0.9):
+                    await self.sweep()
+            except Exception as e:
+                logger.error(f"保留策略清理失败: {e}")
+
+    def start(self):
+        """启动后台清理"""
+        if self.interval <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# 全局保留策略服务（RETENTION_SWEEP_INTERVAL=0 时关闭后台清理）
+retention_service = RetentionService(
+    RetentionPolicy(os.getenv('RETENTION_TTLS', DEFAULT_TTLS)),
+    archive=create_archive(os.getenv('RETENTION_ARCHIVE', 'none')),
+    interval=float(os.getenv('RETENTION_SWEEP_INTERVAL', '600')),
+    batch_size=int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+)
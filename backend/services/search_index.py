@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 分析结果搜索索引
+任务完成时增量写入的进程内倒排索引，支持按关键词、主题、平台、时间范围检索，
+BM25排序并分页；索引变更追加写入磁盘日志，重启后重放恢复，
+多个worker共享同一日志文件，检索前读取其他worker追加的变更；
+首次启用时由一个worker把已完成的历史任务补写进索引
+"""
+
+import fcntl
+import math
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from .state_backend import dump_task, load_task
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 字段权重：关键词/主题命中比正文更重要
+FIELD_WEIGHTS = {'title': 2.0, 'keywords': 3.0, 'topics': 3.0, 'text': 1.0}
+
+_ASCII_WORD = re.compile(r'[a-z0-9]+')
+_CJK_RUN = re.compile(r'[一-鿿]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """英文/数字按单词切分，中文按相邻字二元组切分（单字词保留单字）"""
+    text = (text or '').lower()
+    tokens = _ASCII_WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _normalize_tag(value: str) -> str:
+    return str(value).strip().lower()
+
+
+def extract_document(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """从已完成任务的结果中提取索引字段"""
+    result = task.get('result') or {}
+    if not result:
+        return None
+    analysis = result.get('analysis') or {}
+    content_analysis = result.get('content_analysis') or {}
+    video_info = result.get('video_info') or {}
+    account_info = result.get('account_info') or {}
+    transcript = result.get('transcript') or {}
+    topics = list(analysis.get('topics') or []) + list(content_analysis.get('main_topics') or [])
+    return {
+        'task_id': task['task_id'],
+        'user_id': task['user_id'],
+        'type': task['type'],
+        'platform': task.get('platform'),
+        'created_at': task['created_at'],
+        'title': video_info.get('title') or account_info.get('username') or '',
+        'keywords': list(analysis.get('keywords') or []),
+        'topics': list(dict.fromkeys(topics)),
+        'text': ' '.join(filter(None, [transcript.get('text'), analysis.get('summary')]))
+    }
+
+
+class _Doc:
+    __slots__ = ('task_id', 'user_id', 'type', 'platform', 'created_at', 'title',
+                 'keywords', 'topics', 'terms', 'length')
+
+    def __init__(self, fields: Dict[str, Any]):
+        self.task_id = fields['task_id']
+        self.user_id = fields['user_id']
+        self.type = fields['type']
+        self.platform = fields.get('platform')
+        self.created_at = fields['created_at']
+        self.title = fields.get('title') or ''
+        self.keywords = fields.get('keywords') or []
+        self.topics = fields.get('topics') or []
+        # 压缩后的快照直接保存词频，不再保留原文
+        terms = fields.get('terms')
+        if terms is None:
+            terms = {}
+            for field, weight in FIELD_WEIGHTS.items():
+                value = fields.get(field)
+                for item in (value if isinstance(value, list) else [value]):
+                    for token in tokenize(item):
+                        terms[token] = terms.get(token, 0.0) + weight
+        self.terms: Dict[str, float] = terms
+        self.length = sum(terms.values())
+
+    def to_result(self, score: float) -> Dict[str, Any]:
+        return {
+            'task_id': self.task_id,
+            'type': self.type,
+            'platform': self.platform,
+            'created_at': self.created_at,
+            'title': self.title,
+            'keywords': self.keywords,
+            'topics': self.topics,
+            'score': round(score, 4)
+        }
+
+
+class SearchIndex:
+    """增量倒排索引"""
+
+    def __init__(self, path: str, compact_ratio: float = 2.0):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._docs: Dict[int, _Doc] = {}
+        self._ids: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._keywords: Dict[str, Set[int]] = {}
+        self._topics: Dict[str, Set[int]] = {}
+        self._by_user: Dict[str, Set[int]] = {}
+        self._next_id = 0
+        self._total_length = 0.0
+        self._loaded = False
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._log_entries = 0
+        self.backfilled = False
+
+    # ---- 内存索引 ----
+    def _apply_add(self, fields: Dict[str, Any]):
+        self._apply_remove(fields['task_id'])
+        doc = _Doc(fields)
+        doc_id = self._next_id
+        self._next_id += 1
+        self._docs[doc_id] = doc
+        self._ids[doc.task_id] = doc_id
+        self._total_length += doc.length
+        for term, tf in doc.terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        for keyword in doc.keywords:
+            self._keywords.setdefault(_normalize_tag(keyword), set()).add(doc_id)
+        for topic in doc.topics:
+            self._topics.setdefault(_normalize_tag(topic), set()).add(doc_id)
+        self._by_user.setdefault(doc.user_id, set()).add(doc_id)
+
+    def _apply_remove(self, task_id: str):
+        doc_id = self._ids.pop(task_id, None)
+        if doc_id is None:
+            return
+        doc = self._docs.pop(doc_id)
+        self._total_length -= doc.length
+        for term in doc.terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        for index, tags in ((self._keywords, doc.keywords), (self._topics, doc.topics)):
+            for tag in tags:
+                ids = index.get(_normalize_tag(tag))
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del index[_normalize_tag(tag)]
+        owned = self._by_user.get(doc.user_id)
+        if owned is not None:
+            owned.discard(doc_id)
+            if not owned:
+                del self._by_user[doc.user_id]
+
+    def _reset(self):
+        self._docs.clear()
+        self._ids.clear()
+        self._postings.clear()
+        self._keywords.clear()
+        self._topics.clear()
+        self._by_user.clear()
+        self._total_length = 0.0
+        self._offset = 0
+        self._log_entries = 0
+        self.backfilled = False
+
+    # ---- 磁盘日志 ----
+    @staticmethod
+    def _encode(entry: Dict[str, Any]) -> bytes:
+        return dump_task(entry) + b'\n'
+
+    def _apply_entry(self, entry: Dict[str, Any]):
+        if entry.get('op') == 'add':
+            self._apply_add(load_task(entry['doc']))
+        elif entry.get('op') == 'remove':
+            self._apply_remove(entry['task_id'])
+        elif entry.get('op') == 'backfilled':
+            self.backfilled = True
+        self._log_entries += 1
+
+    def _lock_file(self, exclusive: bool):
+        """日志读写锁：读取用共享锁，追加与压缩重写用排他锁"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handle = open(f'{self.path}.lock', 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return handle
+
+    def _catch_up(self):
+        """读取日志中尚未应用的变更（包括其他worker追加的）"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self._inode is not None and stat.st_ino != self._inode:
+            # 日志已被其他worker压缩重写，重新加载
+            self._reset()
+        elif stat.st_size <= self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            f.seek(self._offset)
+            while True:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    # 不完整的行（其他worker正在写入），下次再读
+                    break
+                self._offset += len(line)
+                try:
+                    self._apply_entry(load_task(line))
+                except Exception as e:
+                    logger.warning(f"跳过损坏的索引日志行: {e}")
+
+    def _append(self, entries: List[Dict[str, Any]]):
+        # 排他锁覆盖追上变更、写入和偏移更新：其他worker不会在两者之间追加，
+        # 写入后的文件末尾就是本worker已应用到的位置
+        handle = self._lock_file(exclusive=True)
+        try:
+            self._catch_up()
+            data = b''.join(self._encode(entry) for entry in entries)
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                self._offset = f.tell()
+                self._inode = os.fstat(f.fileno()).st_ino
+            for entry in entries:
+                self._apply_entry(entry)
+        finally:
+            handle.close()
+        if self._log_entries > max(1000, len(self._docs) * self.compact_ratio):
+            self.compact()
+
+    def compact(self):
+        """把日志重写为当前文档快照"""
+        with self._lock:
+            handle = self._lock_file(exclusive=True)
+            try:
+                self._catch_up()
+                tmp_path = f'{self.path}.compact.tmp'
+                with open(tmp_path, 'wb') as f:
+                    for doc in self._docs.values():
+                        f.write(self._encode({'op': 'add', 'doc': {
+                            'task_id': doc.task_id, 'user_id': doc.user_id, 'type': doc.type,
+                            'platform': doc.platform, 'created_at': doc.created_at, 'title': doc.title,
+                            'keywords': doc.keywords, 'topics': doc.topics,
+                            'terms': doc.terms
+                        }}))
+                    if self.backfilled:
+                        f.write(self._encode({'op': 'backfilled'}))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                stat = os.stat(self.path)
+                self._inode = stat.st_ino
+                self._offset = stat.st_size
+                self._log_entries = len(self._docs)
+            finally:
+                handle.close()
+        logger.info(f"搜索索引日志已压缩: {len(self._docs)} 个文档")
+
+    def ensure_loaded(self):
+        with self._lock:
+            if not self._loaded:
+                handle = self._lock_file(exclusive=False)
+                try:
+                    self._catch_up()
+                finally:
+                    handle.close()
+                self._loaded = True
+                logger.info(f"搜索索引已加载: {len(self._docs)} 个文档")
+
+    # ---- 对外接口 ----
+    def add_task(self, task: Dict[str, Any]):
+        """索引已完成的任务（重复索引同一任务会替换旧文档）"""
+        self.add_tasks([task])
+
+    def add_tasks(self, tasks: Iterable[Dict[str, Any]], skip_indexed: bool = False):
+        """批量索引任务，一次追加写入；skip_indexed时跳过已在索引中的任务"""
+        with self._lock:
+            self.ensure_loaded()
+            entries = []
+            for task in tasks:
+                if skip_indexed and task['task_id'] in self._ids:
+                    continue
+                fields = extract_document(task)
+                if fields is not None:
+                    entries.append({'op': 'add', 'doc': fields})
+            if entries:
+                self._append(entries)
+
+    def mark_backfilled(self):
+        """记录历史任务已补写完成，之后启动的worker不再重复补写"""
+        with self._lock:
+            self.ensure_loaded()
+            if not self.backfilled:
+                self._append([{'op': 'backfilled'}])
+
+    def remove_tasks(self, task_ids: Iterable[str]):
+        with self._lock:
+            self.ensure_loaded()
+            entries = [{'op': 'remove', 'task_id': task_id} for task_id in task_ids if task_id in self._ids]
+            if entries:
+                self._append(entries)
+
+    def refresh(self):
+        """读取其他worker追加的变更"""
+        with self._lock:
+            self.ensure_loaded()
+            handle = self._lock_file(exclusive=False)
+            try:
+                self._catch_up()
+            finally:
+                handle.close()
+
+    def _bm25(self, terms: List[str], candidates: Optional[Set[int]]) -> Dict[int, float]:
+        total_docs = len(self._docs)
+        avg_length = self._total_length / total_docs if total_docs else 1.0
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                length = self._docs[doc_id].length
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        return scores
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        user_id: Optional[str] = None,
+        keyword: Optional[str] = None,
+        topic: Optional[str] = None,
+        platform: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        offset: int = 0,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        检索任务，返回(当前页结果, 匹配总数)
+
+        有查询词时按BM25得分排序，否则按创建时间倒序
+        """
+        self.refresh()
+        with self._lock:
+            # 先用精确过滤条件缩小候选集
+            candidates: Optional[Set[int]] = None
+            for ids in (
+                self._by_user.get(user_id, set()) if user_id is not None else None,
+                self._keywords.get(_normalize_tag(keyword), set()) if keyword else None,
+                self._topics.get(_normalize_tag(topic), set()) if topic else None,
+            ):
+                if ids is not None:
+                    candidates = set(ids) if candidates is None else candidates & ids
+
+            terms = tokenize(query) if query else []
+            if terms:
+                scored = self._bm25(terms, candidates)
+            else:
+                scored = {doc_id: 0.0 for doc_id in (candidates if candidates is not None else self._docs)}
+
+            matched = []
+            for doc_id, score in scored.items():
+                doc = self._docs[doc_id]
+                if platform and doc.platform != platform:
+                    continue
+                if date_from and doc.created_at < date_from:
+                    continue
+                if date_to and doc.created_at > date_to:
+                    continue
+                matched.append((score, doc.created_at, doc))
+
+            matched.sort(key=lambda item: (item[0], item[1]), reverse=True)
+            page = matched[offset:offset + limit]
+            return [doc.to_result(score) for score, _, doc in page], len(matched)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+# 全局搜索索引实例
+search_index = SearchIndex(
+    path=os.getenv('SEARCH_INDEX_PATH', 'cache/search_index.log'),
+    compact_ratio=float(os.getenv('SEARCH_INDEX_COMPACT_RATIO', '2'))
+)
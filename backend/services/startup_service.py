@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 启动耗时跟踪
+记录模块导入、路由加载、依赖探测、GPU同步等启动阶段的耗时，
+启动完成前 /ready 返回未就绪
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+
+class StartupTracker:
+    """启动阶段耗时记录"""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.completed = False
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录一个启动阶段的耗时（毫秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors[name] = str(e) or type(e).__name__
+            raise
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    def mark_completed(self):
+        self.completed = True
+        self.timings['total'] = round((time.perf_counter() - self._origin) * 1000, 2)
+
+    def is_ready(self) -> bool:
+        """启动完成且所有路由加载成功"""
+        return self.completed and not any(name.startswith('router:') for name in self.errors)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'completed': self.completed,
+            'timings_ms': dict(self.timings),
+            'errors': dict(self.errors)
+        }
+
+
+# 全局启动跟踪实例（进程启动时创建）
+startup_tracker = StartupTracker()
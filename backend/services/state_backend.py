@@ -0,0 +1,666 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 共享状态后端
+分析任务、按用户的任务索引、GPU预留负载、认证令牌吊销记录和平台请求限速令牌桶统一经由TaskStore读写：
+单进程使用内存实现，多worker部署时使用Redis实现，任意worker都能处理任意请求
+"""
+
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson为可选依赖
+    orjson = None
+
+# 需要还原为datetime的任务字段
+DATETIME_FIELDS = ('created_at', 'started_at', 'completed_at', 'requeued_at')
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+def dump_task(task: Dict[str, Any]) -> bytes:
+    """任务记录序列化为JSON字节串"""
+    if orjson is not None:
+        return orjson.dumps(task, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(task, default=_json_default, ensure_ascii=False).encode('utf-8')
+
+
+def load_task(data: Any) -> Dict[str, Any]:
+    """从JSON字节串或已解析的字典还原任务记录"""
+    task = dict(data) if isinstance(data, dict) else (orjson.loads(data) if orjson else json.loads(data))
+    for field in DATETIME_FIELDS:
+        if isinstance(task.get(field), str):
+            task[field] = datetime.fromisoformat(task[field])
+    return task
+
+
+def _timestamp(task: Dict[str, Any]) -> float:
+    created_at = task.get('created_at')
+    return created_at.timestamp() if isinstance(created_at, datetime) else 0.0
+
+
+class TaskStore(ABC):
+    """
+    任务存储接口（抽象基类，缺少任一方法的实现在实例化时即报错）
+
+    update 合并字段并递增任务的 version，调用方可以用 (task_id, version)
+    作为响应缓存键，任一worker修改任务后其他worker的缓存自然失效；
+    shared 表示任务是否在worker/实例之间共享
+    """
+
+    shared = False
+
+    @abstractmethod
+    async def create(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update(
+        self,
+        task_id: str,
+        fields: Dict[str, Any],
+        expected_status: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        合并字段并返回更新后的任务，任务不存在时返回None
+
+        指定expected_status时为原子的比较并更新：任务当前状态不符则不修改并返回None
+        """
+        ...
+
+    @abstractmethod
+    async def delete(self, task_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def save_checkpoint(self, task_id: str, fields: Dict[str, Any]):
+        """
+        合并写入任务检查点的字段
+
+        每个字段单独存储，写入量只与本次字段大小有关，与检查点已有内容无关
+        """
+        ...
+
+    @abstractmethod
+    async def load_checkpoint(self, task_id: str) -> Dict[str, Any]:
+        """读取任务检查点的全部字段（没有检查点时返回空字典）"""
+        ...
+
+    @abstractmethod
+    async def clear_checkpoint(self, task_id: str):
+        """删除任务检查点（删除任务时检查点随之删除）"""
+        ...
+
+    @abstractmethod
+    async def list_user(self, user_id: str, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """按创建时间倒序分页读取用户的任务，返回(任务列表, 总数)"""
+        ...
+
+    @abstractmethod
+    async def list_all(self, status: Optional[str], offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """按创建时间倒序分页读取所有（或指定状态的）任务"""
+        ...
+
+    @abstractmethod
+    async def count_by_state(self) -> Dict[Tuple[str, str], int]:
+        """按(类型, 状态)统计任务数"""
+        ...
+
+    @abstractmethod
+    def scan(
+        self,
+        status: Optional[str] = None,
+        user_id: Optional[str] = None,
+        created_before: Optional[datetime] = None,
+        batch_size: int = 500
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        按创建时间正序分批遍历匹配的任务
+
+        遍历基于开始时的快照，遍历过程中删除任务是安全的
+        """
+        ...
+
+    @abstractmethod
+    async def delete_many(
+        self,
+        task_ids: Iterable[str],
+        statuses: Optional[Iterable[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        批量删除任务，返回实际删除的任务
+
+        指定statuses时只删除删除时刻状态仍在其中的任务（与检查在同一原子操作内）
+        """
+        ...
+
+    @abstractmethod
+    async def acquire_lock(self, name: str, ttl: float) -> bool:
+        """获取带过期时间的互斥锁（多worker中只有一个执行周期性任务）"""
+        ...
+
+    @abstractmethod
+    async def publish_gpu_load(self, worker_id: str, loads: Dict[str, float], ttl: float):
+        """
+        用本worker的完整GPU预留快照（GPU -> 预估秒数）替换之前发布的快照
+
+        快照ttl秒内未再次发布即失效，异常退出的worker留下的预留会自动消失
+        """
+        ...
+
+    @abstractmethod
+    async def get_gpu_load(self, gpu_ids: Iterable[str], exclude_worker: Optional[str] = None) -> Dict[str, float]:
+        """所有存活worker（可排除自身）在各GPU上预留的预估秒数之和"""
+        ...
+
+    @abstractmethod
+    async def add_revocation(self, key: str, revoked_at: float, ttl: float):
+        """记录吊销（令牌或用户），ttl秒后自动过期"""
+        ...
+
+    @abstractmethod
+    async def get_revocations(self, keys: Iterable[str]) -> Dict[str, float]:
+        """读取已吊销的键及吊销时间（未吊销的键不出现在结果中）"""
+        ...
+
+    @abstractmethod
+    async def take_tokens(self, bucket: str, rate: float, burst: float, tokens: float = 1.0) -> float:
+        """
+        从令牌桶取令牌（每秒补充rate个，最多burst个）
+
+        取到时返回0；令牌不足时不扣减，返回需要等待的秒数
+        """
+        ...
+
+    @abstractmethod
+    async def clear(self):
+        ...
+
+
+class MemoryTaskStore(TaskStore):
+    """进程内任务存储（单worker或本地开发）"""
+
+    def __init__(self):
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[str, set] = {}
+        self._checkpoints: Dict[str, Dict[str, Any]] = {}
+        # worker -> (GPU预留快照, 过期时间)
+        self._gpu_loads: Dict[str, Tuple[Dict[str, float], float]] = {}
+        # 吊销键 -> (吊销时间, 过期时间)
+        self._revocations: Dict[str, Tuple[float, float]] = {}
+        self._locks: Dict[str, float] = {}
+        # 令牌桶 -> (剩余令牌, 上次补充时间)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def create(self, task):
+        task.setdefault('version', 0)
+        self._tasks[task['task_id']] = task
+        self._by_user.setdefault(task['user_id'], set()).add(task['task_id'])
+        return task
+
+    async def get(self, task_id):
+        return self._tasks.get(task_id)
+
+    async def update(self, task_id, fields, expected_status=None):
+        task = self._tasks.get(task_id)
+        if task is None or (expected_status is not None and task['status'] != expected_status):
+            return None
+        task.update(fields)
+        task['version'] = task.get('version', 0) + 1
+        return task
+
+    async def delete(self, task_id):
+        task = self._tasks.pop(task_id, None)
+        self._checkpoints.pop(task_id, None)
+        if task is not None:
+            owned = self._by_user.get(task['user_id'])
+            if owned is not None:
+                owned.discard(task_id)
+                if not owned:
+                    del self._by_user[task['user_id']]
+        return task
+
+    async def save_checkpoint(self, task_id, fields):
+        self._checkpoints.setdefault(task_id, {}).update(fields)
+
+    async def load_checkpoint(self, task_id):
+        return dict(self._checkpoints.get(task_id, {}))
+
+    async def clear_checkpoint(self, task_id):
+        self._checkpoints.pop(task_id, None)
+
+    @staticmethod
+    def _page(tasks: List[Dict[str, Any]], offset: int, limit: int):
+        tasks.sort(key=lambda task: task['created_at'], reverse=True)
+        return tasks[offset:offset + limit], len(tasks)
+
+    async def list_user(self, user_id, offset, limit):
+        tasks = [self._tasks[task_id] for task_id in self._by_user.get(user_id, ())]
+        return self._page(tasks, offset, limit)
+
+    async def list_all(self, status, offset, limit):
+        tasks = [task for task in self._tasks.values() if not status or task['status'] == status]
+        return self._page(tasks, offset, limit)
+
+    async def count_by_state(self):
+        counts: Dict[Tuple[str, str], int] = {}
+        for task in list(self._tasks.values()):
+            key = (task['type'], task['status'])
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    async def scan(self, status=None, user_id=None, created_before=None, batch_size=500):
+        if user_id is not None:
+            candidates = [self._tasks[task_id] for task_id in self._by_user.get(user_id, ())]
+        else:
+            candidates = list(self._tasks.values())
+        matched = [
+            task for task in candidates
+            if (status is None or task['status'] == status)
+            and (created_before is None or task['created_at'] < created_before)
+        ]
+        matched.sort(key=lambda task: task['created_at'])
+        for start in range(0, len(matched), batch_size):
+            yield matched[start:start + batch_size]
+
+    async def delete_many(self, task_ids, statuses=None):
+        allowed = set(statuses) if statuses is not None else None
+        deleted = []
+        for task_id in task_ids:
+            task = self._tasks.get(task_id)
+            if task is None or (allowed is not None and task['status'] not in allowed):
+                continue
+            deleted.append(await self.delete(task_id))
+        return deleted
+
+    async def acquire_lock(self, name, ttl):
+        now = time.time()
+        if self._locks.get(name, 0.0) > now:
+            return False
+        self._locks[name] = now + ttl
+        return True
+
+    async def publish_gpu_load(self, worker_id, loads, ttl):
+        if loads:
+            self._gpu_loads[worker_id] = (dict(loads), time.time() + ttl)
+        else:
+            self._gpu_loads.pop(worker_id, None)
+
+    async def get_gpu_load(self, gpu_ids, exclude_worker=None):
+        now = time.time()
+        totals = {gpu_id: 0.0 for gpu_id in gpu_ids}
+        for worker_id, (loads, expires_at) in list(self._gpu_loads.items()):
+            if expires_at <= now:
+                del self._gpu_loads[worker_id]
+                continue
+            if worker_id == exclude_worker:
+                continue
+            for gpu_id in totals:
+                totals[gpu_id] += loads.get(gpu_id, 0.0)
+        return totals
+
+    async def add_revocation(self, key, revoked_at, ttl):
+        now = time.time()
+        self._revocations[key] = (revoked_at, now + ttl)
+        # 顺带清理已过期的吊销记录
+        if len(self._revocations) % 256 == 0:
+            for stale in [k for k, (_, expires_at) in self._revocations.items() if expires_at <= now]:
+                del self._revocations[stale]
+
+    async def get_revocations(self, keys):
+        now = time.time()
+        revoked = {}
+        for key in keys:
+            entry = self._revocations.get(key)
+            if entry is not None and entry[1] > now:
+                revoked[key] = entry[0]
+        return revoked
+
+    async def take_tokens(self, bucket, rate, burst, tokens=1.0):
+        now = time.monotonic()
+        available, updated_at = self._buckets.get(bucket, (burst, now))
+        available = min(burst, available + (now - updated_at) * rate)
+        if available >= tokens:
+            self._buckets[bucket] = (available - tokens, now)
+            return 0.0
+        self._buckets[bucket] = (available, now)
+        return (tokens - available) / rate
+
+    async def clear(self):
+        self._tasks.clear()
+        self._by_user.clear()
+        self._checkpoints.clear()
+        self._gpu_loads.clear()
+        self._revocations.clear()
+        self._locks.clear()
+        self._buckets.clear()
+
+
+class RedisTaskStore(TaskStore):
+    """
+    Redis任务存储（多worker共享）
+
+    owl:task:<id>            任务JSON
+    owl:task:<id>:checkpoint 任务检查点（字段 -> JSON）
+    owl:tasks                全部任务，score为创建时间
+    owl:tasks:status:<s>     各状态任务
+    owl:user:<uid>:tasks     用户任务索引
+    owl:task_states          (类型|状态) -> 计数
+    owl:gpu_load:<worker>    该worker的GPU预留快照（GPU -> 预估秒数，带过期时间）
+    owl:gpu_load_workers     发布过快照的worker，score为快照过期时间
+    owl:revoked:<key>        吊销时间（带过期时间）
+    owl:lock:<name>          周期性任务互斥锁
+    owl:bucket:<name>        平台请求令牌桶（剩余令牌, 上次补充时间）
+    """
+
+    PREFIX = 'owl'
+    shared = True
+
+    # 令牌桶在脚本内原子地补充并扣减，时间取Redis服务器时间，各worker时钟偏差不影响限速
+    TAKE_TOKENS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local available = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+available = math.min(burst, available + math.max(0, now - updated_at) * rate)
+local wait = 0
+if available >= tokens then
+    available = available - tokens
+else
+    wait = (tokens - available) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(available), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+        from redis.exceptions import WatchError
+        self._watch_error = WatchError
+        self.client = redis_asyncio.from_url(url)
+        self._take_tokens = self.client.register_script(self.TAKE_TOKENS_SCRIPT)
+
+    def _task_key(self, task_id: str) -> str:
+        return f'{self.PREFIX}:task:{task_id}'
+
+    def _checkpoint_key(self, task_id: str) -> str:
+        return f'{self.PREFIX}:task:{task_id}:checkpoint'
+
+    def _user_key(self, user_id: str) -> str:
+        return f'{self.PREFIX}:user:{user_id}:tasks'
+
+    def _status_key(self, status: str) -> str:
+        return f'{self.PREFIX}:tasks:status:{status}'
+
+    @property
+    def _all_key(self) -> str:
+        return f'{self.PREFIX}:tasks'
+
+    @property
+    def _states_key(self) -> str:
+        return f'{self.PREFIX}:task_states'
+
+    def _gpu_key(self, worker_id: str) -> str:
+        return f'{self.PREFIX}:gpu_load:{worker_id}'
+
+    @property
+    def _gpu_workers_key(self) -> str:
+        return f'{self.PREFIX}:gpu_load_workers'
+
+    async def create(self, task):
+        task.setdefault('version', 0)
+        task_id = task['task_id']
+        score = _timestamp(task)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self._task_key(task_id), dump_task(task))
+            pipe.zadd(self._all_key, {task_id: score})
+            pipe.zadd(self._user_key(task['user_id']), {task_id: score})
+            pipe.zadd(self._status_key(task['status']), {task_id: score})
+            pipe.hincrby(self._states_key, f"{task['type']}|{task['status']}", 1)
+            await pipe.execute()
+        return task
+
+    async def get(self, task_id):
+        data = await self.client.get(self._task_key(task_id))
+        return load_task(data) if data is not None else None
+
+    async def update(self, task_id, fields, expected_status=None):
+        key = self._task_key(task_id)
+        # WATCH乐观事务：并发修改同一任务时重试
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    data = await pipe.get(key)
+                    if data is None:
+                        await pipe.unwatch()
+                        return None
+                    task = load_task(data)
+                    old_status = task['status']
+                    if expected_status is not None and old_status != expected_status:
+                        await pipe.unwatch()
+                        return None
+                    task.update(fields)
+                    task['version'] = task.get('version', 0) + 1
+                    pipe.multi()
+                    pipe.set(key, dump_task(task))
+                    if task['status'] != old_status:
+                        pipe.zrem(self._status_key(old_status), task_id)
+                        pipe.zadd(self._status_key(task['status']), {task_id: _timestamp(task)})
+                        pipe.hincrby(self._states_key, f"{task['type']}|{old_status}", -1)
+                        pipe.hincrby(self._states_key, f"{task['type']}|{task['status']}", 1)
+                    await pipe.execute()
+                    return task
+                except self._watch_error:
+                    continue
+
+    async def delete(self, task_id):
+        key = self._task_key(task_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    data = await pipe.get(key)
+                    if data is None:
+                        await pipe.unwatch()
+                        return None
+                    task = load_task(data)
+                    pipe.multi()
+                    pipe.delete(key, self._checkpoint_key(task_id))
+                    pipe.zrem(self._all_key, task_id)
+                    pipe.zrem(self._user_key(task['user_id']), task_id)
+                    pipe.zrem(self._status_key(task['status']), task_id)
+                    pipe.hincrby(self._states_key, f"{task['type']}|{task['status']}", -1)
+                    await pipe.execute()
+                    return task
+                except self._watch_error:
+                    continue
+
+    async def save_checkpoint(self, task_id, fields):
+        if fields:
+            await self.client.hset(
+                self._checkpoint_key(task_id),
+                mapping={field: dump_task(value) for field, value in fields.items()}
+            )
+
+    async def load_checkpoint(self, task_id):
+        fields = await self.client.hgetall(self._checkpoint_key(task_id))
+        loads = orjson.loads if orjson is not None else json.loads
+        return {
+            (field.decode() if isinstance(field, bytes) else field): loads(value)
+            for field, value in fields.items()
+        }
+
+    async def clear_checkpoint(self, task_id):
+        await self.client.delete(self._checkpoint_key(task_id))
+
+    async def _page(self, index_key: str, offset: int, limit: int):
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.zrevrange(index_key, offset, offset + limit - 1)
+            pipe.zcard(index_key)
+            task_ids, total = await pipe.execute()
+        if not task_ids:
+            return [], total
+        rows = await self.client.mget([self._task_key(task_id.decode()) for task_id in task_ids])
+        return [load_task(row) for row in rows if row is not None], total
+
+    async def list_user(self, user_id, offset, limit):
+        return await self._page(self._user_key(user_id), offset, limit)
+
+    async def list_all(self, status, offset, limit):
+        return await self._page(self._status_key(status) if status else self._all_key, offset, limit)
+
+    async def count_by_state(self):
+        counts = {}
+        for key, value in (await self.client.hgetall(self._states_key)).items():
+            count = int(value)
+            if count > 0:
+                task_type, task_status = key.decode().split('|', 1)
+                counts[(task_type, task_status)] = count
+        return counts
+
+    async def scan(self, status=None, user_id=None, created_before=None, batch_size=500):
+        if user_id is not None:
+            index_key = self._user_key(user_id)
+        elif status is not None:
+            index_key = self._status_key(status)
+        else:
+            index_key = self._all_key
+        # 与进程内存储一致，created_before 不含边界
+        max_score = f'({created_before.timestamp()}' if created_before is not None else '+inf'
+        # 先取出匹配的ID快照（只含ID），再分批读取任务内容
+        task_ids = [task_id.decode() for task_id in await self.client.zrangebyscore(index_key, '-inf', max_score)]
+        for start in range(0, len(task_ids), batch_size):
+            rows = await self.client.mget([self._task_key(task_id) for task_id in task_ids[start:start + batch_size]])
+            batch = [load_task(row) for row in rows if row is not None]
+            if status is not None and user_id is not None:
+                batch = [task for task in batch if task['status'] == status]
+            if batch:
+                yield batch
+
+    async def delete_many(self, task_ids, statuses=None):
+        allowed = set(statuses) if statuses is not None else None
+        keys = [self._task_key(task_id) for task_id in task_ids]
+        if not keys:
+            return []
+        # 一次事务删除整批任务及其索引
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(*keys)
+                    rows = await pipe.mget(keys)
+                    tasks = [load_task(row) for row in rows if row is not None]
+                    if allowed is not None:
+                        tasks = [task for task in tasks if task['status'] in allowed]
+                    if not tasks:
+                        await pipe.unwatch()
+                        return []
+                    pipe.multi()
+                    for task in tasks:
+                        task_id = task['task_id']
+                        pipe.delete(self._task_key(task_id), self._checkpoint_key(task_id))
+                        pipe.zrem(self._all_key, task_id)
+                        pipe.zrem(self._user_key(task['user_id']), task_id)
+                        pipe.zrem(self._status_key(task['status']), task_id)
+                        pipe.hincrby(self._states_key, f"{task['type']}|{task['status']}", -1)
+                    await pipe.execute()
+                    return tasks
+                except self._watch_error:
+                    continue
+
+    async def acquire_lock(self, name, ttl):
+        return bool(await self.client.set(f'{self.PREFIX}:lock:{name}', 1, nx=True, ex=max(1, int(ttl))))
+
+    async def publish_gpu_load(self, worker_id, loads, ttl):
+        key = self._gpu_key(worker_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if loads:
+                pipe.hset(key, mapping={gpu_id: seconds for gpu_id, seconds in loads.items()})
+                pipe.expire(key, max(1, int(ttl)))
+                pipe.zadd(self._gpu_workers_key, {worker_id: time.time() + ttl})
+            else:
+                pipe.zrem(self._gpu_workers_key, worker_id)
+            await pipe.execute()
+
+    async def get_gpu_load(self, gpu_ids, exclude_worker=None):
+        gpu_ids = list(gpu_ids)
+        totals = {gpu_id: 0.0 for gpu_id in gpu_ids}
+        if not gpu_ids:
+            return totals
+        # 先移除快照已过期（worker异常退出或停止心跳）的记录
+        await self.client.zremrangebyscore(self._gpu_workers_key, '-inf', time.time())
+        workers = [
+            worker.decode() if isinstance(worker, bytes) else worker
+            for worker in await self.client.zrange(self._gpu_workers_key, 0, -1)
+        ]
+        workers = [worker for worker in workers if worker != exclude_worker]
+        if not workers:
+            return totals
+        async with self.client.pipeline(transaction=False) as pipe:
+            for worker in workers:
+                pipe.hmget(self._gpu_key(worker), gpu_ids)
+            snapshots = await pipe.execute()
+        for values in snapshots:
+            for gpu_id, value in zip(gpu_ids, values):
+                if value is not None:
+                    totals[gpu_id] += float(value)
+        return totals
+
+    async def add_revocation(self, key, revoked_at, ttl):
+        await self.client.set(f'{self.PREFIX}:revoked:{key}', revoked_at, ex=max(1, int(ttl)))
+
+    async def get_revocations(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = await self.client.mget([f'{self.PREFIX}:revoked:{key}' for key in keys])
+        return {key: float(value) for key, value in zip(keys, values) if value is not None}
+
+    async def take_tokens(self, bucket, rate, burst, tokens=1.0):
+        wait = await self._take_tokens(keys=[f'{self.PREFIX}:bucket:{bucket}'], args=[rate, burst, tokens])
+        return float(wait)
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=f'{self.PREFIX}:*')]
+        if keys:
+            await self.client.delete(*keys)
+
+
+def create_task_store() -> TaskStore:
+    """按 STATE_BACKEND 环境变量创建任务存储（memory | redis）"""
+    backend = os.getenv('STATE_BACKEND', 'memory').lower()
+    if backend == 'redis':
+        url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+        logger.info(f"使用Redis共享状态后端: {url}")
+        return RedisTaskStore(url)
+    if backend != 'memory':
+        raise ValueError(f"未知的状态后端: {backend}")
+    return MemoryTaskStore()
+
+
+# 全局任务存储实例
+task_store = create_task_store()
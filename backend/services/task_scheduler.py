@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 分析任务调度器
+按任务类别分队列调度：quick任务短作业优先，等待时间老化防止饿死，
+并为quick任务预留GPU执行槽位，避免被长时间的账号分析占满；
+需要准备（如视频预取）的任务在准备完成后才进入队列，不占用执行槽位
+
+并发上限、quick预留槽位与账号任务上限都是每个worker进程各自的限制，
+多worker部署时整体上限为 worker数 × 配置值；GPU预留负载则通过共享状态后端在所有worker间汇总
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from .state_backend import TaskStore, task_store
+
+# 任务类别配置
+# weight: 调度基准分（秒当量，越小越优先）
+# default_time: 缺省预估耗时（秒）
+# sjf: 类别内是否按预估耗时短作业优先
+JOB_CLASSES: Dict[str, Dict[str, Any]] = {
+    'quick': {'weight': 0, 'default_time': 30, 'sjf': True},
+    'standard': {'weight': 60, 'default_time': 120, 'sjf': False},
+    'deep': {'weight': 300, 'default_time': 300, 'sjf': False},
+    'account': {'weight': 900, 'default_time': 1800, 'sjf': False},
+}
+
+
+class SchedulerDrainingError(RuntimeError):
+    """调度器正在关闭，不再接受新任务"""
+
+
+def resolve_job_class(task_type: str, analysis_type: Optional[str] = None) -> str:
+    """根据任务类型和分析类型确定调度类别"""
+    if task_type == 'complete_account':
+        return 'account'
+    if analysis_type in JOB_CLASSES and analysis_type != 'account':
+        return analysis_type
+    return 'standard'
+
+
+@dataclass(order=True)
+class ScheduledJob:
+    """调度队列中的任务"""
+    sort_key: tuple
+    task_id: str = field(compare=False)
+    job_class: str = field(compare=False)
+    estimated_time: float = field(compare=False)
+    factory: Callable[[], Awaitable[Any]] = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    gpu_ids: List[str] = field(default_factory=list, compare=False)
+    started_at: Optional[float] = field(default=None, compare=False)
+    handle: Optional[asyncio.Task] = field(default=None, compare=False)
+
+
+class TaskScheduler:
+    """优先级感知的分析任务调度器"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        reserved_quick_slots: int = 2,
+        max_account_concurrency: int = 2,
+        aging_rate: float = 1.0,
+        gpu_loads: Optional[TaskStore] = None,
+        gpu_load_ttl: float = 60.0
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.reserved_quick_slots = min(max(0, reserved_quick_slots), self.max_concurrency - 1)
+        self.max_account_concurrency = max(1, max_account_concurrency)
+        self.aging_rate = aging_rate
+
+        self._queues: Dict[str, List[ScheduledJob]] = {cls: [] for cls in JOB_CLASSES}
+        self._running: Dict[str, ScheduledJob] = {}
+        # 准备阶段中的任务 -> 准备协程句柄
+        self._preparing: Dict[str, asyncio.Task] = {}
+        self._preparing_jobs: Dict[str, ScheduledJob] = {}
+        # 本worker在每块GPU上已分配（排队+运行）任务的预估秒数；
+        # 以快照形式定期发布到共享状态后端，过期未刷新的快照（如worker崩溃）自动失效
+        self.gpu_loads = gpu_loads if gpu_loads is not None else task_store
+        self.gpu_load_ttl = gpu_load_ttl
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._local_gpu_load: Dict[str, float] = {}
+        self._gpu_load_changed: Optional[asyncio.Event] = None
+        self._publisher: Optional[asyncio.Task] = None
+        self._publisher_stopping = False
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.accepting = True
+        self._startup_hooks: List[Callable[[], Awaitable[None]]] = []
+        self._drain_hooks: List[Callable[[List[str], List[str]], Awaitable[None]]] = []
+
+    def add_startup_hook(self, hook: Callable[[], Awaitable[None]]):
+        """注册启动钩子（如接管其他实例重新入队的任务）"""
+        self._startup_hooks.append(hook)
+
+    def add_drain_hook(self, hook: Callable[[List[str], List[str]], Awaitable[None]]):
+        """
+        注册关闭钩子
+
+        钩子参数为(未开始的任务ID列表, 被中断的任务ID列表)，用于重新入队或保存检查点
+        """
+        self._drain_hooks.append(hook)
+
+    async def start(self):
+        """启动调度器并执行启动钩子"""
+        self.accepting = True
+        self._ensure_dispatcher()
+        for hook in self._startup_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"调度器启动钩子执行失败: {e}")
+
+    async def drain(self, timeout: float) -> Dict[str, int]:
+        """
+        优雅关闭：停止接收新任务，在timeout秒内等待运行中的任务完成，
+        超时的任务被取消，未开始和被取消的任务交给关闭钩子重新入队
+        """
+        self.accepting = False
+
+        queued_ids = []
+        for queue in self._queues.values():
+            while queue:
+                job = heapq.heappop(queue)
+                self._release_gpus(job)
+                queued_ids.append(job.task_id)
+
+        # 准备阶段中的任务同样重新入队
+        preparing = list(self._preparing.values())
+        for task_id, job in list(self._preparing_jobs.items()):
+            self._preparing[task_id].cancel()
+            self._release_gpus(job)
+            queued_ids.append(task_id)
+        self._preparing.clear()
+        self._preparing_jobs.clear()
+        if preparing:
+            await asyncio.gather(*preparing, return_exceptions=True)
+
+        handles = {job.handle: job.task_id for job in self._running.values() if job.handle is not None}
+        finished, pending = set(), set()
+        if handles:
+            logger.info(f"等待 {len(handles)} 个运行中的分析任务完成（最长 {timeout} 秒）")
+            finished, pending = await asyncio.wait(handles.keys(), timeout=timeout)
+        for handle in pending:
+            handle.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        interrupted_ids = [handles[handle] for handle in pending]
+
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        await self._stop_publisher()
+
+        for hook in self._drain_hooks:
+            try:
+                await hook(queued_ids, interrupted_ids)
+            except Exception as e:
+                logger.error(f"调度器关闭钩子执行失败: {e}")
+
+        return {
+            'completed': len(finished),
+            'requeued': len(queued_ids),
+            'interrupted': len(interrupted_ids)
+        }
+
+    def submit(
+        self,
+        task_id: str,
+        job_class: str,
+        factory: Callable[[], Awaitable[Any]],
+        estimated_time: Optional[float] = None,
+        gpu_ids: Optional[List[str]] = None,
+        prepare: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> int:
+        """
+        提交任务到对应类别队列
+
+        factory为无参协程工厂，在获得执行槽位时才被调用；
+        gpu_ids为select_gpus选出的GPU，其负载在任务结束前一直计入；
+        prepare为可选的准备协程工厂，完成后任务才进入队列，抛出异常时任务被丢弃
+        （由prepare自行记录失败原因）；prepare返回数值时作为修正后的预估耗时。
+        返回任务在本类别队列中的位置（从1开始），需要准备的任务返回0
+        """
+        if not self.accepting:
+            raise SchedulerDrainingError("服务正在关闭，暂不接受新任务")
+        if job_class not in JOB_CLASSES:
+            raise ValueError(f"未知的任务类别: {job_class}")
+
+        config = JOB_CLASSES[job_class]
+        if estimated_time is None:
+            estimated_time = config['default_time']
+
+        seq = next(self._seq)
+        sort_key = (estimated_time, seq) if config['sjf'] else (0, seq)
+        job = ScheduledJob(
+            sort_key=sort_key,
+            task_id=task_id,
+            job_class=job_class,
+            estimated_time=estimated_time,
+            factory=factory,
+            enqueued_at=time.monotonic(),
+            gpu_ids=list(gpu_ids or [])
+        )
+        self._ensure_dispatcher()
+        self._adjust_gpu_load(job.gpu_ids, estimated_time)
+
+        if prepare is not None:
+            self._preparing_jobs[task_id] = job
+            self._preparing[task_id] = asyncio.create_task(self._prepare(job, prepare))
+            return 0
+        return self._enqueue(job)
+
+    def _enqueue(self, job: ScheduledJob) -> int:
+        # 等待时间从进入队列时开始计算
+        job.enqueued_at = time.monotonic()
+        heapq.heappush(self._queues[job.job_class], job)
+        self._wakeup.set()
+        return len(self._queues[job.job_class])
+
+    async def _prepare(self, job: ScheduledJob, prepare: Callable[[], Awaitable[Any]]):
+        """执行准备阶段，成功后入队"""
+        try:
+            revised = await prepare()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"分析任务准备失败 {job.task_id}: {e}")
+            if self._preparing_jobs.pop(job.task_id, None) is not None:
+                self._preparing.pop(job.task_id, None)
+                self._release_gpus(job)
+            return
+        if self._preparing_jobs.pop(job.task_id, None) is not None:
+            self._preparing.pop(job.task_id, None)
+            if isinstance(revised, (int, float)) and revised > 0:
+                self._revise_estimate(job, float(revised))
+            self._enqueue(job)
+
+    def _revise_estimate(self, job: ScheduledJob, estimated_time: float):
+        """准备阶段得到更准确的预估（如视频时长）后，修正GPU预留负载与短作业优先的排序键"""
+        self._adjust_gpu_load(job.gpu_ids, estimated_time - job.estimated_time)
+        job.estimated_time = estimated_time
+        if JOB_CLASSES[job.job_class]['sjf']:
+            job.sort_key = (estimated_time, job.sort_key[1])
+
+    def _ensure_dispatcher(self):
+        """在当前事件循环中启动调度协程"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        if self._gpu_load_changed is None:
+            self._gpu_load_changed = asyncio.Event()
+        if self._publisher is None or self._publisher.done():
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    async def _dispatch_loop(self):
+        """调度主循环：有空闲槽位或新任务时挑选下一个任务执行"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                job = self._pick_next()
+                if job is None:
+                    break
+                self._start(job)
+
+    def _running_count(self, job_class: Optional[str] = None) -> int:
+        if job_class is None:
+            return len(self._running)
+        return sum(1 for job in self._running.values() if job.job_class == job_class)
+
+    def _can_start(self, job_class: str) -> bool:
+        """检查该类别当前是否允许占用执行槽位"""
+        running = self._running_count()
+        if running >= self.max_concurrency:
+            return False
+        if job_class != 'quick':
+            # 非quick任务不能占用预留槽位
+            non_quick = running - self._running_count('quick')
+            if non_quick >= self.max_concurrency - self.reserved_quick_slots:
+                return False
+        if job_class == 'account' and self._running_count('account') >= self.max_account_concurrency:
+            return False
+        return True
+
+    def _score(self, job: ScheduledJob, now: float) -> float:
+        """调度分：类别权重 + 预估耗时 - 等待老化，越小越优先"""
+        weight = JOB_CLASSES[job.job_class]['weight']
+        waited = now - job.enqueued_at
+        return weight + job.estimated_time - self.aging_rate * waited
+
+    def _pick_next(self) -> Optional[ScheduledJob]:
+        """在各类别队首中选出调度分最低且可执行的任务"""
+        now = time.monotonic()
+        best_class = None
+        best_score = None
+        for job_class, queue in self._queues.items():
+            if not queue or not self._can_start(job_class):
+                continue
+            score = self._score(queue[0], now)
+            if best_score is None or score < best_score:
+                best_class, best_score = job_class, score
+
+        if best_class is None:
+            return None
+        return heapq.heappop(self._queues[best_class])
+
+    def _start(self, job: ScheduledJob):
+        """为任务分配执行槽位并启动"""
+        job.started_at = time.monotonic()
+        self._running[job.task_id] = job
+        task = asyncio.create_task(job.factory())
+        job.handle = task
+        task.add_done_callback(lambda t, job=job: self._on_done(job, t))
+
+    def _on_done(self, job: ScheduledJob, task: asyncio.Task):
+        self._running.pop(job.task_id, None)
+        self._release_gpus(job)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"分析任务执行异常 {job.task_id}: {task.exception()}")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _release_gpus(self, job: ScheduledJob):
+        self._adjust_gpu_load(job.gpu_ids, -job.estimated_time)
+
+    def _adjust_gpu_load(self, gpu_ids: List[str], seconds: float):
+        """更新本worker的GPU预留负载，由发布协程写入共享状态后端"""
+        if not gpu_ids:
+            return
+        for gpu_id in gpu_ids:
+            remaining = self._local_gpu_load.get(gpu_id, 0.0) + seconds
+            if remaining > 1e-6:
+                self._local_gpu_load[gpu_id] = remaining
+            else:
+                self._local_gpu_load.pop(gpu_id, None)
+        if self._gpu_load_changed is not None:
+            self._gpu_load_changed.set()
+
+    async def _publish_gpu_load(self):
+        await self.gpu_loads.publish_gpu_load(self.worker_id, dict(self._local_gpu_load), self.gpu_load_ttl)
+
+    async def _publish_loop(self):
+        """负载变化时立即发布快照，否则每ttl/3秒发布一次作为心跳"""
+        while not self._publisher_stopping:
+            try:
+                await asyncio.wait_for(self._gpu_load_changed.wait(), timeout=self.gpu_load_ttl / 3)
+            except asyncio.TimeoutError:
+                pass
+            self._gpu_load_changed.clear()
+            try:
+                await self._publish_gpu_load()
+            except Exception as e:
+                logger.warning(f"GPU预留负载发布失败: {e}")
+
+    async def _stop_publisher(self):
+        """停止发布协程，退出前写入最终快照（关闭时所有预留均已释放）"""
+        if self._publisher is None:
+            return
+        # 不直接取消，避免取消落在写入中途；发布协程写完最后一次快照后自行退出
+        self._publisher_stopping = True
+        self._gpu_load_changed.set()
+        await asyncio.gather(self._publisher, return_exceptions=True)
+        self._publisher = None
+        self._publisher_stopping = False
+
+    async def select_gpus(self, candidates: List[Dict[str, Any]], count: int = 1) -> List[str]:
+        """从可用GPU中选出已分配负载（所有存活worker合计）最低的count块"""
+        gpu_ids = [gpu['id'] for gpu in candidates]
+        loads = await self.gpu_loads.get_gpu_load(gpu_ids, exclude_worker=self.worker_id)
+        # 本worker的负载直接读本地值，不受发布延迟影响
+        for gpu_id in gpu_ids:
+            loads[gpu_id] = loads.get(gpu_id, 0.0) + self._local_gpu_load.get(gpu_id, 0.0)
+        ranked = sorted(candidates, key=lambda gpu: loads.get(gpu['id'], 0.0))
+        return [gpu['id'] for gpu in ranked[:count]]
+
+    def _class_slots(self, job_class: str) -> int:
+        """该类别可使用的执行槽位数"""
+        slots = self.max_concurrency
+        if job_class != 'quick':
+            slots -= self.reserved_quick_slots
+        if job_class == 'account':
+            slots = min(slots, self.max_account_concurrency)
+        return max(1, slots)
+
+    def estimate_queue_wait(self, job_class: str, estimated_time: float) -> float:
+        """
+        预估新任务的排队等待时间（秒）
+
+        累计调度分不高于新任务的排队任务，以及运行中任务的剩余时间，
+        按该类别可用槽位数均摊
+        """
+        if not any(self._queues.values()) and self._can_start(job_class):
+            return 0.0
+
+        now = time.monotonic()
+        my_score = JOB_CLASSES[job_class]['weight'] + estimated_time
+        work_ahead = sum(
+            job.estimated_time
+            for queue in self._queues.values()
+            for job in queue
+            if self._score(job, now) <= my_score
+        )
+        running_remaining = sum(
+            max(0.0, job.estimated_time - (now - job.started_at))
+            for job in self._running.values()
+        )
+        return (work_ahead + running_remaining) / self._class_slots(job_class)
+
+    def queue_depth(self) -> Dict[str, int]:
+        """各类别排队任务数"""
+        return {job_class: len(queue) for job_class, queue in self._queues.items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """调度器状态统计"""
+        return {
+            'queued': self.queue_depth(),
+            'preparing': len(self._preparing),
+            'running': {cls: self._running_count(cls) for cls in JOB_CLASSES},
+            'max_concurrency': self.max_concurrency,
+            'reserved_quick_slots': self.reserved_quick_slots,
+            'max_account_concurrency': self.max_account_concurrency
+        }
+
+
+# 全局调度器实例
+task_scheduler = TaskScheduler(
+    max_concurrency=int(os.getenv('SCHEDULER_MAX_CONCURRENCY', '8')),
+    reserved_quick_slots=int(os.getenv('SCHEDULER_RESERVED_QUICK_SLOTS', '2')),
+    max_account_concurrency=int(os.getenv('SCHEDULER_MAX_ACCOUNT_CONCURRENCY', '2')),
+    aging_rate=float(os.getenv('SCHEDULER_AGING_RATE', '1.0')),
+    gpu_load_ttl=float(os.getenv('SCHEDULER_GPU_LOAD_TTL', '60'))
+)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 任务耗时预估服务
+根据历史processing_time按平台/分析类型/视频时长学习耗时分布，
+结合调度器排队情况给出完成时间预估及置信度。视频时长在提交时未知，
+由预取阶段得到后再按时长分桶重新预估；未经预取的任务只使用不含时长的统计。
+统计保存在各worker内存中，启动时从状态后端中已完成任务的processing_time重建
+"""
+
+import math
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .state_backend import TaskStore
+from .task_scheduler import task_scheduler
+
+# 无历史数据时的缺省预估（秒）
+DEFAULT_ESTIMATES: Dict[Tuple[str, str], float] = {
+    ('single_video', 'quick'): 30,
+    ('single_video', 'standard'): 120,
+    ('single_video', 'deep'): 300,
+    ('complete_account', 'recent'): 300,
+    ('complete_account', 'sample'): 600,
+    ('complete_account', 'complete'): 1800,
+}
+DEFAULT_PER_VIDEO_TIME = 30
+
+# 未知分析类型归入的缺省类型（与调度类别的回退一致），统计键和指标标签只使用已知取值
+DEFAULT_VARIANTS = {'single_video': 'standard', 'complete_account': 'complete'}
+
+# 视频时长分桶边界（秒）
+DURATION_BUCKETS = (60, 180, 600, 1800)
+
+
+def duration_bucket(duration: Optional[float]) -> Optional[int]:
+    """将视频时长映射到分桶"""
+    if duration is None:
+        return None
+    for index, bound in enumerate(DURATION_BUCKETS):
+        if duration <= bound:
+            return index
+    return len(DURATION_BUCKETS)
+
+
+def normalize_variant(task_type: str, variant: Optional[str]) -> str:
+    """将分析类型/深度限定在已知取值内"""
+    if (task_type, variant) in DEFAULT_ESTIMATES:
+        return variant
+    return DEFAULT_VARIANTS.get(task_type, 'standard')
+
+
+def task_variant(task: Dict[str, Any]) -> str:
+    """任务记录的分析类型（单视频）或分析深度（账号分析）"""
+    if task['type'] == 'complete_account':
+        return normalize_variant(task['type'], task.get('analysis_depth'))
+    return normalize_variant(task['type'], task.get('analysis_type'))
+
+
+class _RunningStat:
+    """指数加权的均值/方差统计"""
+
+    __slots__ = ('count', 'mean', 'var')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+
+    def add(self, value: float, alpha: float):
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            self.var = 0.0
+            return
+        # 样本较少时退化为算术平均，避免早期样本权重过低
+        weight = max(alpha, 1.0 / self.count)
+        delta = value - self.mean
+        self.mean += weight * delta
+        self.var = (1 - weight) * (self.var + weight * delta * delta)
+
+
+class CompletionTimeEstimator:
+    """基于历史耗时的完成时间预估器"""
+
+    def __init__(self, alpha: float = 0.2, min_samples: int = 5):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self._stats: Dict[tuple, _RunningStat] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(task_type: str, variant: str, platform: Optional[str], bucket: Optional[int]):
+        """由细到粗的统计键，用于逐级回退"""
+        keys = []
+        if platform and bucket is not None:
+            keys.append((task_type, variant, platform, bucket))
+        if platform:
+            keys.append((task_type, variant, platform))
+        keys.append((task_type, variant))
+        return keys
+
+    def record(
+        self,
+        task_type: str,
+        variant: str,
+        processing_time: float,
+        platform: Optional[str] = None,
+        duration: Optional[float] = None,
+        video_count: Optional[int] = None,
+        partial: bool = False
+    ):
+        """
+        记录一次任务实际耗时
+
+        variant: 单视频为analysis_type，账号分析为analysis_depth；
+        partial表示只处理了部分工作（如从检查点恢复的账号任务），
+        此时只按video_count计入单视频耗时，不计入整个任务的耗时统计
+        """
+        if processing_time is None or processing_time <= 0:
+            return
+        variant = normalize_variant(task_type, variant)
+        with self._lock:
+            if not partial:
+                for key in self._keys(task_type, variant, platform, duration_bucket(duration)):
+                    self._stats.setdefault(key, _RunningStat()).add(processing_time, self.alpha)
+            if task_type == 'complete_account' and video_count:
+                per_video = processing_time / video_count
+                for key in (('per_video', platform), ('per_video',)):
+                    self._stats.setdefault(key, _RunningStat()).add(per_video, self.alpha)
+
+    def record_task(self, task: Dict[str, Any]):
+        """按已完成的任务记录计入耗时（与任务完成时的record调用一致）"""
+        video_count = None
+        partial = False
+        if task['type'] == 'complete_account':
+            video_count = task.get('videos_processed')
+            total = (task.get('progress') or {}).get('total')
+            partial = bool(video_count is not None and total and video_count < total)
+        self.record(
+            task['type'],
+            task_variant(task),
+            task.get('processing_time'),
+            platform=task.get('platform'),
+            duration=(task.get('artifact') or {}).get('duration'),
+            video_count=video_count,
+            partial=partial
+        )
+
+    async def seed(self, store: TaskStore) -> int:
+        """按创建时间顺序用已完成任务重建统计，返回计入的任务数"""
+        seeded = 0
+        async for batch in store.scan(status='completed'):
+            for task in batch:
+                if task.get('processing_time'):
+                    self.record_task(task)
+                    seeded += 1
+        return seeded
+
+    def _lookup(self, keys) -> Optional[_RunningStat]:
+        """返回第一个样本数足够的统计，否则返回样本最多的一个"""
+        best = None
+        for key in keys:
+            stat = self._stats.get(key)
+            if stat is None:
+                continue
+            if stat.count >= self.min_samples:
+                return stat
+            if best is None or stat.count > best.count:
+                best = stat
+        return best
+
+    def _confidence(self, stat: Optional[_RunningStat]) -> float:
+        """按样本量与离散程度计算置信度（0~1）"""
+        if stat is None or stat.count == 0:
+            return 0.1
+        sample_factor = stat.count / (stat.count + self.min_samples)
+        cv = math.sqrt(stat.var) / stat.mean if stat.mean > 0 else 1.0
+        return round(max(0.1, sample_factor / (1.0 + cv)), 2)
+
+    def estimate_processing(
+        self,
+        task_type: str,
+        variant: str,
+        platform: Optional[str] = None,
+        duration: Optional[float] = None,
+        video_limit: Optional[int] = None
+    ) -> Tuple[float, float]:
+        """预估纯处理耗时，返回(秒, 置信度)"""
+        variant = normalize_variant(task_type, variant)
+        with self._lock:
+            stat = self._lookup(self._keys(task_type, variant, platform, duration_bucket(duration)))
+            if stat is not None:
+                processing = stat.mean
+            else:
+                processing = DEFAULT_ESTIMATES.get((task_type, variant), DEFAULT_ESTIMATES[('single_video', 'standard')])
+            confidence = self._confidence(stat)
+
+            if task_type == 'complete_account' and video_limit:
+                per_video_stat = self._lookup((('per_video', platform), ('per_video',)))
+                per_video = per_video_stat.mean if per_video_stat else DEFAULT_PER_VIDEO_TIME
+                if per_video * video_limit < processing:
+                    processing = per_video * video_limit
+                    confidence = self._confidence(per_video_stat)
+
+        return processing, confidence
+
+    def estimate(
+        self,
+        task_type: str,
+        variant: str,
+        job_class: str,
+        platform: Optional[str] = None,
+        duration: Optional[float] = None,
+        video_limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """预估完成时间：排队等待 + 处理耗时"""
+        processing, confidence = self.estimate_processing(
+            task_type, variant, platform, duration, video_limit
+        )
+        queue_wait = task_scheduler.estimate_queue_wait(job_class, processing)
+        return {
+            'processing_time': int(math.ceil(processing)),
+            'queue_wait': int(math.ceil(queue_wait)),
+            'estimated_time': int(math.ceil(processing + queue_wait)),
+            'confidence': confidence
+        }
+
+
+# 全局预估器实例
+time_estimator = CompletionTimeEstimator(
+    alpha=float(os.getenv('ESTIMATOR_ALPHA', '0.2')),
+    min_samples=int(os.getenv('ESTIMATOR_MIN_SAMPLES', '5'))
+)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 转录分段存储
+转录分段按列存储（开始时间/结束时间/文本三列，按开始时间排序），
+查询时间窗口时用二分查找定位，只返回与窗口重叠的分段
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+
+class TranscriptSegments:
+    """
+    数组存储的转录分段
+
+    starts 有序；max_ends[i] 为前 i+1 个分段结束时间的最大值（单调不减），
+    用于在分段互相重叠时也能二分定位第一个可能与窗口重叠的分段
+    """
+
+    __slots__ = ('starts', 'ends', 'max_ends', 'texts')
+
+    def __init__(self, starts: Iterable[float], ends: Iterable[float], texts: Iterable[str]):
+        self.starts = array('d', starts)
+        self.ends = array('d', ends)
+        self.texts: List[str] = list(texts)
+        if not len(self.starts) == len(self.ends) == len(self.texts):
+            raise ValueError("转录分段各列长度不一致")
+        self.max_ends = array('d')
+        current = float('-inf')
+        for end in self.ends:
+            current = max(current, end)
+            self.max_ends.append(current)
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Dict[str, Any]]) -> 'TranscriptSegments':
+        """从 [{start, end, text}] 列表构建（按开始时间稳定排序）"""
+        ordered = sorted(segments, key=lambda segment: segment['start'])
+        return cls(
+            (float(segment['start']) for segment in ordered),
+            (float(segment['end']) for segment in ordered),
+            (segment.get('text', '') for segment in ordered)
+        )
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, List[Any]]) -> 'TranscriptSegments':
+        """从结果中保存的列式结构还原"""
+        return cls(columns['start'], columns['end'], columns['text'])
+
+    def to_columns(self) -> Dict[str, List[Any]]:
+        """转换为可JSON序列化的列式结构"""
+        return {'start': self.starts.tolist(), 'end': self.ends.tolist(), 'text': list(self.texts)}
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def overlapping(self, start: float, end: float) -> List[Dict[str, Any]]:
+        """返回与 [start, end) 重叠的分段（按开始时间排序）"""
+        # 开始时间早于窗口结束的分段
+        hi = bisect_left(self.starts, end)
+        # 之前所有分段都在窗口开始前结束的位置
+        lo = bisect_right(self.max_ends, start, 0, hi)
+        return [
+            {'start': self.starts[i], 'end': self.ends[i], 'text': self.texts[i]}
+            for i in range(lo, hi)
+            if self.ends[i] > start
+        ]
+
+
+def pack_transcript(transcript: Dict[str, Any]) -> Dict[str, Any]:
+    """把转录结果中的分段列表转换为列式结构"""
+    segments = transcript.get('segments')
+    if isinstance(segments, list):
+        transcript = {**transcript, 'segments': TranscriptSegments.from_segments(segments).to_columns()}
+    return transcript
+
+
+def load_segments(transcript: Dict[str, Any]) -> TranscriptSegments:
+    """读取转录结果中的分段（兼容旧的分段列表格式）"""
+    segments = transcript.get('segments') or []
+    if isinstance(segments, dict):
+        return TranscriptSegments.from_columns(segments)
+    return TranscriptSegments.from_segments(segments)
+
+
+class SegmentCache:
+    """按 (任务ID, 版本) 缓存还原后的分段数组（LRU淘汰）"""
+
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self._entries: "OrderedDict[Hashable, TranscriptSegments]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[TranscriptSegments]:
+        segments = self._entries.get(key)
+        if segments is not None:
+            self._entries.move_to_end(key)
+        return segments
+
+    def put(self, key: Hashable, segments: TranscriptSegments):
+        self._entries[key] = segments
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
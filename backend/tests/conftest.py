@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 测试公共配置
+与基准测试一致，把 backend 目录加入导入路径，测试按 services.* / benchmarks.* 导入
+"""
+
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 审计日志写入测试
+临时性错误按次数上限重试，数据错误逐条定位后写入死信文件，不阻塞之后的事件
+"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("httpx")
+
+import httpx
+from postgrest.exceptions import APIError
+
+from services.audit_service import AuditLogger, is_transient_error
+
+TABLE = "system_logs"
+
+
+class FakeTable:
+    """按行内容决定写入结果的数据库替身"""
+
+    def __init__(self, fail=None):
+        self.rows = []
+        self.fail = fail or (lambda rows: None)
+
+    async def insert(self, table, rows):
+        error = self.fail(rows)
+        if error is not None:
+            raise error
+        self.rows.extend(row["action"] for row in rows)
+
+
+def make_logger(tmp_path, table: FakeTable, **kwargs) -> AuditLogger:
+    audit = AuditLogger(
+        capacity=100, batch_size=10, dead_letter_path=str(tmp_path / "dead_letter.jsonl"), **kwargs
+    )
+    audit._insert = table.insert
+    return audit
+
+
+def read_dead_letters(tmp_path):
+    path = tmp_path / "dead_letter.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line)["row"]["action"] for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_transient_error_classification():
+    assert is_transient_error(httpx.ConnectError("refused"))
+    assert is_transient_error(APIError({"code": 503, "message": "unavailable"}))
+    assert is_transient_error(APIError({"code": "40001", "message": "serialization failure"}))
+    assert not is_transient_error(APIError({"code": "23502", "message": "not null violation"}))
+    assert not is_transient_error(APIError({"code": "PGRST204", "message": "column not found"}))
+    assert not is_transient_error(APIError({"code": 400, "message": "bad request"}))
+
+
+def test_rejected_rows_are_dead_lettered_without_blocking(tmp_path):
+    def fail(rows):
+        if any(row["action"] == "poison" for row in rows):
+            return APIError({"code": "23502", "message": "not null violation"})
+
+    table = FakeTable(fail)
+    audit = make_logger(tmp_path, table)
+    for action in ("a", "poison", "b"):
+        audit.log_action(action)
+
+    assert asyncio.run(audit._drain())
+
+    assert table.rows == ["a", "b"]
+    assert read_dead_letters(tmp_path) == ["poison"]
+    assert audit.pending() == 0
+
+
+def test_transient_failures_are_retried_up_to_the_limit(tmp_path):
+    table = FakeTable(lambda rows: httpx.ConnectError("refused"))
+    audit = make_logger(tmp_path, table, max_attempts=3)
+    audit.log_action("a")
+
+    for _ in range(2):
+        assert not asyncio.run(audit._drain())
+        assert audit.pending() == 1
+    assert asyncio.run(audit._drain())
+
+    assert audit.pending() == 0
+    assert read_dead_letters(tmp_path) == ["a"]
+
+
+def test_transient_failure_recovers(tmp_path):
+    failures = iter([httpx.ReadTimeout("timeout")])
+    table = FakeTable(lambda rows: next(failures, None))
+    audit = make_logger(tmp_path, table)
+    audit.log_action("a")
+
+    assert not asyncio.run(audit._drain())
+    assert asyncio.run(audit._drain())
+
+    assert table.rows == ["a"]
+    assert read_dead_letters(tmp_path) == []
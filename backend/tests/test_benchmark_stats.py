@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 基准测试统计测试
+分位数按最近秩法取值：第 ceil(p/100*n) 个样本
+"""
+
+import pytest
+
+pytest.importorskip("click")
+
+from benchmarks.run_benchmarks import percentile
+
+
+@pytest.mark.parametrize(
+    "pct, expected",
+    [(0, 1), (7, 7), (50, 50), (51, 51), (90, 90), (95, 95), (99, 99), (99.5, 100), (100, 100)],
+)
+def test_percentile_is_nearest_rank(pct, expected):
+    assert percentile(list(range(1, 101)), pct) == expected
+
+
+def test_percentile_of_small_samples():
+    samples = [5.0, 1.0, 3.0, 2.0, 4.0]
+
+    assert percentile(samples, 50) == 3.0
+    assert percentile(samples, 90) == 5.0
+    assert percentile([], 50) == 0.0
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 已验证令牌缓存测试
+缓存过期时间不晚于令牌exp、容量上限按LRU淘汰、按令牌/按用户吊销对共享同一状态后端的所有worker生效，
+未命中时不读取吊销记录
+"""
+
+import asyncio
+import time
+
+import jwt
+import pytest
+
+from middleware.claims_cache import EXPIRY_SKEW, VerifiedClaimsCache, token_key
+from services.state_backend import MemoryTaskStore
+
+
+class CountingStore(MemoryTaskStore):
+    def __init__(self):
+        super().__init__()
+        self.revocation_reads = 0
+
+    async def get_revocations(self, keys):
+        self.revocation_reads += 1
+        return await super().get_revocations(keys)
+
+
+def make_token(user_id: str = "user-1", expires_in: float = 3600) -> str:
+    return jwt.encode({"sub": user_id, "exp": int(time.time() + expires_in)}, "claims-cache-test-secret-0123456789abcdef", algorithm="HS256")
+
+
+def cached(cache: VerifiedClaimsCache, token: str, user_id: str = "user-1") -> str:
+    key = token_key(token)
+    cache.put(key, token, {"id": user_id})
+    return key
+
+
+def test_hit_and_miss():
+    store = CountingStore()
+    cache = VerifiedClaimsCache(store=store)
+    key = cached(cache, make_token())
+
+    assert asyncio.run(cache.lookup(key)) == ({"id": "user-1"}, False)
+    assert asyncio.run(cache.lookup("missing")) == (None, False)
+    # 未命中时不读取吊销记录
+    assert store.revocation_reads == 1
+
+
+def test_expiry_is_capped_by_token_exp():
+    cache = VerifiedClaimsCache(ttl=300, store=MemoryTaskStore())
+    key = cached(cache, make_token(expires_in=60))
+    cached(cache, make_token(expires_in=EXPIRY_SKEW - 1), user_id="user-2")
+
+    assert cache._entries[key].expires_at <= time.time() + 60 - EXPIRY_SKEW
+    assert len(cache) == 1
+
+
+def test_capacity_evicts_least_recently_used():
+    cache = VerifiedClaimsCache(capacity=2, store=MemoryTaskStore())
+    first = cached(cache, make_token("user-1"), "user-1")
+    second = cached(cache, make_token("user-2"), "user-2")
+    asyncio.run(cache.lookup(first))
+    cached(cache, make_token("user-3"), "user-3")
+
+    assert first in cache._entries
+    assert second not in cache._entries
+
+
+def test_token_revocation_reaches_other_workers():
+    store = MemoryTaskStore()
+    worker_a = VerifiedClaimsCache(store=store)
+    worker_b = VerifiedClaimsCache(store=store)
+    token = make_token()
+    key = cached(worker_a, token)
+    cached(worker_b, token)
+
+    asyncio.run(worker_a.revoke_token(token))
+
+    assert asyncio.run(worker_b.lookup(key)) == (None, True)
+    assert asyncio.run(worker_b.is_revoked(key))
+    assert len(worker_b) == 0
+
+
+def test_user_revocation_drops_entries_cached_before_it():
+    store = MemoryTaskStore()
+    worker_a = VerifiedClaimsCache(store=store)
+    worker_b = VerifiedClaimsCache(store=store)
+    key = cached(worker_b, make_token())
+
+    asyncio.run(worker_a.revoke_user("user-1"))
+
+    # 用户吊销不拒绝令牌本身，只要求重新远程校验
+    assert asyncio.run(worker_b.lookup(key)) == (None, False)
+    assert not asyncio.run(worker_b.is_revoked(key))
+
+
+def test_revocation_store_failure_falls_back_to_remote_verification():
+    class BrokenStore(MemoryTaskStore):
+        async def get_revocations(self, keys):
+            raise ConnectionError("redis down")
+
+    cache = VerifiedClaimsCache(store=BrokenStore())
+    key = cached(cache, make_token())
+
+    assert asyncio.run(cache.lookup(key)) == (None, False)
+    assert not asyncio.run(cache.is_revoked(key))
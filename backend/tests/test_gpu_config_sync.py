@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - GPU服务器配置同步测试
+diff_servers 只比较配置字段：监控维护的状态不参与比较也不被覆盖，
+新增或重新加入配置的服务器设为 online，移出配置的服务器记录 config_removed_at
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("email_validator")
+
+from models.database_models import GPUStatus
+from services.gpu_config_sync import _group_by_columns, diff_servers, parse_gpu_servers
+
+NOW = "2026-01-01T00:00:00+00:00"
+
+
+def configured(*servers):
+    return parse_gpu_servers(json.dumps(list(servers)))
+
+
+def server(server_id, **fields):
+    return {"id": server_id, "name": server_id, "host": "10.0.0.1", "username": "gpu", **fields}
+
+
+def test_config_status_is_ignored():
+    entries = configured(server("gpu-1", status="active"))
+
+    assert entries == [{**server("gpu-1"), "config_managed": True}]
+
+
+def test_new_server_is_written_online():
+    diff = diff_servers(configured(server("gpu-1")), [], now=NOW)
+
+    assert diff["changed"] == [
+        {**server("gpu-1"), "config_managed": True, "status": GPUStatus.ONLINE.value, "config_removed_at": None}
+    ]
+    assert diff["removed"] == []
+
+
+def test_monitor_status_does_not_cause_rewrite():
+    rows = [{**server("gpu-1"), "config_managed": True, "status": "offline", "gpu_count": 4, "config_removed_at": None}]
+
+    diff = diff_servers(configured(server("gpu-1")), rows, now=NOW)
+
+    assert diff["changed"] == []
+    assert diff["unchanged"] == 1
+
+
+def test_changed_config_fields_exclude_status():
+    rows = [{**server("gpu-1"), "config_managed": True, "status": "error", "config_removed_at": None}]
+
+    diff = diff_servers(configured(server("gpu-1", host="10.0.0.2")), rows, now=NOW)
+
+    assert diff["changed"] == [{**server("gpu-1", host="10.0.0.2"), "config_managed": True}]
+
+
+def test_removed_and_readded_servers():
+    rows = [
+        {**server("gpu-1"), "config_managed": True, "status": "online", "config_removed_at": None},
+        {**server("gpu-2"), "config_managed": True, "status": "offline", "config_removed_at": NOW},
+        {**server("manual"), "config_managed": False, "status": "online", "config_removed_at": None},
+    ]
+
+    diff = diff_servers(configured(server("gpu-2")), rows, now=NOW)
+
+    # 只有配置维护的记录会被标记移除，已移除的不再重复写入
+    assert diff["removed"] == ["gpu-1"]
+    assert diff["changed"][0]["status"] == GPUStatus.ONLINE.value
+    assert diff["changed"][0]["config_removed_at"] is None
+
+
+def test_upsert_rows_are_grouped_by_columns():
+    rows = [{"id": "a", "host": "x"}, {"id": "b", "host": "y", "status": "online"}, {"id": "c", "host": "z"}]
+
+    groups = _group_by_columns(rows)
+
+    assert sorted(len(group) for group in groups) == [1, 2]
+    assert all(len({tuple(sorted(row)) for row in group}) == 1 for group in groups)
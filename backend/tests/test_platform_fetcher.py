@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 平台请求调度测试
+用本地视频平台替身服务驱动 PlatformFetcher：限流时遵循Retry-After、重试次数耗尽后停止、
+多个并发的账号任务共用同一个令牌桶
+"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from benchmarks.stand_ins import FakePlatformServer
+from services.platform_fetcher import PlatformFetcher, PlatformRequestError
+from services.state_backend import MemoryTaskStore
+
+PLATFORM = "douyin"
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def start(**kwargs) -> FakePlatformServer:
+        server = FakePlatformServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def make_fetcher(server: FakePlatformServer, **kwargs) -> PlatformFetcher:
+    options = {
+        "api_urls": {PLATFORM: server.url(PLATFORM)},
+        "default_rate": 0,
+        "store": MemoryTaskStore(),
+        "timeout": 5
+    }
+    options.update(kwargs)
+    return PlatformFetcher(**options)
+
+
+def video_url(server: FakePlatformServer, index: int) -> str:
+    return f"{server.url(PLATFORM)}/videos/{PLATFORM}_test_{index}"
+
+
+def test_throttled_request_waits_for_retry_after(make_server):
+    # 每秒补充2个令牌、桶容量1：第二个请求被限流，Retry-After约0.5秒
+    server = make_server(rate=2.0, burst=1.0)
+    # 退避基数很大：如果忽略Retry-After而按指数退避，重试至少要等15秒
+    fetcher = make_fetcher(server, max_retries=3, backoff_base=30.0, backoff_max=60.0)
+
+    async def scenario():
+        await fetcher.get_json(PLATFORM, video_url(server, 1))
+        start = time.perf_counter()
+        video = await fetcher.get_json(PLATFORM, video_url(server, 2))
+        return video, time.perf_counter() - start
+
+    try:
+        video, elapsed = asyncio.run(scenario())
+    finally:
+        fetcher.close()
+
+    assert video["video_id"] == f"{PLATFORM}_test_2"
+    assert server.throttled_count >= 1
+    assert 0.3 <= elapsed < 5.0
+
+
+def test_retries_stop_after_max_retries(make_server):
+    # 令牌几乎不补充：第一个请求之后的所有请求都被限流
+    server = make_server(rate=0.001, burst=1.0)
+    fetcher = make_fetcher(server, max_retries=2, backoff_base=0.01, backoff_max=0.01)
+
+    async def scenario():
+        await fetcher.get_json(PLATFORM, video_url(server, 1))
+        await fetcher.get_json(PLATFORM, video_url(server, 2))
+
+    try:
+        with pytest.raises(PlatformRequestError) as raised:
+            asyncio.run(scenario())
+    finally:
+        fetcher.close()
+
+    assert raised.value.status_code == 429
+    # 第一个请求 + 第二个请求的首次尝试和2次重试
+    assert server.request_count == 4
+    assert server.throttled_count == 3
+
+
+def test_concurrent_account_tasks_share_token_bucket(make_server):
+    server = make_server(rate=1000.0, burst=1000.0)
+    store = MemoryTaskStore()
+    # 两个调度器共用同一个状态后端，相当于两个worker上的账号任务
+    fetchers = [make_fetcher(server, default_rate=20.0, burst=2.0, store=store) for _ in range(2)]
+    requests_per_task = 3
+
+    async def account_task(fetcher: PlatformFetcher, task_index: int):
+        for index in range(requests_per_task):
+            await fetcher.get_json(PLATFORM, video_url(server, task_index * requests_per_task + index))
+
+    async def scenario():
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            account_task(fetchers[task_index % 2], task_index)
+            for task_index in range(4)
+        ))
+        elapsed = time.perf_counter() - start
+        # 请求结束后令牌桶已被取空，立即再取需要等待
+        wait = await store.take_tokens(f"platform:{PLATFORM}", 20.0, 2.0)
+        return elapsed, wait
+
+    try:
+        elapsed, wait = asyncio.run(scenario())
+    finally:
+        for fetcher in fetchers:
+            fetcher.close()
+
+    # 12个请求、桶容量2、每秒20个：共用额度时至少需要 (12 - 2) / 20 = 0.5 秒
+    assert server.request_count == 12
+    assert server.throttled_count == 0
+    assert elapsed >= 0.45
+    assert wait > 0
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 预取产物清理测试
+过期产物删除、超过大小上限时按最近使用时间淘汰、任务删除时删除其产物，
+正在下载（持有产物锁）的产物不会被清理
+"""
+
+import json
+import os
+import time
+
+from services.prefetch_service import MARKER_NAME, VideoPrefetcher
+
+
+def make_artifact(prefetcher: VideoPrefetcher, video_id: str, size: int, age: float) -> str:
+    directory = prefetcher.artifact_dir(video_id)
+    os.makedirs(directory)
+    with open(os.path.join(directory, "video.mp4"), "wb") as f:
+        f.write(b"\0" * size)
+    marker = os.path.join(directory, MARKER_NAME)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"video_id": video_id}, f)
+    used_at = time.time() - age
+    os.utime(marker, (used_at, used_at))
+    return directory
+
+
+def make_prefetcher(tmp_path, **kwargs) -> VideoPrefetcher:
+    options = {"cache_ttl": 3600, "cache_max_bytes": 10_000, "cache_min_age": 60}
+    options.update(kwargs)
+    return VideoPrefetcher(root=str(tmp_path / "videos"), **options)
+
+
+def test_sweep_removes_expired_artifacts(tmp_path):
+    prefetcher = make_prefetcher(tmp_path)
+    expired = make_artifact(prefetcher, "douyin:1", 100, age=7200)
+    fresh = make_artifact(prefetcher, "douyin:2", 100, age=10)
+
+    stats = prefetcher.sweep()
+
+    assert stats["expired"] == 1
+    assert not os.path.exists(expired)
+    assert os.path.exists(fresh)
+
+
+def test_sweep_evicts_least_recently_used_over_budget(tmp_path):
+    prefetcher = make_prefetcher(tmp_path, cache_max_bytes=2_500)
+    oldest = make_artifact(prefetcher, "douyin:1", 1_000, age=600)
+    older = make_artifact(prefetcher, "douyin:2", 1_000, age=300)
+    recent = make_artifact(prefetcher, "douyin:3", 1_000, age=30)
+
+    stats = prefetcher.sweep()
+
+    assert stats["evicted"] == 1
+    assert not os.path.exists(oldest)
+    assert os.path.exists(older) and os.path.exists(recent)
+
+
+def test_recently_used_artifacts_are_kept_over_budget(tmp_path):
+    prefetcher = make_prefetcher(tmp_path, cache_max_bytes=500)
+    recent = make_artifact(prefetcher, "douyin:1", 1_000, age=30)
+
+    assert prefetcher.sweep()["evicted"] == 0
+    assert os.path.exists(recent)
+
+
+def test_locked_artifacts_are_skipped(tmp_path):
+    prefetcher = make_prefetcher(tmp_path)
+    directory = make_artifact(prefetcher, "douyin:1", 100, age=7200)
+    lock = prefetcher._try_lock("douyin:1")
+    try:
+        assert prefetcher.sweep()["expired"] == 0
+        assert os.path.exists(directory)
+    finally:
+        lock.close()
+
+    assert prefetcher.sweep()["expired"] == 1
+
+
+def test_remove_artifacts_of_deleted_tasks(tmp_path):
+    prefetcher = make_prefetcher(tmp_path)
+    idle = make_artifact(prefetcher, "douyin:1", 100, age=600)
+    in_use = make_artifact(prefetcher, "douyin:2", 100, age=10)
+
+    removed = prefetcher.remove_artifacts(["douyin:1", "douyin:2", "douyin:missing"])
+
+    assert removed == 1
+    assert not os.path.exists(idle)
+    assert os.path.exists(in_use)
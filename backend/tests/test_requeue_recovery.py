@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 关闭与重新入队任务接管测试
+共享状态后端中，关闭的实例把未完成任务标记为requeued，
+其他实例通过比较并更新抢占，每个任务只被接管一次；关闭中的实例不再接管，
+提交过程中开始关闭时返回503与Retry-After
+"""
+
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test")
+
+from benchmarks.stand_ins import install_missing_modules
+
+install_missing_modules()
+
+import api.intelligent_analysis_api as analysis_api
+from services.state_backend import MemoryTaskStore
+from services.task_scheduler import TaskScheduler
+
+
+@pytest.fixture
+def instance(monkeypatch):
+    store = MemoryTaskStore()
+    store.shared = True
+    scheduler = TaskScheduler(gpu_loads=store)
+    submitted = []
+    monkeypatch.setattr(analysis_api, "task_store", store)
+    monkeypatch.setattr(analysis_api, "task_scheduler", scheduler)
+    monkeypatch.setattr(
+        analysis_api, "_submit_task", lambda task_id, task_data, estimated_time, gpu_ids: submitted.append(task_id)
+    )
+    return store, scheduler, submitted
+
+
+def make_task(task_id: str) -> dict:
+    return {
+        "task_id": task_id,
+        "user_id": "user-1",
+        "type": "single_video",
+        "status": "pending",
+        "analysis_type": "quick",
+        "platform": "douyin",
+        "gpu_id": "gpu-1",
+        "created_at": datetime.utcnow(),
+    }
+
+
+def test_requeued_tasks_are_claimed_once(instance):
+    store, _, submitted = instance
+
+    async def run():
+        for task_id in ("a", "b"):
+            await store.create(make_task(task_id))
+        await analysis_api._requeue_on_drain(["a"], ["b"])
+        assert {task["status"] for task in store._tasks.values()} == {"requeued"}
+        await analysis_api._recover_requeued_tasks()
+        await analysis_api._recover_requeued_tasks()
+
+    asyncio.run(run())
+
+    assert sorted(submitted) == ["a", "b"]
+    assert {task["status"] for task in store._tasks.values()} == {"pending"}
+
+
+def test_draining_instance_does_not_claim(instance):
+    store, scheduler, submitted = instance
+    scheduler.accepting = False
+
+    async def run():
+        await store.create({**make_task("a"), "status": "requeued"})
+        await analysis_api._recover_requeued_tasks()
+
+    asyncio.run(run())
+
+    assert submitted == []
+    assert store._tasks["a"]["status"] == "requeued"
+
+
+class DrainingScheduler(TaskScheduler):
+    """选择GPU之后开始关闭，模拟通过入口检查后、提交前收到关闭信号"""
+
+    async def select_gpus(self, candidates, count=1):
+        selected = await super().select_gpus(candidates, count)
+        self.accepting = False
+        return selected
+
+
+def test_submit_during_drain_returns_503(monkeypatch):
+    store = MemoryTaskStore()
+    monkeypatch.setattr(analysis_api, "task_store", store)
+    monkeypatch.setattr(analysis_api, "task_scheduler", DrainingScheduler(gpu_loads=store))
+    request = analysis_api.VideoAnalysisRequest(video_url="https://www.douyin.com/video/123", platform="douyin")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(analysis_api.analyze_single_video(request, current_user={"id": "user-1"}))
+
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == str(analysis_api.DRAINING_RETRY_AFTER)
+    assert len(store) == 0
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 任务保留策略测试
+按状态和类型的保留时长清理过期任务，管理员批量删除的条件与数量限制
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.retention_service import RetentionPolicy, RetentionService
+from services.state_backend import MemoryTaskStore
+
+
+def make_task(index: int, status: str = "completed", task_type: str = "single_video", age_days: float = 10) -> dict:
+    created_at = datetime.utcnow() - timedelta(days=age_days, seconds=index)
+    return {
+        "task_id": f"task-{index}",
+        "user_id": "user-1",
+        "type": task_type,
+        "status": status,
+        "created_at": created_at,
+        "completed_at": created_at if status in ("completed", "failed") else None,
+    }
+
+
+def make_service(tasks) -> RetentionService:
+    store = MemoryTaskStore()
+    for task in tasks:
+        asyncio.run(store.create(task))
+    return RetentionService(RetentionPolicy("completed=7d,failed=3d"), store=store, interval=0, batch_size=3)
+
+
+def test_sweep_evicts_only_expired_tasks():
+    service = make_service(
+        [make_task(0), make_task(1, age_days=1), make_task(2, status="failed", age_days=4), make_task(3, status="processing")]
+    )
+
+    evicted = asyncio.run(service.sweep())
+
+    assert evicted == {"completed": 1, "failed": 1}
+    assert len(service.store) == 2
+
+
+def test_delete_matching_respects_limit():
+    service = make_service([make_task(index) for index in range(10)])
+
+    deleted = asyncio.run(service.delete_matching(status="completed", limit=4))
+
+    assert deleted == 4
+    assert len(service.store) == 6
+
+
+@pytest.mark.parametrize("limit", [0, -3])
+def test_delete_matching_rejects_non_positive_limit(limit):
+    service = make_service([make_task(index) for index in range(10)])
+
+    with pytest.raises(ValueError):
+        asyncio.run(service.delete_matching(status="completed", limit=limit))
+    assert len(service.store) == 10
+
+
+class RequeueingArchive:
+    """归档期间把第一个任务重新放回队列，模拟扫描与删除之间任务被重新执行"""
+
+    name = "requeueing"
+
+    def __init__(self, store):
+        self.store = store
+
+    async def write(self, tasks):
+        await self.store.update(tasks[0]["task_id"], {"status": "pending"})
+
+
+def test_delete_matching_skips_tasks_whose_status_changed():
+    service = make_service([make_task(index) for index in range(3)])
+    service.archive = RequeueingArchive(service.store)
+
+    deleted = asyncio.run(service.delete_matching(status="completed", archive=True))
+
+    assert deleted == 2
+    remaining = asyncio.run(service.store.get("task-2"))
+    assert remaining["status"] == "pending"
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 搜索索引测试
+多个索引实例（相当于多个worker）共用同一个日志文件时，并发追加后各实例都能看到全部文档；
+历史任务补写标记在重放和压缩后保留
+"""
+
+import threading
+from datetime import datetime
+
+from services.search_index import SearchIndex
+
+
+def make_task(index: int, user_id: str = "user-1") -> dict:
+    return {
+        "task_id": f"t{index}",
+        "user_id": user_id,
+        "type": "single_video",
+        "platform": "douyin",
+        "created_at": datetime(2024, 1, 1, 0, 0, index % 60),
+        "result": {
+            "video_info": {"title": f"视频{index}"},
+            "analysis": {"keywords": ["AI"], "topics": ["科技"], "summary": "机器学习入门"},
+            "transcript": {"text": "深度学习"}
+        }
+    }
+
+
+def test_concurrent_appends_from_two_instances(tmp_path):
+    path = str(tmp_path / "index.log")
+    workers = [SearchIndex(path), SearchIndex(path)]
+    per_worker = 50
+
+    def add(worker: SearchIndex, start: int):
+        for index in range(start, start + per_worker):
+            worker.add_task(make_task(index))
+
+    threads = [threading.Thread(target=add, args=(worker, n * per_worker)) for n, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = {f"t{index}" for index in range(2 * per_worker)}
+    for worker in workers:
+        worker.refresh()
+        assert set(worker._ids) == expected
+    # 新启动的worker重放日志得到同样的文档
+    fresh = SearchIndex(path)
+    fresh.ensure_loaded()
+    assert set(fresh._ids) == expected
+
+
+def test_append_racing_with_another_instance(tmp_path):
+    path = str(tmp_path / "index.log")
+    first, second = SearchIndex(path), SearchIndex(path)
+    first.add_task(make_task(0))
+    second.refresh()
+
+    # 在first追上变更之后、写入之前，让second尝试追加（持有排他锁时second必须等待）
+    original_catch_up = first._catch_up
+    racer = threading.Thread(target=second.add_task, args=(make_task(1),))
+
+    def catch_up_then_race():
+        original_catch_up()
+        if not racer.is_alive() and racer.ident is None:
+            racer.start()
+            racer.join(0.2)
+
+    first._catch_up = catch_up_then_race
+    first.add_task(make_task(2))
+    racer.join()
+    first._catch_up = original_catch_up
+
+    for worker in (first, second):
+        worker.refresh()
+        assert set(worker._ids) == {"t0", "t1", "t2"}
+
+
+def test_remove_is_seen_by_other_instance(tmp_path):
+    path = str(tmp_path / "index.log")
+    first, second = SearchIndex(path), SearchIndex(path)
+    first.add_tasks([make_task(1), make_task(2)])
+    second.remove_tasks(["t1"])
+
+    results, total = first.search(query="机器学习")
+    assert total == 1
+    assert results[0]["task_id"] == "t2"
+
+
+def test_backfill_marker_survives_replay_and_compaction(tmp_path):
+    path = str(tmp_path / "index.log")
+    index = SearchIndex(path)
+    index.add_tasks([make_task(1)])
+    assert not index.backfilled
+
+    # 已索引的任务在补写时跳过，不重复写日志
+    index.add_tasks([make_task(1), make_task(2)], skip_indexed=True)
+    index.mark_backfilled()
+    assert index._log_entries == 3
+
+    replayed = SearchIndex(path)
+    replayed.ensure_loaded()
+    assert replayed.backfilled
+    assert len(replayed) == 2
+
+    replayed.compact()
+    compacted = SearchIndex(path)
+    compacted.ensure_loaded()
+    assert compacted.backfilled
+    assert len(compacted) == 2
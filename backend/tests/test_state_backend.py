@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 任务存储测试
+同一组用例分别运行在进程内存储与Redis存储上（未安装redis或连不上 TEST_REDIS_URL 时跳过Redis），
+覆盖比较并更新、按状态批量删除、遍历、计数、GPU预留快照过期、吊销与互斥锁
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.state_backend import MemoryTaskStore
+
+REDIS_URL = os.getenv("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+
+def _redis_store(loop):
+    from services.state_backend import RedisTaskStore
+
+    store = RedisTaskStore(REDIS_URL)
+
+    async def connect():
+        await store.client.ping()
+        await store.clear()
+
+    try:
+        loop.run_until_complete(connect())
+    except Exception as e:
+        loop.close()
+        pytest.skip(f"Redis不可用: {e}")
+    return store
+
+
+@pytest.fixture(params=["memory", "redis"])
+def run(request):
+    """返回在同一个事件循环中执行协程的函数（Redis连接绑定事件循环）"""
+    if request.param == "redis":
+        pytest.importorskip("redis")
+    loop = asyncio.new_event_loop()
+    store = _redis_store(loop) if request.param == "redis" else MemoryTaskStore()
+
+    def execute(factory):
+        return loop.run_until_complete(factory(store))
+
+    yield execute
+    execute(lambda store: store.clear())
+    loop.close()
+
+
+def make_task(index: int, status: str = "pending", user_id: str = "user-1", task_type: str = "single_video") -> dict:
+    return {
+        "task_id": f"task-{index}",
+        "user_id": user_id,
+        "type": task_type,
+        "status": status,
+        "created_at": datetime(2026, 1, 1) + timedelta(minutes=index),
+    }
+
+
+def test_update_with_expected_status(run):
+    async def scenario(store):
+        await store.create(make_task(0))
+        claimed = await store.update("task-0", {"status": "processing"}, expected_status="pending")
+        rejected = await store.update("task-0", {"status": "processing"}, expected_status="pending")
+        missing = await store.update("task-x", {"status": "processing"})
+        return claimed, rejected, missing, await store.get("task-0")
+
+    claimed, rejected, missing, task = run(scenario)
+
+    assert claimed["status"] == "processing"
+    assert rejected is None and missing is None
+    assert task["status"] == "processing"
+    assert task["version"] == 1
+
+
+def test_delete_many_checks_status_at_delete_time(run):
+    async def scenario(store):
+        for index in range(3):
+            await store.create(make_task(index, status="completed"))
+        await store.update("task-1", {"status": "pending"})
+        deleted = await store.delete_many(["task-0", "task-1", "task-2", "task-x"], statuses={"completed"})
+        return deleted, await store.count_by_state()
+
+    deleted, counts = run(scenario)
+
+    assert sorted(task["task_id"] for task in deleted) == ["task-0", "task-2"]
+    assert counts == {("single_video", "pending"): 1}
+
+
+def test_scan_filters_and_orders_by_creation(run):
+    async def scenario(store):
+        for index in (3, 1, 4, 0, 2):
+            await store.create(make_task(index, status="completed" if index % 2 else "failed", user_id=f"user-{index % 2}"))
+        by_status = [task["task_id"] async for batch in store.scan(status="completed", batch_size=1) for task in batch]
+        by_user = [task["task_id"] async for batch in store.scan(user_id="user-0") for task in batch]
+        before = [
+            task["task_id"]
+            async for batch in store.scan(created_before=datetime(2026, 1, 1, 0, 2))
+            for task in batch
+        ]
+        return by_status, by_user, before
+
+    by_status, by_user, before = run(scenario)
+
+    assert by_status == ["task-1", "task-3"]
+    assert by_user == ["task-0", "task-2", "task-4"]
+    assert before == ["task-0", "task-1"]
+
+
+def test_list_and_count_by_state(run):
+    async def scenario(store):
+        for index in range(4):
+            await store.create(make_task(index, task_type="complete_account" if index == 3 else "single_video"))
+        await store.update("task-0", {"status": "completed"})
+        page, total = await store.list_user("user-1", 0, 2)
+        return [task["task_id"] for task in page], total, await store.count_by_state()
+
+    page, total, counts = run(scenario)
+
+    assert page == ["task-3", "task-2"]
+    assert total == 4
+    assert counts == {
+        ("single_video", "completed"): 1,
+        ("single_video", "pending"): 2,
+        ("complete_account", "pending"): 1,
+    }
+
+
+def test_gpu_load_snapshots_expire(run):
+    async def scenario(store):
+        await store.publish_gpu_load("worker-a", {"gpu-1": 30.0}, ttl=1)
+        await store.publish_gpu_load("worker-b", {"gpu-1": 10.0, "gpu-2": 5.0}, ttl=60)
+        combined = await store.get_gpu_load(["gpu-1", "gpu-2"])
+        others = await store.get_gpu_load(["gpu-1", "gpu-2"], exclude_worker="worker-b")
+        await asyncio.sleep(1.2)
+        expired = await store.get_gpu_load(["gpu-1", "gpu-2"])
+        await store.publish_gpu_load("worker-b", {}, ttl=60)
+        released = await store.get_gpu_load(["gpu-1"])
+        return combined, others, expired, released
+
+    combined, others, expired, released = run(scenario)
+
+    assert combined == {"gpu-1": 40.0, "gpu-2": 5.0}
+    assert others == {"gpu-1": 30.0, "gpu-2": 0.0}
+    assert expired == {"gpu-1": 10.0, "gpu-2": 5.0}
+    assert released == {"gpu-1": 0.0}
+
+
+def test_revocations_and_locks(run):
+    async def scenario(store):
+        revoked_at = time.time()
+        await store.add_revocation("session-1", revoked_at, ttl=60)
+        revocations = await store.get_revocations(["session-1", "session-2"])
+        first = await store.acquire_lock("sweep", 60)
+        second = await store.acquire_lock("sweep", 60)
+        return revoked_at, revocations, first, second
+
+    revoked_at, revocations, first, second = run(scenario)
+
+    assert revocations == {"session-1": pytest.approx(revoked_at)}
+    assert first and not second
+
+
+def test_checkpoints_are_removed_with_the_task(run):
+    async def scenario(store):
+        await store.create(make_task(0))
+        await store.save_checkpoint("task-0", {"videos": ["a", "b"]})
+        await store.save_checkpoint("task-0", {"video:a": {"title": "a"}})
+        saved = await store.load_checkpoint("task-0")
+        await store.delete("task-0")
+        return saved, await store.load_checkpoint("task-0")
+
+    saved, after_delete = run(scenario)
+
+    assert saved == {"videos": ["a", "b"], "video:a": {"title": "a"}}
+    assert after_delete == {}
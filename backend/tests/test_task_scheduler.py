@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 任务调度器测试
+短作业优先与等待老化、quick预留槽位、账号任务并发上限、准备阶段修正预估、
+优雅关闭时的重新入队与中断，以及GPU预留负载的发布与选择
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from services.state_backend import MemoryTaskStore
+from services.task_scheduler import SchedulerDrainingError, TaskScheduler
+
+
+def make_scheduler(**kwargs) -> TaskScheduler:
+    options = {"max_concurrency": 1, "reserved_quick_slots": 0, "gpu_loads": MemoryTaskStore()}
+    options.update(kwargs)
+    return TaskScheduler(**options)
+
+
+def recorder(order, name, gate=None):
+    async def run():
+        order.append(name)
+        if gate is not None:
+            await gate.wait()
+    return run
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_shortest_job_first_within_quick_class():
+    scheduler = make_scheduler()
+    order = []
+
+    async def run():
+        for name, estimate in (("30s", 30), ("10s", 10), ("20s", 20)):
+            scheduler.submit(name, "quick", recorder(order, name), estimated_time=estimate)
+        await asyncio.sleep(0.05)
+        await scheduler.drain(1)
+
+    asyncio.run(run())
+
+    assert order == ["10s", "20s", "30s"]
+
+
+def test_class_weight_and_aging():
+    order = []
+    scheduler = make_scheduler(aging_rate=1.0)
+
+    async def run():
+        scheduler.submit("deep", "deep", recorder(order, "deep"), estimated_time=300)
+        scheduler.submit("quick", "quick", recorder(order, "quick"), estimated_time=30)
+        await asyncio.sleep(0.05)
+        # 等待足够久的deep任务调度分低于新提交的quick任务
+        scheduler.submit("aged", "deep", recorder(order, "aged"), estimated_time=300)
+        scheduler.submit("fresh", "quick", recorder(order, "fresh"), estimated_time=30)
+        scheduler._queues["deep"][0].enqueued_at = time.monotonic() - 1000
+        await asyncio.sleep(0.05)
+        await scheduler.drain(1)
+
+    asyncio.run(run())
+
+    assert order[:2] == ["quick", "deep"]
+    assert order[2:] == ["aged", "fresh"]
+
+
+def run_until_blocked(scheduler: TaskScheduler, jobs) -> dict:
+    """提交一组阻塞的任务，返回各类别正在运行的任务数"""
+    async def run():
+        release = asyncio.Event()
+        for task_id, job_class in jobs:
+            scheduler.submit(task_id, job_class, recorder([], task_id, release), estimated_time=10)
+        await settle()
+        running = scheduler.get_stats()["running"]
+        release.set()
+        await scheduler.drain(1)
+        return running
+
+    return asyncio.run(run())
+
+
+def test_reserved_quick_slots():
+    scheduler = make_scheduler(max_concurrency=4, reserved_quick_slots=1)
+    jobs = [(f"standard-{index}", "standard") for index in range(4)] + [("quick", "quick")]
+
+    running = run_until_blocked(scheduler, jobs)
+
+    # 4个槽位中1个预留给quick，非quick任务最多占用3个
+    assert running == {"quick": 1, "standard": 3, "deep": 0, "account": 0}
+
+
+def test_account_concurrency_cap():
+    scheduler = make_scheduler(max_concurrency=4, max_account_concurrency=1)
+    jobs = [(f"account-{index}", "account") for index in range(3)] + [("deep", "deep")]
+
+    running = run_until_blocked(scheduler, jobs)
+
+    assert running == {"quick": 0, "standard": 0, "deep": 1, "account": 1}
+
+
+def test_prepare_revises_estimate():
+    scheduler = make_scheduler()
+
+    async def prepare():
+        return 5.0
+
+    async def run():
+        scheduler.submit("a", "quick", recorder([], "a", asyncio.Event()), estimated_time=30, gpu_ids=["gpu-1"])
+        scheduler.submit("b", "quick", recorder([], "b"), estimated_time=30, gpu_ids=["gpu-1"], prepare=prepare)
+        await settle()
+        queued = scheduler._queues["quick"][0]
+        load = dict(scheduler._local_gpu_load)
+        await scheduler.drain(0.01)
+        return queued, load
+
+    queued, load = asyncio.run(run())
+
+    assert queued.task_id == "b"
+    assert queued.estimated_time == 5.0
+    assert queued.sort_key[0] == 5.0
+    assert load == {"gpu-1": 35.0}
+
+
+def test_drain_requeues_queued_and_interrupts_overdue_tasks():
+    scheduler = make_scheduler()
+    handed_over = []
+
+    async def hook(queued_ids, interrupted_ids):
+        handed_over.append((queued_ids, interrupted_ids))
+
+    scheduler.add_drain_hook(hook)
+
+    async def run():
+        scheduler.submit("running", "standard", recorder([], "running", asyncio.Event()), gpu_ids=["gpu-1"])
+        scheduler.submit("queued", "standard", recorder([], "queued"), gpu_ids=["gpu-1"])
+        await settle()
+        result = await scheduler.drain(0.05)
+        with pytest.raises(SchedulerDrainingError):
+            scheduler.submit("late", "quick", recorder([], "late"))
+        return result
+
+    result = asyncio.run(run())
+
+    assert result == {"completed": 0, "requeued": 1, "interrupted": 1}
+    assert handed_over == [(["queued"], ["running"])]
+    assert scheduler._local_gpu_load == {}
+
+
+def test_select_gpus_counts_other_workers_load():
+    store = MemoryTaskStore()
+    first = make_scheduler(gpu_loads=store, gpu_load_ttl=60)
+    second = make_scheduler(gpu_loads=store, gpu_load_ttl=60)
+    candidates = [{"id": "gpu-1"}, {"id": "gpu-2"}]
+
+    async def run():
+        first.submit("a", "standard", recorder([], "a", asyncio.Event()), estimated_time=100, gpu_ids=["gpu-1"])
+        await settle()
+        selected = await second.select_gpus(candidates, 1)
+        await first.drain(0.01)
+        after_drain = await second.select_gpus(candidates, 2)
+        return selected, after_drain, await store.get_gpu_load(["gpu-1"])
+
+    selected, after_drain, loads = asyncio.run(run())
+
+    assert selected == ["gpu-2"]
+    assert after_drain == ["gpu-1", "gpu-2"]
+    # 关闭时发布最终（为空的）快照
+    assert loads == {"gpu-1": 0.0}
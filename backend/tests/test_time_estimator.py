@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 耗时预估测试
+未知分析类型归入缺省类型，统计可由状态后端中已完成任务的processing_time重建
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from services.state_backend import MemoryTaskStore
+from services.time_estimator import CompletionTimeEstimator, normalize_variant
+
+
+def make_task(index: int, task_type: str = "single_video", **fields) -> dict:
+    task = {
+        "task_id": f"task-{index}",
+        "user_id": "user-1",
+        "type": task_type,
+        "status": "completed",
+        "platform": "douyin",
+        "created_at": datetime.utcnow() - timedelta(minutes=100 - index),
+    }
+    task.update(fields)
+    return task
+
+
+def test_unknown_variants_share_the_default_stat():
+    estimator = CompletionTimeEstimator(min_samples=1)
+
+    for index in range(5):
+        estimator.record("single_video", f"free-form-{index}", 50, platform="douyin")
+
+    assert normalize_variant("single_video", "free-form") == "standard"
+    assert normalize_variant("complete_account", "deep") == "complete"
+    assert {key[1] for key in estimator._stats} == {"standard"}
+    assert estimator.estimate_processing("single_video", "standard", platform="douyin")[0] == 50
+
+
+def test_seed_from_completed_tasks():
+    store = MemoryTaskStore()
+    estimator = CompletionTimeEstimator(min_samples=1)
+
+    async def run():
+        for index in range(5):
+            await store.create(make_task(index, analysis_type="quick", processing_time=40))
+        await store.create(make_task(5, analysis_type="quick", status="failed", processing_time=400))
+        # 从检查点恢复的账号任务只计入单视频耗时
+        await store.create(make_task(
+            6, "complete_account", analysis_depth="complete", processing_time=100,
+            videos_processed=10, progress={"completed": 20, "total": 20}
+        ))
+        return await estimator.seed(store)
+
+    assert asyncio.run(run()) == 6
+    assert estimator.estimate_processing("single_video", "quick", platform="douyin")[0] == 40
+    assert ("complete_account", "complete") not in estimator._stats
+    assert estimator._stats[("per_video", "douyin")].mean == 10
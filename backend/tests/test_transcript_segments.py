@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+🦉 猫头鹰工厂 - 转录分段测试
+时间窗口查询与逐个比较的结果一致（包括互相重叠的分段），列式结构与旧分段列表格式都能读取
+"""
+
+import random
+
+import pytest
+
+from services.transcript_segments import SegmentCache, TranscriptSegments, load_segments, pack_transcript
+
+
+def brute_force(segments, start, end):
+    return [
+        {"start": float(segment["start"]), "end": float(segment["end"]), "text": segment["text"]}
+        for segment in sorted(segments, key=lambda segment: segment["start"])
+        if segment["start"] < end and segment["end"] > start
+    ]
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(7)
+    segments = []
+    for index in range(300):
+        start = rng.uniform(0, 600)
+        # 部分分段很长，与后面的多个分段重叠
+        segments.append({"start": start, "end": start + rng.choice((1, 3, 5, 120)), "text": f"s{index}"})
+    transcript = TranscriptSegments.from_segments(segments)
+
+    for _ in range(200):
+        start = rng.uniform(-10, 650)
+        end = start + rng.uniform(0, 60)
+        assert transcript.overlapping(start, end) == brute_force(segments, start, end)
+
+
+def test_window_boundaries_are_half_open():
+    transcript = TranscriptSegments.from_segments([
+        {"start": 0, "end": 10, "text": "a"},
+        {"start": 10, "end": 20, "text": "b"},
+    ])
+
+    assert [segment["text"] for segment in transcript.overlapping(10, 20)] == ["b"]
+    assert [segment["text"] for segment in transcript.overlapping(5, 10)] == ["a"]
+    assert transcript.overlapping(20, 30) == []
+
+
+def test_pack_and_load_round_trip():
+    transcript = {"text": "hello", "segments": [{"start": 2, "end": 3, "text": "b"}, {"start": 0, "end": 1, "text": "a"}]}
+
+    packed = pack_transcript(transcript)
+
+    assert packed["segments"] == {"start": [0.0, 2.0], "end": [1.0, 3.0], "text": ["a", "b"]}
+    assert packed["text"] == "hello"
+    assert load_segments(packed).to_columns() == load_segments(transcript).to_columns()
+    assert len(load_segments({})) == 0
+
+
+def test_mismatched_columns_are_rejected():
+    with pytest.raises(ValueError):
+        TranscriptSegments([0.0, 1.0], [1.0], ["a", "b"])
+
+
+def test_segment_cache_evicts_least_recently_used():
+    cache = SegmentCache(capacity=2)
+    segments = TranscriptSegments([], [], [])
+    cache.put(("a", 1), segments)
+    cache.put(("b", 1), segments)
+    cache.get(("a", 1))
+    cache.put(("c", 1), segments)
+
+    assert cache.get(("a", 1)) is segments
+    assert cache.get(("b", 1)) is None